@@ -10,15 +10,19 @@
 \c leaksense
 
 -- Create sensor_readings table
+-- Timestamps are epoch milliseconds; sensor values are scaled integers
+-- (pressure/moisture/acoustic x 100, snr x 10). Defaults replace the former
+-- per-row created_at trigger. Existing databases: flask_backend/storage_format.py migrate
 CREATE TABLE IF NOT EXISTS sensor_readings (
     id SERIAL PRIMARY KEY,
-    pressure REAL NOT NULL CHECK (pressure >= 0 AND pressure <= 200),
-    moisture REAL NOT NULL CHECK (moisture >= 0 AND moisture <= 100),
-    acoustic REAL NOT NULL CHECK (acoustic >= 0 AND acoustic <= 150),
-    rssi INTEGER CHECK (rssi >= -120 AND rssi <= 0),
-    snr REAL,
-    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    device_id VARCHAR(32) NOT NULL DEFAULT 'default',
+    pressure SMALLINT NOT NULL CONSTRAINT sensor_readings_pressure_check CHECK (pressure >= 0 AND pressure <= 20000),
+    moisture SMALLINT NOT NULL CONSTRAINT sensor_readings_moisture_check CHECK (moisture >= 0 AND moisture <= 10000),
+    acoustic SMALLINT NOT NULL CONSTRAINT sensor_readings_acoustic_check CHECK (acoustic >= 0 AND acoustic <= 15000),
+    rssi SMALLINT CONSTRAINT sensor_readings_rssi_check CHECK (rssi >= -120 AND rssi <= 0),
+    snr SMALLINT,
+    timestamp BIGINT NOT NULL DEFAULT (EXTRACT(EPOCH FROM clock_timestamp()) * 1000)::BIGINT,
+    created_at BIGINT NOT NULL DEFAULT (EXTRACT(EPOCH FROM clock_timestamp()) * 1000)::BIGINT
 );
 
 -- Create indexes for better query performance
@@ -30,10 +34,125 @@ CREATE INDEX IF NOT EXISTS idx_acoustic ON sensor_readings(acoustic);
 
 -- Create composite index for time-range queries
 CREATE INDEX IF NOT EXISTS idx_timestamp_sensors ON sensor_readings(timestamp, pressure, moisture, acoustic);
+CREATE INDEX IF NOT EXISTS idx_device_timestamp ON sensor_readings(device_id, timestamp DESC);
+
+-- Cold storage tier: aged readings sealed into compressed per-device chunks
+-- (written by flask_backend/cold_storage.py, read transparently by the API)
+CREATE TABLE IF NOT EXISTS sensor_blocks (
+    id SERIAL PRIMARY KEY,
+    device_id VARCHAR(32) NOT NULL,
+    chunk_start BIGINT NOT NULL,
+    chunk_end BIGINT NOT NULL,
+    row_count INTEGER NOT NULL,
+    aggregates TEXT NOT NULL,
+    payload BYTEA NOT NULL,
+    sealed_at BIGINT NOT NULL DEFAULT (EXTRACT(EPOCH FROM clock_timestamp()) * 1000)::BIGINT,
+    UNIQUE (device_id, chunk_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_blocks_chunk ON sensor_blocks(chunk_start, chunk_end);
+
+-- Spectral features of raw acoustic bursts (written by POST /api/acoustic/bursts)
+CREATE TABLE IF NOT EXISTS acoustic_features (
+    id SERIAL PRIMARY KEY,
+    device_id VARCHAR(32) NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    sample_rate INTEGER NOT NULL,
+    n_samples INTEGER NOT NULL,
+    rms REAL NOT NULL,
+    spectral_centroid REAL NOT NULL,
+    kurtosis REAL NOT NULL,
+    high_band_ratio REAL NOT NULL,
+    band_energies TEXT NOT NULL,
+    leak_signature BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_acoustic_device_timestamp ON acoustic_features(device_id, timestamp DESC);
+
+-- Alert events from historical re-detection (flask_backend/redetect.py)
+CREATE TABLE IF NOT EXISTS alert_events (
+    id SERIAL PRIMARY KEY,
+    rule_version VARCHAR(32) NOT NULL,
+    device_id VARCHAR(32) NOT NULL,
+    reading_timestamp TIMESTAMP NOT NULL,
+    alert_type VARCHAR(32) NOT NULL,
+    value REAL NOT NULL,
+    threshold REAL NOT NULL,
+    detected_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (rule_version, device_id, reading_timestamp, alert_type)
+);
+
+CREATE INDEX IF NOT EXISTS idx_alert_events_timestamp ON alert_events(reading_timestamp DESC);
+
+-- Per-shard progress so interrupted backfills resume where they stopped
+CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+    rule_version VARCHAR(32) NOT NULL,
+    shard_start TIMESTAMP NOT NULL,
+    shard_end TIMESTAMP NOT NULL,
+    rows_scanned INTEGER NOT NULL,
+    events_written INTEGER NOT NULL,
+    completed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (rule_version, shard_start)
+);
+
+-- Transmission mode per device, recorded by the receiver from the packets'
+-- "rbe" flag; the API reconstructs report-by-exception devices onto a regular
+-- grid (flask_backend/reconstruction.py). Kept with the device's readings.
+CREATE TABLE IF NOT EXISTS device_modes (
+    device_id VARCHAR(32) PRIMARY KEY,
+    report_by_exception BOOLEAN NOT NULL,
+    updated_at BIGINT NOT NULL               -- epoch ms
+);
+
+-- Pipe-network topology (flask_backend/topology.py): segments run in the flow
+-- direction; each node sits offset_m from the segment's upstream end. Kept on
+-- the primary, not sharded; the API indexes it in memory.
+CREATE TABLE IF NOT EXISTS pipes (
+    id VARCHAR(32) PRIMARY KEY,
+    name VARCHAR(128),
+    district VARCHAR(64),
+    material VARCHAR(32),
+    diameter_mm REAL
+);
+
+CREATE TABLE IF NOT EXISTS pipe_segments (
+    id VARCHAR(32) PRIMARY KEY,
+    pipe_id VARCHAR(32) NOT NULL REFERENCES pipes(id),
+    from_junction VARCHAR(32) NOT NULL,
+    to_junction VARCHAR(32) NOT NULL,
+    length_m REAL NOT NULL CHECK (length_m > 0),
+    start_x DOUBLE PRECISION NOT NULL,
+    start_y DOUBLE PRECISION NOT NULL,
+    end_x DOUBLE PRECISION NOT NULL,
+    end_y DOUBLE PRECISION NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS node_placements (
+    device_id VARCHAR(32) PRIMARY KEY,
+    segment_id VARCHAR(32) NOT NULL REFERENCES pipe_segments(id),
+    offset_m REAL NOT NULL CHECK (offset_m >= 0),
+    x DOUBLE PRECISION,
+    y DOUBLE PRECISION
+);
+
+-- Readings in engineering units with TIMESTAMPTZ columns, for ad-hoc queries
+CREATE OR REPLACE VIEW sensor_readings_decoded AS
+SELECT
+    id,
+    device_id,
+    (pressure / 100.0)::REAL AS pressure,
+    (moisture / 100.0)::REAL AS moisture,
+    (acoustic / 100.0)::REAL AS acoustic,
+    rssi,
+    (snr / 10.0)::REAL AS snr,
+    to_timestamp(timestamp / 1000.0) AS timestamp,
+    to_timestamp(created_at / 1000.0) AS created_at
+FROM sensor_readings;
 
 -- Create view for recent readings
 CREATE OR REPLACE VIEW recent_readings AS
-SELECT * FROM sensor_readings
+SELECT * FROM sensor_readings_decoded
 ORDER BY timestamp DESC
 LIMIT 100;
 
@@ -51,7 +170,7 @@ SELECT
     MIN(acoustic) as min_acoustic,
     MAX(acoustic) as max_acoustic,
     COUNT(*) as reading_count
-FROM sensor_readings
+FROM sensor_readings_decoded
 GROUP BY DATE_TRUNC('hour', timestamp)
 ORDER BY hour DESC;
 
@@ -72,7 +191,7 @@ SELECT
     MIN(acoustic) as min_acoustic,
     MAX(acoustic) as max_acoustic,
     COUNT(*) as reading_count
-FROM sensor_readings
+FROM sensor_readings_decoded
 GROUP BY DATE_TRUNC('day', timestamp)
 ORDER BY day DESC;
 
@@ -90,7 +209,7 @@ SELECT
         WHEN pressure < 20 THEN 'Low Pressure'
         WHEN pressure > 80 THEN 'High Pressure'
     END as alert_type
-FROM sensor_readings
+FROM sensor_readings_decoded
 WHERE 
     moisture > 70 OR
     acoustic > 75 OR
@@ -105,7 +224,7 @@ DECLARE
     deleted_count INTEGER;
 BEGIN
     DELETE FROM sensor_readings
-    WHERE timestamp < NOW() - INTERVAL '1 day' * days_to_keep;
+    WHERE timestamp < (EXTRACT(EPOCH FROM NOW() - INTERVAL '1 day' * days_to_keep) * 1000)::BIGINT;
     
     GET DIAGNOSTICS deleted_count = ROW_COUNT;
     RETURN deleted_count;
@@ -130,37 +249,35 @@ BEGIN
     RETURN QUERY
     SELECT 
         COUNT(*)::BIGINT,
-        ROUND(AVG(sr.pressure)::NUMERIC, 2),
-        ROUND(MIN(sr.pressure)::NUMERIC, 2),
-        ROUND(MAX(sr.pressure)::NUMERIC, 2),
-        ROUND(AVG(sr.moisture)::NUMERIC, 2),
-        ROUND(MIN(sr.moisture)::NUMERIC, 2),
-        ROUND(MAX(sr.moisture)::NUMERIC, 2),
-        ROUND(AVG(sr.acoustic)::NUMERIC, 2),
-        ROUND(MIN(sr.acoustic)::NUMERIC, 2),
-        ROUND(MAX(sr.acoustic)::NUMERIC, 2)
+        ROUND(AVG(sr.pressure) / 100.0, 2),
+        ROUND(MIN(sr.pressure) / 100.0, 2),
+        ROUND(MAX(sr.pressure) / 100.0, 2),
+        ROUND(AVG(sr.moisture) / 100.0, 2),
+        ROUND(MIN(sr.moisture) / 100.0, 2),
+        ROUND(MAX(sr.moisture) / 100.0, 2),
+        ROUND(AVG(sr.acoustic) / 100.0, 2),
+        ROUND(MIN(sr.acoustic) / 100.0, 2),
+        ROUND(MAX(sr.acoustic) / 100.0, 2)
     FROM sensor_readings sr
-    WHERE sr.timestamp >= NOW() - INTERVAL '1 hour' * hours_back;
+    WHERE sr.timestamp >= (EXTRACT(EPOCH FROM NOW() - INTERVAL '1 hour' * hours_back) * 1000)::BIGINT;
 END;
 $$ LANGUAGE plpgsql;
 
--- Create trigger to automatically update created_at
-CREATE OR REPLACE FUNCTION update_created_at()
-RETURNS TRIGGER AS $$
-BEGIN
-    NEW.created_at = NOW();
-    RETURN NEW;
-END;
-$$ LANGUAGE plpgsql;
-
-CREATE TRIGGER set_created_at
-BEFORE INSERT ON sensor_readings
-FOR EACH ROW
-EXECUTE FUNCTION update_created_at();
-
 -- Grant permissions to leaksense_user
 GRANT ALL PRIVILEGES ON TABLE sensor_readings TO leaksense_user;
 GRANT USAGE, SELECT ON SEQUENCE sensor_readings_id_seq TO leaksense_user;
+GRANT ALL PRIVILEGES ON TABLE sensor_blocks TO leaksense_user;
+GRANT USAGE, SELECT ON SEQUENCE sensor_blocks_id_seq TO leaksense_user;
+GRANT ALL PRIVILEGES ON TABLE acoustic_features TO leaksense_user;
+GRANT USAGE, SELECT ON SEQUENCE acoustic_features_id_seq TO leaksense_user;
+GRANT ALL PRIVILEGES ON TABLE alert_events TO leaksense_user;
+GRANT USAGE, SELECT ON SEQUENCE alert_events_id_seq TO leaksense_user;
+GRANT ALL PRIVILEGES ON TABLE backfill_checkpoints TO leaksense_user;
+GRANT ALL PRIVILEGES ON TABLE device_modes TO leaksense_user;
+GRANT ALL PRIVILEGES ON TABLE pipes TO leaksense_user;
+GRANT ALL PRIVILEGES ON TABLE pipe_segments TO leaksense_user;
+GRANT ALL PRIVILEGES ON TABLE node_placements TO leaksense_user;
+GRANT SELECT ON sensor_readings_decoded TO leaksense_user;
 GRANT SELECT ON recent_readings TO leaksense_user;
 GRANT SELECT ON hourly_averages TO leaksense_user;
 GRANT SELECT ON daily_statistics TO leaksense_user;
@@ -169,18 +286,18 @@ GRANT SELECT ON alert_readings TO leaksense_user;
 -- Insert sample data for testing (optional)
 INSERT INTO sensor_readings (pressure, moisture, acoustic, rssi, snr, timestamp)
 VALUES 
-    (45.5, 32.1, 55.8, -85, 8.5, NOW() - INTERVAL '5 minutes'),
-    (46.2, 33.5, 56.2, -83, 9.1, NOW() - INTERVAL '4 minutes'),
-    (44.8, 31.8, 54.9, -87, 7.8, NOW() - INTERVAL '3 minutes'),
-    (45.9, 32.7, 55.5, -84, 8.9, NOW() - INTERVAL '2 minutes'),
-    (45.3, 32.3, 55.1, -86, 8.2, NOW() - INTERVAL '1 minute');
+    (4550, 3210, 5580, -85, 85, (EXTRACT(EPOCH FROM NOW() - INTERVAL '5 minutes') * 1000)::BIGINT),
+    (4620, 3350, 5620, -83, 91, (EXTRACT(EPOCH FROM NOW() - INTERVAL '4 minutes') * 1000)::BIGINT),
+    (4480, 3180, 5490, -87, 78, (EXTRACT(EPOCH FROM NOW() - INTERVAL '3 minutes') * 1000)::BIGINT),
+    (4590, 3270, 5550, -84, 89, (EXTRACT(EPOCH FROM NOW() - INTERVAL '2 minutes') * 1000)::BIGINT),
+    (4530, 3230, 5510, -86, 82, (EXTRACT(EPOCH FROM NOW() - INTERVAL '1 minute') * 1000)::BIGINT);
 
 -- Display table info
 \dt
 \d sensor_readings
 
 -- Display sample data
-SELECT * FROM sensor_readings ORDER BY timestamp DESC LIMIT 5;
+SELECT * FROM recent_readings LIMIT 5;
 
 -- Display statistics
 SELECT * FROM get_sensor_stats(24);
@@ -10,9 +10,17 @@
 #define RST 14
 #define DIO0 26
 
+// Unique node identifier (reported as "device" in every packet)
+#define DEVICE_ID "node-01"
+
 // LoRa Frequency (433 MHz, 868 MHz, or 915 MHz)
 #define LORA_FREQUENCY 915E6
 
+// Spreading factor (7-12). With several receiver radios, set this and
+// LORA_FREQUENCY to the channel printed by
+// `python3 lora_receiver.py --assign <DEVICE_ID>` on the Raspberry Pi
+#define LORA_SPREADING_FACTOR 7
+
 // Sensor Pin Configuration
 #define PRESSURE_SENSOR_PIN 34    // Analog pin for pressure sensor
 #define MOISTURE_SENSOR_PIN 35    // Analog pin for moisture sensor
@@ -28,8 +36,39 @@
 // Transmission interval (milliseconds)
 #define TRANSMISSION_INTERVAL 5000
 
+// Report-by-exception: sensors are still sampled every TRANSMISSION_INTERVAL,
+// but a packet is only sent when a value moves outside its deadband, crosses an
+// alert threshold, or HEARTBEAT_INTERVAL has passed since the last packet
+#define REPORT_BY_EXCEPTION true
+#define HEARTBEAT_INTERVAL 60000
+#define PRESSURE_DEADBAND 0.5     // PSI
+#define MOISTURE_DEADBAND 1.0     // %
+#define ACOUSTIC_DEADBAND 1.5     // dB
+
+// Raw acoustic burst capture for server-side spectral analysis. A burst is
+// captured every BURST_INTERVAL, or earlier (but no sooner than
+// BURST_MIN_SPACING after the previous one) when the acoustic level is at or
+// above ACOUSTIC_THRESHOLD and has moved by ACOUSTIC_DEADBAND since the last
+// burst. Fragments are sent BURST_FRAGMENT_GAP apart so a burst never holds
+// the channel for more than one packet.
+#define BURST_INTERVAL 900000       // milliseconds between scheduled bursts
+#define BURST_MIN_SPACING 120000    // milliseconds between triggered bursts
+#define BURST_SAMPLE_RATE 4000      // Hz
+#define BURST_SAMPLES 256           // samples per burst (8-bit)
+#define BURST_FRAGMENT_SAMPLES 64   // samples per LoRa packet (hex-encoded)
+#define BURST_FRAGMENT_GAP 2000     // milliseconds between fragments
+#define BURST_FRAGMENTS ((BURST_SAMPLES + BURST_FRAGMENT_SAMPLES - 1) / BURST_FRAGMENT_SAMPLES)
+
 unsigned long lastTransmission = 0;
+unsigned long lastBurst = 0;
 int packetCounter = 0;
+unsigned long lastSentTime = 0;
+bool hasSent = false;
+int burstCounter = 0;
+uint8_t burstSamples[BURST_SAMPLES];
+int burstNextFragment = BURST_FRAGMENTS;  // == BURST_FRAGMENTS when idle
+unsigned long lastFragment = 0;
+float burstAcoustic = 0;
 
 struct SensorData {
   float pressure;      // PSI
@@ -38,6 +77,8 @@ struct SensorData {
   unsigned long timestamp;
 };
 
+SensorData lastSent;
+
 void setup() {
   Serial.begin(115200);
   while (!Serial);
@@ -59,7 +100,7 @@ void setup() {
   }
   
   // LoRa Configuration
-  LoRa.setSpreadingFactor(7);           // SF7 to SF12
+  LoRa.setSpreadingFactor(LORA_SPREADING_FACTOR);  // SF7 to SF12
   LoRa.setSignalBandwidth(125E3);       // 125 kHz
   LoRa.setCodingRate4(5);               // 4/5
   LoRa.setSyncWord(0x12);               // Sync word
@@ -112,14 +153,40 @@ float readAcousticSensor() {
   return constrain(acoustic, 30.0, 100.0);
 }
 
-void transmitSensorData(SensorData data) {
+bool isAlert(SensorData data) {
+  return data.moisture > 70.0 || data.acoustic > 75.0 ||
+         data.pressure < 20.0 || data.pressure > 80.0;
+}
+
+// Decide whether a sample must be sent; sets heartbeat when it is sent only
+// because HEARTBEAT_INTERVAL has elapsed
+bool shouldTransmit(SensorData data, unsigned long currentTime, bool &heartbeat) {
+  heartbeat = false;
+  if (!REPORT_BY_EXCEPTION || !hasSent) return true;
+  if (fabs(data.pressure - lastSent.pressure) >= PRESSURE_DEADBAND) return true;
+  if (fabs(data.moisture - lastSent.moisture) >= MOISTURE_DEADBAND) return true;
+  if (fabs(data.acoustic - lastSent.acoustic) >= ACOUSTIC_DEADBAND) return true;
+  if (isAlert(data) != isAlert(lastSent)) return true;
+  if (currentTime - lastSentTime >= HEARTBEAT_INTERVAL) {
+    heartbeat = true;
+    return true;
+  }
+  return false;
+}
+
+void transmitSensorData(SensorData data, bool heartbeat) {
   // Create JSON-like string for transmission
   String payload = "{";
+  payload += "\"device\":\"" + String(DEVICE_ID) + "\",";
   payload += "\"id\":" + String(packetCounter) + ",";
   payload += "\"pressure\":" + String(data.pressure, 2) + ",";
   payload += "\"moisture\":" + String(data.moisture, 2) + ",";
   payload += "\"acoustic\":" + String(data.acoustic, 2) + ",";
   payload += "\"timestamp\":" + String(data.timestamp);
+  if (REPORT_BY_EXCEPTION) {
+    payload += ",\"rbe\":1";
+    if (heartbeat) payload += ",\"hb\":1";
+  }
   payload += "}";
   
   // Send LoRa packet
@@ -147,6 +214,60 @@ void transmitSensorData(SensorData data) {
   }
   
   packetCounter++;
+  lastSent = data;
+  lastSentTime = millis();
+  hasSent = true;
+}
+
+void captureBurst(float acoustic) {
+  // Sample the raw microphone signal at BURST_SAMPLE_RATE, scaled to 8 bits
+  const unsigned long periodUs = 1000000UL / BURST_SAMPLE_RATE;
+  unsigned long next = micros();
+  for (int i = 0; i < BURST_SAMPLES; i++) {
+    while ((long)(micros() - next) < 0);
+    burstSamples[i] = analogRead(ACOUSTIC_SENSOR_PIN) >> 4;  // 12-bit -> 8-bit
+    next += periodUs;
+  }
+  burstAcoustic = acoustic;
+  burstNextFragment = 0;
+}
+
+// Burst due: on schedule, or early when a loud reading has moved since the
+// last burst
+bool burstDue(float acoustic, unsigned long currentTime) {
+  if (burstNextFragment < BURST_FRAGMENTS) return false;
+  unsigned long sinceLast = currentTime - lastBurst;
+  if (sinceLast >= BURST_INTERVAL) return true;
+  return sinceLast >= BURST_MIN_SPACING &&
+         acoustic >= ACOUSTIC_THRESHOLD &&
+         fabs(acoustic - burstAcoustic) >= ACOUSTIC_DEADBAND;
+}
+
+// Send the next pending fragment, one LoRa packet per call
+void transmitBurstFragment() {
+  const int f = burstNextFragment;
+  String payload = "{";
+  payload += "\"device\":\"" + String(DEVICE_ID) + "\",";
+  payload += "\"burst\":" + String(burstCounter) + ",";
+  payload += "\"frag\":" + String(f) + ",";
+  payload += "\"of\":" + String(BURST_FRAGMENTS) + ",";
+  payload += "\"sr\":" + String(BURST_SAMPLE_RATE) + ",";
+  payload += "\"data\":\"";
+  for (int i = f * BURST_FRAGMENT_SAMPLES; i < (f + 1) * BURST_FRAGMENT_SAMPLES && i < BURST_SAMPLES; i++) {
+    if (burstSamples[i] < 0x10) payload += "0";
+    payload += String(burstSamples[i], HEX);
+  }
+  payload += "\"}";
+
+  LoRa.beginPacket();
+  LoRa.print(payload);
+  LoRa.endPacket();
+
+  burstNextFragment++;
+  if (burstNextFragment == BURST_FRAGMENTS) {
+    Serial.println("=== Acoustic burst #" + String(burstCounter) + " sent in " + String(BURST_FRAGMENTS) + " fragments ===");
+    burstCounter++;
+  }
 }
 
 void loop() {
@@ -162,12 +283,28 @@ void loop() {
     data.acoustic = readAcousticSensor();
     data.timestamp = currentTime;
     
-    // Transmit via LoRa
-    transmitSensorData(data);
+    // Transmit via LoRa only when the reading is worth reporting
+    bool heartbeat;
+    if (shouldTransmit(data, currentTime, heartbeat)) {
+      transmitSensorData(data, heartbeat);
+    }
+    
+    // Capture a raw acoustic burst; its fragments go out below
+    if (burstDue(data.acoustic, currentTime)) {
+      captureBurst(data.acoustic);
+      lastBurst = currentTime;
+      lastFragment = currentTime;
+    }
     
     lastTransmission = currentTime;
   }
   
+  // Send pending burst fragments spaced BURST_FRAGMENT_GAP apart
+  if (burstNextFragment < BURST_FRAGMENTS && currentTime - lastFragment >= BURST_FRAGMENT_GAP) {
+    transmitBurstFragment();
+    lastFragment = currentTime;
+  }
+  
   // Small delay to prevent watchdog issues
   delay(10);
 }
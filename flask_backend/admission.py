@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+LeakSense admission control
+Cost-weighted concurrency limits per endpoint class with capacity reserved for
+alert/latest traffic, plus per-client token-bucket rate limiting
+"""
+
+import math
+import threading
+import time
+
+# Endpoint classes
+CRITICAL = 'critical'   # latest, alerts, dashboard, health: may use reserved capacity
+ANALYTIC = 'analytic'   # window scans: range, statistics, chart data, ...
+INGEST = 'ingest'       # gateway uploads
+
+BUCKET_IDLE_SECONDS = 600  # forget clients idle this long
+
+
+class TokenBucket:
+    """Refills at rate tokens/s up to burst; a request spends its cost in tokens"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost):
+        """Spend cost tokens; returns 0 on success or seconds until enough have refilled."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Decides whether a request may start now
+
+    Requests hold cost units while they run. Non-critical classes may only use
+    capacity - reserved units in total and at most their own class limit;
+    critical requests may use the whole capacity, so a burst of long scans can
+    never take the last `reserved` units away from alert and latest queries.
+    Nothing queues: a request that does not fit is rejected immediately.
+    """
+
+    def __init__(self, capacity=16, reserved=4, class_limits=None, rate=10.0, burst=40.0, retry_after=1):
+        self.capacity = capacity
+        self.reserved = reserved
+        self.class_limits = dict(class_limits or {})
+        self.rate = rate
+        self.burst = burst
+        self.retry_after = retry_after
+        self.in_use = 0
+        self.class_in_use = {}
+        self.buckets = {}
+        self.rejected = {'rate_limited': 0, 'overloaded': 0}
+        self.lock = threading.Lock()
+        self.pruned = time.monotonic()
+
+    def clamp_cost(self, endpoint_class, cost):
+        """Cap a cost at what the class could ever hold, so huge requests still run when idle."""
+        ceiling = self.capacity if endpoint_class == CRITICAL else self.capacity - self.reserved
+        ceiling = min(ceiling, self.class_limits.get(endpoint_class, ceiling))
+        return max(1, min(cost, ceiling))
+
+    def admit(self, client, endpoint_class, cost):
+        """Try to admit a request.
+
+        Returns (None, None) when admitted (call release() when done), or
+        (status_code, retry_after_seconds) when it must be rejected.
+        """
+        cost = self.clamp_cost(endpoint_class, cost)
+        with self.lock:
+            self._prune()
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                bucket = self.buckets[client] = TokenBucket(self.rate, self.burst)
+            wait = bucket.take(min(cost, self.burst))
+            if wait:
+                self.rejected['rate_limited'] += 1
+                return 429, max(1, math.ceil(wait))
+
+            limit = self.capacity if endpoint_class == CRITICAL else self.capacity - self.reserved
+            class_used = self.class_in_use.get(endpoint_class, 0)
+            class_limit = self.class_limits.get(endpoint_class)
+            if self.in_use + cost > limit or (class_limit is not None and class_used + cost > class_limit):
+                # Give the tokens back: the request did no work
+                bucket.tokens = min(self.burst, bucket.tokens + min(cost, self.burst))
+                self.rejected['overloaded'] += 1
+                return 503, self.retry_after
+
+            self.in_use += cost
+            self.class_in_use[endpoint_class] = class_used + cost
+        return None, None
+
+    def release(self, endpoint_class, cost):
+        cost = self.clamp_cost(endpoint_class, cost)
+        with self.lock:
+            self.in_use -= cost
+            self.class_in_use[endpoint_class] -= cost
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self.pruned < BUCKET_IDLE_SECONDS:
+            return
+        self.buckets = {k: b for k, b in self.buckets.items() if now - b.updated < BUCKET_IDLE_SECONDS}
+        self.pruned = now
+
+    def status(self):
+        with self.lock:
+            return {
+                'capacity': self.capacity,
+                'reserved': self.reserved,
+                'in_use': self.in_use,
+                'in_use_by_class': dict(self.class_in_use),
+                'clients': len(self.buckets),
+                'rejected': dict(self.rejected)
+            }
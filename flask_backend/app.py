@@ -4,55 +4,155 @@ LeakSense Flask Backend API
 Provides REST API for sensor data visualization
 """
 
-from flask import Flask, jsonify, request, render_template, send_from_directory
+from flask import Flask, jsonify, request, render_template, send_from_directory, g, Response
 from flask_cors import CORS
 from datetime import datetime, timedelta
+import math
 import os
 import sqlite3
+import threading
+import time
+
+import numpy as np
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from config import Config
+import cold_storage
+import acoustic
+from localization import LocalizationEngine
+import reconstruction
+from reconstruction import reconstruct
+import db_router
+import sharding
+import chart_payload
+from hot_store import HotStore
+import profiling
+import admission
+import storage_format
+import topology
+from storage_format import to_ms, decode_row, decode_aggregates
 
 app = Flask(__name__, 
             static_folder='../web_frontend',
             template_folder='../web_frontend')
 app.config.from_object(Config)
-CORS(app)
+# Delta-sync metadata on binary chart responses (see _binary_chart)
+CORS(app, expose_headers=['X-Window-Start', 'X-Delta-From', 'X-Cursor'])
 
 # Database connection
 def _ensure_sqlite_schema(conn):
     """Create required tables/indexes for sqlite fallback (idempotent)."""
-    create_table = """
-    CREATE TABLE IF NOT EXISTS sensor_readings (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        pressure REAL NOT NULL,
-        moisture REAL NOT NULL,
-        acoustic REAL NOT NULL,
-        rssi INTEGER,
-        snr REAL,
-        timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-    );
-    """
+    # Databases created before device_id was introduced
+    try:
+        cur = conn.cursor()
+        columns = [row[1] for row in cur.execute("PRAGMA table_info(sensor_readings)").fetchall()]
+        if columns and 'device_id' not in columns:
+            cur.execute("ALTER TABLE sensor_readings ADD COLUMN device_id TEXT NOT NULL DEFAULT 'default'")
+            conn.commit()
+    except Exception as e:
+        print(f"Failed to migrate sqlite schema: {e}")
+
+    # Databases created before the epoch-ms / scaled-integer layout
+    try:
+        if storage_format.migrate(conn, 'sqlite'):
+            print("✅ Migrated sqlite sensor_readings to epoch-ms / scaled-integer columns")
+        if cold_storage.migrate_blocks(conn, 'sqlite'):
+            print("✅ Migrated sqlite sensor_blocks to epoch-ms chunk bounds")
+    except Exception as e:
+        print(f"Failed to migrate sqlite schema: {e}")
+
+    create_table = (storage_format.CREATE_READINGS_SQLITE + storage_format.CREATE_READINGS_INDEXES_SQLITE +
+                    cold_storage.CREATE_BLOCKS_SQLITE + acoustic.CREATE_FEATURES_SQLITE +
+                    topology.CREATE_TOPOLOGY_SQLITE + reconstruction.CREATE_DEVICE_MODES_SQLITE)
     try:
         cur = conn.cursor()
         cur.executescript(create_table)
         conn.commit()
-    except Exception:
-        # For sqlite3, executescript may be unavailable in some cursor wrappers; fallback to execute
-        try:
-            cur.execute(create_table)
-            conn.commit()
-        except Exception as e:
-            print(f"Failed to ensure sqlite schema: {e}")
+    except Exception as e:
+        print(f"Failed to ensure sqlite schema: {e}")
+
+
+def _pg_connect(host, port, connect_timeout=None):
+    kwargs = {'connect_timeout': connect_timeout} if connect_timeout else {}
+    return psycopg2.connect(
+        host=host,
+        port=port,
+        database=app.config['DB_NAME'],
+        user=app.config['DB_USER'],
+        password=app.config['DB_PASSWORD'],
+        **kwargs
+    )
+
+
+router = db_router.ReplicaRouter(
+    primary={'host': app.config['DB_HOST'], 'port': app.config['DB_PORT']},
+    replicas=db_router.parse_endpoints(app.config['DB_REPLICAS'], app.config['DB_PORT']),
+    connect=lambda host, port: _pg_connect(host, port, connect_timeout=app.config['DB_REPLICA_CONNECT_TIMEOUT']),
+    max_lag_seconds=app.config['DB_REPLICA_MAX_LAG_SECONDS'],
+    health_interval=app.config['DB_REPLICA_HEALTH_INTERVAL'],
+    pin_seconds=app.config['DB_READ_YOUR_WRITES_SECONDS']
+)
+
+
+shards = sharding.ShardSet(
+    sharding.ShardMap(app.config['DB_SHARDS'], app.config['DB_SHARD_REGIONS'], app.config['DB_PORT']),
+    connect=_pg_connect,
+    max_workers=app.config['DB_SHARD_WORKERS']
+)
+
+
+def _sharded():
+    """True when sensor_readings is spread over DB_SHARDS (PostgreSQL only)."""
+    return shards.enabled and app.config.get('DB_TYPE', 'postgres').lower() != 'sqlite'
+
 
+def _scatter(fn):
+    """Run fn(conn) on every shard in parallel; SQL is timed when the request is profiled."""
+    profile = profiling.current()
+    if profile is None:
+        return shards.scatter(fn)
+    return shards.scatter(lambda conn: fn(profiling.ProfiledConnection(conn, profile)))
 
-def get_db_connection():
+
+def _scatter_readings(query, params=(), reverse=False, cold_window=None):
+    """Decoded sensor_readings rows from every shard, merged in timestamp order.
+
+    query must be ordered by timestamp (DESC when reverse). With
+    cold_window=(start, end) each shard's sealed readings in it are included.
+    """
+    def fetch(conn):
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(query, params)
+        rows = [decode_row(row) for row in cursor.fetchall()]
+        cursor.close()
+        if cold_window:
+            rows = cold_storage.fetch_cold_readings(conn, 'postgres', *cold_window) + rows
+            rows.sort(key=lambda r: r['timestamp'], reverse=reverse)
+        return rows
+    return sharding.merge_by_timestamp(_scatter(fetch), reverse)
+
+
+def get_db_connection(route=db_router.PRIMARY):
     """Attempt to connect to PostgreSQL; if it fails, fall back to SQLite for local development.
 
+    route selects the endpoint: db_router.PRIMARY for writes, db_router.LATEST
+    for freshness-sensitive reads (both go to the primary) and
+    db_router.ANALYTIC for scans that may be served by a replica.
+
+    Inside a profiled request the connection is wrapped so every statement's
+    duration is recorded.
+
     Returns a tuple: (connection, db_type) where db_type is 'postgres' or 'sqlite'.
     """
+    conn, db_type = _open_db_connection(route)
+    profile = profiling.current()
+    if conn is not None and profile is not None:
+        conn = profiling.ProfiledConnection(conn, profile)
+    return conn, db_type
+
+
+def _open_db_connection(route):
     # First try PostgreSQL unless DB_TYPE forces sqlite
     if app.config.get('DB_TYPE', 'postgres').lower() == 'sqlite':
         pg_try = False
@@ -60,14 +160,17 @@ def get_db_connection():
         pg_try = True
 
     if pg_try:
+        endpoint = router.choose(route)
+        if endpoint['role'] == 'replica':
+            try:
+                conn = _pg_connect(endpoint['host'], endpoint['port'],
+                                   connect_timeout=app.config['DB_REPLICA_CONNECT_TIMEOUT'])
+                return conn, 'postgres'
+            except psycopg2.Error as e:
+                print(f"Replica connection error: {e} — failing over to primary")
+                router.mark_down(endpoint)
         try:
-            conn = psycopg2.connect(
-                host=app.config['DB_HOST'],
-                port=app.config['DB_PORT'],
-                database=app.config['DB_NAME'],
-                user=app.config['DB_USER'],
-                password=app.config['DB_PASSWORD']
-            )
+            conn = _pg_connect(app.config['DB_HOST'], app.config['DB_PORT'])
             return conn, 'postgres'
         except psycopg2.Error as e:
             print(f"Postgres connection error: {e} — falling back to SQLite (local dev only)")
@@ -88,6 +191,110 @@ def get_db_connection():
         return None, None
 
 
+hot_store = HotStore(
+    window_hours=app.config['HOT_WINDOW_HOURS'],
+    capacity_per_device=app.config['HOT_CAPACITY_PER_DEVICE'],
+    refresh_seconds=app.config['HOT_REFRESH_SECONDS'],
+    gap_lookback_ids=app.config['HOT_GAP_LOOKBACK_IDS'],
+    gap_seconds=app.config['HOT_GAP_SECONDS']
+)
+
+
+_rbe_modes = None
+_rbe_modes_loaded = 0.0
+_rbe_modes_lock = threading.Lock()
+
+
+def _rbe_devices():
+    """Devices to reconstruct onto the report-by-exception grid.
+
+    None means every device (REPORT_BY_EXCEPTION=true) and an empty set none
+    (false). With auto, the default, they are the devices the receiver has
+    recorded in device_modes, reloaded every RBE_MODE_RELOAD_SECONDS.
+    """
+    global _rbe_modes, _rbe_modes_loaded
+
+    mode = app.config['REPORT_BY_EXCEPTION']
+    if mode == 'true':
+        return None
+    if mode != 'auto':
+        return set()
+
+    devices = _rbe_modes
+    if devices is not None and time.time() - _rbe_modes_loaded < app.config['RBE_MODE_RELOAD_SECONDS']:
+        return devices
+    if not _rbe_modes_lock.acquire(blocking=devices is None):
+        return devices
+    try:
+        if _rbe_modes is not devices:
+            return _rbe_modes  # reloaded while we waited
+        try:
+            if _sharded():
+                loaded = set().union(*_scatter(reconstruction.fetch_rbe_devices))
+            else:
+                conn, _ = get_db_connection(db_router.LATEST)
+                if not conn:
+                    raise RuntimeError('Database connection failed')
+                try:
+                    loaded = reconstruction.fetch_rbe_devices(conn)
+                finally:
+                    conn.close()
+            _rbe_modes = loaded
+        except Exception as e:
+            print(f"⚠️  Device modes unavailable, keeping the previous set: {e}")
+            if _rbe_modes is None:
+                _rbe_modes = set()
+        _rbe_modes_loaded = time.time()
+        return _rbe_modes
+    finally:
+        _rbe_modes_lock.release()
+
+
+def _rbe_enabled():
+    """True when any device's readings are reconstructed."""
+    devices = _rbe_devices()
+    return devices is None or bool(devices)
+
+
+def _hot_window(start_time=None):
+    """Return the refreshed hot store if it can answer for readings since start_time, else None.
+
+    Without start_time only the newest stored readings are asked for, which
+    the store serves in every mode. Windows (series, statistics) of
+    report-by-exception devices need the reconstructed grid, so while there
+    are any, those reads go to the database. Sharded deployments never use
+    the store: it follows a single table's ids.
+    """
+    if not app.config['HOT_STORE_ENABLED'] or _sharded():
+        return None
+    if start_time is not None and _rbe_enabled():
+        return None
+    try:
+        hot_store.refresh(lambda: get_db_connection(db_router.LATEST))
+    except Exception as e:
+        print(f"⚠️  Hot store refresh failed: {e}")
+        return None
+    if start_time is not None and not hot_store.covers(start_time):
+        return None
+    return hot_store if hot_store.primed_from is not None else None
+
+
+def _series_chart(ts, columns, max_points):
+    """Chart-data arrays from hot-store series, bucket-averaged down to max_points."""
+    step = max(1, -(-len(ts) // max_points))  # ceil division
+    chart_data = {'labels': []}
+    for field in ('pressure', 'moisture', 'acoustic'):
+        values = np.nan_to_num(columns[field])
+        if step > 1:
+            sums = np.add.reduceat(values, np.arange(0, len(values), step))
+            counts = np.diff(np.append(np.arange(0, len(values), step), len(values)))
+            values = sums / counts
+        chart_data[field] = values.tolist()
+    last = ts[np.minimum(np.arange(step - 1, len(ts) + step - 1, step), len(ts) - 1)] if len(ts) else []
+    chart_data['labels'] = [datetime.fromtimestamp(t).strftime('%H:%M:%S') for t in last]
+    return chart_data
+
+
 @app.route('/')
 def index():
     """Serve main dashboard page"""
@@ -106,6 +313,10 @@ def health_check():
         return jsonify({
             'status': 'healthy',
             'database': db_type,
+            'replicas': router.status() if db_type == 'postgres' else [],
+            'shards': shards.map.status() if _sharded() else [],
+            'hot_store': hot_store.status(),
+            'admission': admission_control.status(),
             'timestamp': datetime.now().isoformat()
         }), 200
     else:
@@ -119,24 +330,32 @@ def health_check():
 @app.route('/api/sensors/latest', methods=['GET'])
 def get_latest_reading():
     """Get the most recent sensor reading"""
-    conn, db_type = get_db_connection()
+    hot = _hot_window()
+    reading = hot.latest() if hot else None
+    if reading:
+        return jsonify(reading), 200
+
+    conn, db_type = get_db_connection(db_router.LATEST)
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
 
     try:
         if db_type == 'postgres':
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute("""
+            query = """
                 SELECT * FROM sensor_readings
                 ORDER BY timestamp DESC
                 LIMIT 1
-            """)
-            reading = cursor.fetchone()
-            cursor.close()
+            """
+            if _sharded():
+                reading = next(iter(_scatter_readings(query, reverse=True)), None)
+            else:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute(query)
+                reading = cursor.fetchone()
+                cursor.close()
+                reading = decode_row(reading) if reading else None
             conn.close()
             if reading:
-                # reading is already a dict-like from RealDictCursor
-                # Safely convert datetimes
                 if isinstance(reading.get('timestamp'), datetime):
                     reading['timestamp'] = reading['timestamp'].isoformat()
                 if isinstance(reading.get('created_at'), datetime):
@@ -157,8 +376,7 @@ def get_latest_reading():
             cursor.close()
             conn.close()
             if row:
-                reading = dict(row)
-                # timestamp/created_at may already be strings
+                reading = decode_row(row)
                 for k in ('timestamp', 'created_at'):
                     v = reading.get(k)
                     if isinstance(v, str):
@@ -175,27 +393,52 @@ def get_latest_reading():
         return jsonify({'error': str(e)}), 500
 
 
+def _delta_cursor(readings, since=None):
+    """Value for the client's next ?since=: newest reading timestamp (epoch ms), else since."""
+    newest = max((to_ms(r['timestamp']) for r in readings if isinstance(r.get('timestamp'), datetime)),
+                 default=None)
+    return newest if newest is not None else since
+
+
+def _delta_floor(since):
+    """Epoch ms a since= poll re-reads after (exclusive): DELTA_OVERLAP_SECONDS before the cursor.
+
+    Rows in the overlap may already be held by the client, which replaces or
+    dedupes them by (device_id, id).
+    """
+    return since - int(app.config['DELTA_OVERLAP_SECONDS'] * 1000)
+
+
 @app.route('/api/sensors/recent', methods=['GET'])
 def get_recent_readings():
-    """Get recent sensor readings"""
+    """Get recent sensor readings (since=<epoch ms>: readings newer than the cursor, plus the overlap)"""
     limit = request.args.get('limit', default=50, type=int)
     limit = min(limit, 1000)  # Max 1000 records
+    since = request.args.get('since', type=int)
+    floor = _delta_floor(since) if since is not None else None
     
-    conn, db_type = get_db_connection()
+    conn, db_type = get_db_connection(db_router.ANALYTIC)
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
 
     try:
         if db_type == 'postgres':
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute("""
+            query = f"""
                 SELECT * FROM sensor_readings
+                {'WHERE timestamp > %s' if since is not None else ''}
                 ORDER BY timestamp DESC
                 LIMIT %s
-            """, (limit,))
-            readings = cursor.fetchall()
-            cursor.close()
+            """
+            params = (limit,) if since is None else (floor, limit)
+            if _sharded():
+                readings = _scatter_readings(query, params, reverse=True)[:limit]
+            else:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute(query, params)
+                readings = [decode_row(row) for row in cursor.fetchall()]
+                cursor.close()
             conn.close()
+            next_cursor = _delta_cursor(readings, since)
             # Convert datetime objects to ISO format
             for reading in readings:
                 if isinstance(reading.get('timestamp'), datetime):
@@ -205,22 +448,26 @@ def get_recent_readings():
 
             return jsonify({
                 'count': len(readings),
+                'cursor': next_cursor,
+                # A full page after a cursor may have skipped readings: refetch without since
+                'truncated': since is not None and len(readings) == limit,
                 'data': readings
             }), 200
 
         else:
             cursor = conn.cursor()
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT * FROM sensor_readings
+                {'WHERE timestamp > ?' if since is not None else ''}
                 ORDER BY timestamp DESC
                 LIMIT ?
-            """, (limit,))
-            rows = cursor.fetchall()
+            """, (limit,) if since is None else (floor, limit))
+            rows = [decode_row(row) for row in cursor.fetchall()]
             cursor.close()
             conn.close()
+            next_cursor = _delta_cursor(rows, since)
             results = []
-            for row in rows:
-                r = dict(row)
+            for r in rows:
                 for k in ('timestamp', 'created_at'):
                     v = r.get(k)
                     if isinstance(v, str):
@@ -233,6 +480,8 @@ def get_recent_readings():
 
             return jsonify({
                 'count': len(results),
+                'cursor': next_cursor,
+                'truncated': since is not None and len(results) == limit,
                 'data': results
             }), 200
 
@@ -240,28 +489,57 @@ def get_recent_readings():
         return jsonify({'error': str(e)}), 500
 
 
+def _time_window(max_hours=None):
+    """Resolve the requested window from ?hours= or explicit ?start=&end= ISO timestamps.
+
+    Returns (start_time, end_time, hours). Explicit windows let audits reach
+    readings that have been sealed into cold storage.
+    """
+    end_time = datetime.now()
+    start_arg = request.args.get('start')
+    end_arg = request.args.get('end')
+    if start_arg:
+        start_time = datetime.fromisoformat(start_arg)
+        if end_arg:
+            end_time = datetime.fromisoformat(end_arg)
+        if max_hours is not None:
+            start_time = max(start_time, end_time - timedelta(hours=max_hours))
+        hours = (end_time - start_time).total_seconds() / 3600
+    else:
+        hours = request.args.get('hours', default=24, type=int)
+        hours = min(hours, 168)  # Max 7 days
+        start_time = end_time - timedelta(hours=hours)
+    return start_time, end_time, hours
+
+
 @app.route('/api/sensors/range', methods=['GET'])
 def get_readings_by_range():
-    """Get sensor readings within a time range"""
-    hours = request.args.get('hours', default=24, type=int)
-    hours = min(hours, 168)  # Max 7 days
-    
-    start_time = datetime.now() - timedelta(hours=hours)
+    """Get sensor readings within a time range (hot rows and sealed cold blocks)"""
+    try:
+        start_time, end_time, hours = _time_window(max_hours=168)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid time window: {e}'}), 400
     
-    conn, db_type = get_db_connection()
+    conn, db_type = get_db_connection(db_router.ANALYTIC)
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
 
     try:
         if db_type == 'postgres':
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute("""
+            query = """
                 SELECT * FROM sensor_readings
-                WHERE timestamp >= %s
+                WHERE timestamp >= %s AND timestamp < %s
                 ORDER BY timestamp ASC
-            """, (start_time,))
-            readings = cursor.fetchall()
-            cursor.close()
+            """
+            params = (to_ms(start_time), to_ms(end_time))
+            if _sharded():
+                readings = _scatter_readings(query, params, cold_window=(start_time, end_time))
+            else:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute(query, params)
+                readings = [decode_row(row) for row in cursor.fetchall()]
+                cursor.close()
+                readings = cold_storage.fetch_cold_readings(conn, db_type, start_time, end_time) + readings
             conn.close()
             for reading in readings:
                 if isinstance(reading.get('timestamp'), datetime):
@@ -272,23 +550,23 @@ def get_readings_by_range():
             return jsonify({
                 'count': len(readings),
                 'start_time': start_time.isoformat(),
-                'end_time': datetime.now().isoformat(),
+                'end_time': end_time.isoformat(),
                 'data': readings
             }), 200
 
         else:
             cursor = conn.cursor()
-            # sqlite stores timestamps as text by default
             cursor.execute("""
                 SELECT * FROM sensor_readings
-                WHERE timestamp >= ?
+                WHERE timestamp >= ? AND timestamp < ?
                 ORDER BY timestamp ASC
-            """, (start_time,))
+            """, (to_ms(start_time), to_ms(end_time)))
             rows = cursor.fetchall()
             cursor.close()
+            cold = cold_storage.fetch_cold_readings(conn, db_type, start_time, end_time)
             conn.close()
             results = []
-            for row in rows:
+            for row in cold + [decode_row(row) for row in rows]:
                 r = dict(row)
                 for k in ('timestamp', 'created_at'):
                     v = r.get(k)
@@ -303,7 +581,7 @@ def get_readings_by_range():
             return jsonify({
                 'count': len(results),
                 'start_time': start_time.isoformat(),
-                'end_time': datetime.now().isoformat(),
+                'end_time': end_time.isoformat(),
                 'data': results
             }), 200
 
@@ -311,84 +589,178 @@ def get_readings_by_range():
         return jsonify({'error': str(e)}), 500
 
 
+STATISTICS_QUERY_POSTGRES = """
+    SELECT 
+        COUNT(*) as total_readings,
+        AVG(pressure) as avg_pressure,
+        MIN(pressure) as min_pressure,
+        MAX(pressure) as max_pressure,
+        STDDEV(pressure) as std_pressure,
+        AVG(moisture) as avg_moisture,
+        MIN(moisture) as min_moisture,
+        MAX(moisture) as max_moisture,
+        STDDEV(moisture) as std_moisture,
+        AVG(acoustic) as avg_acoustic,
+        MIN(acoustic) as min_acoustic,
+        MAX(acoustic) as max_acoustic,
+        STDDEV(acoustic) as std_acoustic,
+        AVG(rssi) as avg_rssi,
+        MIN(rssi) as min_rssi,
+        MAX(rssi) as max_rssi
+    FROM sensor_readings
+    WHERE timestamp >= %s AND timestamp < %s
+"""
+
+# sqlite: no STDDEV
+STATISTICS_QUERY_SQLITE = """
+    SELECT 
+        COUNT(*) as total_readings,
+        AVG(pressure) as avg_pressure,
+        MIN(pressure) as min_pressure,
+        MAX(pressure) as max_pressure,
+        AVG(moisture) as avg_moisture,
+        MIN(moisture) as min_moisture,
+        MAX(moisture) as max_moisture,
+        AVG(acoustic) as avg_acoustic,
+        MIN(acoustic) as min_acoustic,
+        MAX(acoustic) as max_acoustic,
+        AVG(rssi) as avg_rssi
+    FROM sensor_readings
+    WHERE timestamp >= ? AND timestamp < ?
+"""
+
+
+def _window_statistics(conn, db_type, start_time, end_time):
+    """SQL aggregates over [start_time, end_time), sealed cold blocks included."""
+    if db_type == 'postgres' and _sharded():
+        # Per-shard count/sum/sumsq/min/max partials (sealed blocks included)
+        merged = cold_storage.empty_aggregates()
+        for partial in _scatter(lambda shard: sharding.partial_aggregates(shard, start_time, end_time)):
+            cold_storage.merge_aggregates(merged, partial)
+        return sharding.statistics_from_aggregates(merged)
+
+    if db_type == 'postgres':
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(STATISTICS_QUERY_POSTGRES, (to_ms(start_time), to_ms(end_time)))
+    else:
+        cursor = conn.cursor()
+        cursor.execute(STATISTICS_QUERY_SQLITE, (to_ms(start_time), to_ms(end_time)))
+    stats = decode_aggregates(cursor.fetchone())
+    cursor.close()
+    cold_storage.merge_statistics(stats, cold_storage.cold_aggregates(conn, db_type, start_time, end_time))
+    return stats
+
+
+def _alert_count(conn, db_type, start_time, end_time):
+    """Number of stored readings in [start_time, end_time) that violate a threshold."""
+    ph = '%s' if db_type == 'postgres' else '?'
+    query = f"""
+        SELECT COUNT(*) FROM sensor_readings
+        WHERE timestamp >= {ph} AND timestamp < {ph}
+        AND (
+            moisture > {ph} OR
+            acoustic > {ph} OR
+            pressure < {ph} OR
+            pressure > {ph}
+        )
+    """
+    # Compared against the stored scaled-integer columns
+    params = (
+        to_ms(start_time), to_ms(end_time),
+        storage_format.scale('moisture', app.config['MOISTURE_THRESHOLD']),
+        storage_format.scale('acoustic', app.config['ACOUSTIC_THRESHOLD']),
+        storage_format.scale('pressure', app.config['PRESSURE_MIN']),
+        storage_format.scale('pressure', app.config['PRESSURE_MAX'])
+    )
+
+    def count(connection):
+        cursor = connection.cursor()
+        cursor.execute(query, params)
+        n = cursor.fetchone()[0]
+        cursor.close()
+        return int(n)
+
+    if db_type == 'postgres' and _sharded():
+        return sum(_scatter(count))
+    return count(conn)
+
+
+def _fetch_window(conn, db_type, start_time, end_time=None):
+    """Decoded stored readings from start_time (to end_time), oldest first."""
+    ph = '%s' if db_type == 'postgres' else '?'
+    params = [to_ms(start_time)]
+    end_clause = ''
+    if end_time is not None:
+        end_clause = f' AND timestamp < {ph}'
+        params.append(to_ms(end_time))
+    query = f"""
+        SELECT * FROM sensor_readings
+        WHERE timestamp >= {ph}{end_clause}
+        ORDER BY timestamp ASC
+    """
+    if db_type == 'postgres' and _sharded():
+        return _scatter_readings(query, params)
+    cursor = conn.cursor(cursor_factory=RealDictCursor) if db_type == 'postgres' else conn.cursor()
+    cursor.execute(query, params)
+    rows = [decode_row(row) for row in cursor.fetchall()]
+    cursor.close()
+    return rows
+
+
+def _latest_stored(conn, db_type):
+    """Newest stored reading (decoded), or None."""
+    query = """
+        SELECT * FROM sensor_readings
+        ORDER BY timestamp DESC
+        LIMIT 1
+    """
+    if db_type == 'postgres' and _sharded():
+        return next(iter(_scatter_readings(query, reverse=True)), None)
+    cursor = conn.cursor(cursor_factory=RealDictCursor) if db_type == 'postgres' else conn.cursor()
+    cursor.execute(query)
+    row = cursor.fetchone()
+    cursor.close()
+    return decode_row(row) if row else None
+
+
 @app.route('/api/sensors/statistics', methods=['GET'])
 def get_statistics():
-    """Get statistical summary of sensor data"""
-    hours = request.args.get('hours', default=24, type=int)
-    hours = min(hours, 168)  # Max 7 days
-    
-    start_time = datetime.now() - timedelta(hours=hours)
+    """Get statistical summary of sensor data (hot rows and sealed cold blocks)"""
+    try:
+        start_time, end_time, hours = _time_window()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid time window: {e}'}), 400
+
+    hot = _hot_window(start_time)
+    if hot:
+        stats = hot.statistics(start_time, end_time)
+        stats['period_hours'] = hours
+        stats['start_time'] = start_time.isoformat()
+        stats['end_time'] = end_time.isoformat()
+        return jsonify(stats), 200
     
-    conn, db_type = get_db_connection()
+    conn, db_type = get_db_connection(db_router.ANALYTIC)
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
 
-    try:
-        if db_type == 'postgres':
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_readings,
-                    AVG(pressure) as avg_pressure,
-                    MIN(pressure) as min_pressure,
-                    MAX(pressure) as max_pressure,
-                    STDDEV(pressure) as std_pressure,
-                    AVG(moisture) as avg_moisture,
-                    MIN(moisture) as min_moisture,
-                    MAX(moisture) as max_moisture,
-                    STDDEV(moisture) as std_moisture,
-                    AVG(acoustic) as avg_acoustic,
-                    MIN(acoustic) as min_acoustic,
-                    MAX(acoustic) as max_acoustic,
-                    STDDEV(acoustic) as std_acoustic,
-                    AVG(rssi) as avg_rssi,
-                    MIN(rssi) as min_rssi,
-                    MAX(rssi) as max_rssi
-                FROM sensor_readings
-                WHERE timestamp >= %s
-            """, (start_time,))
-            stats = cursor.fetchone()
-            cursor.close()
+    if _rbe_enabled():
+        try:
+            stats, _ = _reconstructed_statistics(conn, db_type, start_time, end_time)
             conn.close()
-            if stats:
-                stats = {k: float(v) if v is not None else None for k, v in stats.items()}
-                stats['period_hours'] = hours
-                stats['start_time'] = start_time.isoformat()
-                stats['end_time'] = datetime.now().isoformat()
-                return jsonify(stats), 200
-            else:
-                return jsonify({'message': 'No data available'}), 404
+            stats['period_hours'] = hours
+            stats['start_time'] = start_time.isoformat()
+            stats['end_time'] = end_time.isoformat()
+            return jsonify(stats), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
 
-        else:
-            # sqlite: use slightly different SQL (no STDDEV) and placeholder '?'
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_readings,
-                    AVG(pressure) as avg_pressure,
-                    MIN(pressure) as min_pressure,
-                    MAX(pressure) as max_pressure,
-                    AVG(moisture) as avg_moisture,
-                    MIN(moisture) as min_moisture,
-                    MAX(moisture) as max_moisture,
-                    AVG(acoustic) as avg_acoustic,
-                    MIN(acoustic) as min_acoustic,
-                    MAX(acoustic) as max_acoustic,
-                    AVG(rssi) as avg_rssi
-                FROM sensor_readings
-                WHERE timestamp >= ?
-            """, (start_time,))
-            row = cursor.fetchone()
-            cursor.close()
-            conn.close()
-            if row:
-                stats = {k: (float(row[k]) if row[k] is not None else None) for k in row.keys()}
-                stats['period_hours'] = hours
-                stats['start_time'] = start_time.isoformat()
-                stats['end_time'] = datetime.now().isoformat()
-                return jsonify(stats), 200
-            else:
-                return jsonify({'message': 'No data available'}), 404
+    try:
+        stats = _window_statistics(conn, db_type, start_time, end_time)
+        conn.close()
+        stats['period_hours'] = hours
+        stats['start_time'] = start_time.isoformat()
+        stats['end_time'] = end_time.isoformat()
+        return jsonify(stats), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -396,26 +768,35 @@ def get_statistics():
 
 @app.route('/api/sensors/alerts', methods=['GET'])
 def get_alerts():
-    """Get readings that exceed threshold values"""
+    """Get readings that exceed threshold values (since=<epoch ms>: newer ones, plus the overlap)"""
     hours = request.args.get('hours', default=24, type=int)
     hours = min(hours, 168)
+    since = request.args.get('since', type=int)
     
     start_time = datetime.now() - timedelta(hours=hours)
+    window_start = to_ms(start_time)
     
     # Threshold values
-    MOISTURE_THRESHOLD = 70.0
-    ACOUSTIC_THRESHOLD = 75.0
-    PRESSURE_MIN = 20.0
-    PRESSURE_MAX = 80.0
+    MOISTURE_THRESHOLD = app.config['MOISTURE_THRESHOLD']
+    ACOUSTIC_THRESHOLD = app.config['ACOUSTIC_THRESHOLD']
+    PRESSURE_MIN = app.config['PRESSURE_MIN']
+    PRESSURE_MAX = app.config['PRESSURE_MAX']
+    # Compared against the stored scaled-integer columns
+    stored_thresholds = (
+        window_start if since is None else max(window_start, _delta_floor(since) + 1),
+        storage_format.scale('moisture', MOISTURE_THRESHOLD),
+        storage_format.scale('acoustic', ACOUSTIC_THRESHOLD),
+        storage_format.scale('pressure', PRESSURE_MIN),
+        storage_format.scale('pressure', PRESSURE_MAX)
+    )
     
-    conn, db_type = get_db_connection()
+    conn, db_type = get_db_connection(db_router.ANALYTIC)
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
 
     try:
         if db_type == 'postgres':
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute("""
+            query = """
                 SELECT * FROM sensor_readings
                 WHERE timestamp >= %s
                 AND (
@@ -425,10 +806,17 @@ def get_alerts():
                     pressure > %s
                 )
                 ORDER BY timestamp DESC
-            """, (start_time, MOISTURE_THRESHOLD, ACOUSTIC_THRESHOLD, PRESSURE_MIN, PRESSURE_MAX))
-            alerts = cursor.fetchall()
-            cursor.close()
+            """
+            if _sharded():
+                alerts = _scatter_readings(query, stored_thresholds, reverse=True)
+            else:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute(query, stored_thresholds)
+                alerts = [decode_row(row) for row in cursor.fetchall()]
+                cursor.close()
+            signatures = acoustic.fetch_features(conn, db_type, start_time, leak_only=True)
             conn.close()
+            next_cursor = _delta_cursor(alerts, since)
             # Add alert types and convert datetime
             for alert in alerts:
                 if isinstance(alert.get('timestamp'), datetime):
@@ -453,7 +841,11 @@ def get_alerts():
                     'pressure_min': PRESSURE_MIN,
                     'pressure_max': PRESSURE_MAX
                 },
-                'data': alerts
+                'cursor': next_cursor,
+                # Cached alerts older than this have left the window
+                'window_start': window_start,
+                'data': alerts,
+                'acoustic_signatures': signatures
             }), 200
 
         else:
@@ -468,13 +860,14 @@ def get_alerts():
                     pressure > ?
                 )
                 ORDER BY timestamp DESC
-            """, (start_time, MOISTURE_THRESHOLD, ACOUSTIC_THRESHOLD, PRESSURE_MIN, PRESSURE_MAX))
-            rows = cursor.fetchall()
+            """, stored_thresholds)
+            rows = [decode_row(row) for row in cursor.fetchall()]
             cursor.close()
+            signatures = acoustic.fetch_features(conn, db_type, start_time, leak_only=True)
             conn.close()
+            next_cursor = _delta_cursor(rows, since)
             alerts = []
-            for row in rows:
-                alert = dict(row)
+            for alert in rows:
                 for k in ('timestamp', 'created_at'):
                     v = alert.get(k)
                     if isinstance(v, str):
@@ -502,26 +895,151 @@ def get_alerts():
                     'pressure_min': PRESSURE_MIN,
                     'pressure_max': PRESSURE_MAX
                 },
-                'data': alerts
+                'cursor': next_cursor,
+                # Cached alerts older than this have left the window
+                'window_start': window_start,
+                'data': alerts,
+                'acoustic_signatures': signatures
             }), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _spectral_series(conn, db_type, start_time):
+    """Build chart arrays from stored acoustic burst features."""
+    series = {
+        'labels': [],
+        'device_id': [],
+        'spectral_centroid': [],
+        'kurtosis': [],
+        'high_band_ratio': []
+    }
+    for row in acoustic.fetch_features(conn, db_type, start_time):
+        ts = _as_datetime(row.get('timestamp'))
+        series['labels'].append(ts.strftime('%H:%M:%S') if ts else '')
+        series['device_id'].append(row['device_id'])
+        series['spectral_centroid'].append(row['spectral_centroid'])
+        series['kurtosis'].append(row['kurtosis'])
+        series['high_band_ratio'].append(row['high_band_ratio'])
+    return series
+
+
+def _chart_columns(conn, db_type, start_time):
+    """Chart window as numpy columns (epoch ms, engineering units), skipping per-row dicts."""
+    ph = '%s' if db_type == 'postgres' else '?'
+    query = f"""
+        SELECT timestamp, pressure, moisture, acoustic
+        FROM sensor_readings
+        WHERE timestamp >= {ph}
+        ORDER BY timestamp ASC
+    """
+
+    def fetch(c):
+        cursor = c.cursor()
+        cursor.execute(query, (to_ms(start_time),))
+        rows = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+        return rows
+
+    if db_type == 'postgres' and _sharded():
+        rows = [row for part in _scatter(fetch) for row in part]
+    else:
+        rows = fetch(conn)
+    raw = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    order = np.argsort(raw[:, 0], kind='stable')
+    columns = {field: raw[order, i + 1] / storage_format.SCALES[field]
+               for i, field in enumerate(chart_payload.FIELDS)}
+    return raw[order, 0], columns
+
+
+def _binary_chart(start_time, since=None):
+    """Full-resolution chart window as a chart_payload response (decimated by the client).
+
+    With since (the newest timestamp the client holds), only points from
+    X-Delta-From on are sent; the client drops its cached points from there
+    and appends these. X-Delta-From is DELTA_OVERLAP_SECONDS before the
+    cursor, so late-committed readings replace the cached overlap.
+    X-Window-Start marks where the window now begins and X-Cursor is the
+    value for the next since.
+    """
+    window_start = to_ms(start_time)
+    delta_from = window_start
+    if since is not None:
+        delta_from = _delta_floor(since) + 1
+        if _rbe_enabled():
+            # A new reading can change grid points up to RBE_MAX_GAP_SECONDS back
+            delta_from = min(delta_from, since + 1 - int(app.config['RBE_MAX_GAP_SECONDS'] * 1000))
+        delta_from = max(window_start, delta_from)
+    delta_start = datetime.fromtimestamp(delta_from / 1000.0)
+
+    hot = _hot_window(start_time)
+    if hot:
+        ts, columns = hot.series(delta_start)
+        ts_ms = np.round(ts * 1000)
+    else:
+        conn, db_type = get_db_connection(db_router.ANALYTIC)
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+        try:
+            if _rbe_enabled():
+                points = _fetch_reconstructed(conn, db_type, delta_start, datetime.now())
+                ts_ms = [to_ms(p['timestamp']) for p in points]
+                columns = {field: [np.nan if p.get(field) is None else p[field] for p in points]
+                           for field in chart_payload.FIELDS}
+            else:
+                ts_ms, columns = _chart_columns(conn, db_type, delta_start)
+            conn.close()
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    response = Response(chart_payload.encode(ts_ms, columns), mimetype=chart_payload.CONTENT_TYPE)
+    response.headers['X-Window-Start'] = str(window_start)
+    response.headers['X-Delta-From'] = str(delta_from)
+    response.headers['X-Cursor'] = str(int(ts_ms[-1]) if len(ts_ms) else max(delta_from - 1, since or 0))
+    return response
+
+
 @app.route('/api/sensors/chart-data', methods=['GET'])
 def get_chart_data():
-    """Get formatted data for charts"""
+    """Get formatted data for charts (format=binary: columnar typed arrays, see chart_payload.py)"""
     hours = request.args.get('hours', default=1, type=int)
     hours = min(hours, 24)
     
     start_time = datetime.now() - timedelta(hours=hours)
+    include_spectral = request.args.get('spectral', default=0, type=int) == 1
+
+    if request.args.get('format') == 'binary':
+        return _binary_chart(start_time, request.args.get('since', type=int))
+
+    hot = _hot_window(start_time)
+    if hot:
+        ts, columns = hot.series(start_time)
+        chart_data = _series_chart(ts, columns, max(1, len(ts)))
+        if include_spectral:
+            conn, db_type = get_db_connection(db_router.ANALYTIC)
+            if not conn:
+                return jsonify({'error': 'Database connection failed'}), 500
+            try:
+                chart_data['spectral'] = _spectral_series(conn, db_type, start_time)
+                conn.close()
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+        return jsonify(chart_data), 200
     
-    conn, db_type = get_db_connection()
+    conn, db_type = get_db_connection(db_router.ANALYTIC)
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
 
     try:
+        if _rbe_enabled():
+            points = _fetch_reconstructed(conn, db_type, start_time, datetime.now())
+            chart_data = _downsample_chart(points, max(1, len(points)))
+            if include_spectral:
+                chart_data['spectral'] = _spectral_series(conn, db_type, start_time)
+            conn.close()
+            return jsonify(chart_data), 200
+
         chart_data = {
             'labels': [],
             'pressure': [],
@@ -530,8 +1048,7 @@ def get_chart_data():
         }
 
         if db_type == 'postgres':
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute("""
+            query = """
                 SELECT 
                     timestamp,
                     pressure,
@@ -540,9 +1057,16 @@ def get_chart_data():
                 FROM sensor_readings
                 WHERE timestamp >= %s
                 ORDER BY timestamp ASC
-            """, (start_time,))
-            readings = cursor.fetchall()
-            cursor.close()
+            """
+            if _sharded():
+                readings = _scatter_readings(query, (to_ms(start_time),))
+            else:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute(query, (to_ms(start_time),))
+                readings = [decode_row(row) for row in cursor.fetchall()]
+                cursor.close()
+            if include_spectral:
+                chart_data['spectral'] = _spectral_series(conn, db_type, start_time)
             conn.close()
 
             for reading in readings:
@@ -568,18 +1092,17 @@ def get_chart_data():
                 FROM sensor_readings
                 WHERE timestamp >= ?
                 ORDER BY timestamp ASC
-            """, (start_time,))
+            """, (to_ms(start_time),))
             rows = cursor.fetchall()
             cursor.close()
+            if include_spectral:
+                chart_data['spectral'] = _spectral_series(conn, db_type, start_time)
             conn.close()
 
             for row in rows:
-                r = dict(row)
+                r = decode_row(row)
                 ts = r.get('timestamp')
-                if isinstance(ts, str):
-                    # assume already formatted
-                    chart_data['labels'].append(ts)
-                elif isinstance(ts, datetime):
+                if isinstance(ts, datetime):
                     chart_data['labels'].append(ts.strftime('%H:%M:%S'))
                 else:
                     chart_data['labels'].append('')
@@ -593,6 +1116,854 @@ def get_chart_data():
         return jsonify({'error': str(e)}), 500
 
 
+def _as_datetime(value):
+    """Coerce a timestamp column value (datetime or ISO string) to datetime."""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _alert_types(reading):
+    """Return the list of threshold violations for a single reading."""
+    types = []
+    if (reading.get('moisture') or 0) > app.config['MOISTURE_THRESHOLD']:
+        types.append('high_moisture')
+    if (reading.get('acoustic') or 0) > app.config['ACOUSTIC_THRESHOLD']:
+        types.append('high_acoustic')
+    if (reading.get('pressure') or 0) < app.config['PRESSURE_MIN']:
+        types.append('low_pressure')
+    if (reading.get('pressure') or 0) > app.config['PRESSURE_MAX']:
+        types.append('high_pressure')
+    return types
+
+
+def _summarize_readings(readings):
+    """Compute the /api/sensors/statistics fields from a list of readings in one pass."""
+    stats = {'total_readings': float(len(readings))}
+    for field in ('pressure', 'moisture', 'acoustic', 'rssi'):
+        values = [float(r[field]) for r in readings if r.get(field) is not None]
+        n = len(values)
+        if n == 0:
+            stats[f'avg_{field}'] = None
+            stats[f'min_{field}'] = None
+            stats[f'max_{field}'] = None
+            if field != 'rssi':
+                stats[f'std_{field}'] = None
+            continue
+        mean = sum(values) / n
+        stats[f'avg_{field}'] = mean
+        stats[f'min_{field}'] = min(values)
+        stats[f'max_{field}'] = max(values)
+        if field != 'rssi':
+            # Sample standard deviation, matching PostgreSQL STDDEV()
+            if n > 1:
+                stats[f'std_{field}'] = (sum((v - mean) ** 2 for v in values) / (n - 1)) ** 0.5
+            else:
+                stats[f'std_{field}'] = None
+    return stats
+
+
+def _downsample_chart(readings, max_points):
+    """Build chart-data arrays from readings, bucket-averaging down to max_points."""
+    chart_data = {
+        'labels': [],
+        'pressure': [],
+        'moisture': [],
+        'acoustic': []
+    }
+    if not readings:
+        return chart_data
+
+    step = max(1, -(-len(readings) // max_points))  # ceil division
+    for i in range(0, len(readings), step):
+        bucket = readings[i:i + step]
+        ts = bucket[-1].get('timestamp')
+        if isinstance(ts, datetime):
+            chart_data['labels'].append(ts.strftime('%H:%M:%S'))
+        else:
+            chart_data['labels'].append(str(ts) if ts is not None else '')
+        for field in ('pressure', 'moisture', 'acoustic'):
+            chart_data[field].append(
+                sum(float(r.get(field) or 0) for r in bucket) / len(bucket)
+            )
+    return chart_data
+
+
+def _fetch_sparse(conn, db_type, start_time, end_time):
+    """Stored readings (hot and cold) from RBE_MAX_GAP_SECONDS before start_time to end_time."""
+    lookback = start_time - timedelta(seconds=app.config['RBE_MAX_GAP_SECONDS'])
+    ph = '%s' if db_type == 'postgres' else '?'
+    query = f"""
+        SELECT * FROM sensor_readings
+        WHERE timestamp >= {ph} AND timestamp < {ph}
+        ORDER BY timestamp ASC
+    """
+    if db_type == 'postgres' and _sharded():
+        return _scatter_readings(query, (to_ms(lookback), to_ms(end_time)), cold_window=(lookback, end_time))
+    cursor = conn.cursor(cursor_factory=RealDictCursor) if db_type == 'postgres' else conn.cursor()
+    cursor.execute(query, (to_ms(lookback), to_ms(end_time)))
+    rows = [decode_row(row) for row in cursor.fetchall()]
+    cursor.close()
+    return cold_storage.fetch_cold_readings(conn, db_type, lookback, end_time) + rows
+
+
+def _fetch_reconstructed(conn, db_type, start_time, end_time):
+    """Load readings (hot and cold) and resample report-by-exception devices onto the regular grid."""
+    return reconstruct(
+        _fetch_sparse(conn, db_type, start_time, end_time), start_time, end_time,
+        step_seconds=app.config['RBE_STEP_SECONDS'],
+        max_gap_seconds=app.config['RBE_MAX_GAP_SECONDS'],
+        method=app.config['RBE_METHOD'],
+        devices=_rbe_devices()
+    )
+
+
+def _alert_thresholds():
+    return {
+        'moisture_max': app.config['MOISTURE_THRESHOLD'],
+        'acoustic_max': app.config['ACOUSTIC_THRESHOLD'],
+        'pressure_min': app.config['PRESSURE_MIN'],
+        'pressure_max': app.config['PRESSURE_MAX']
+    }
+
+
+def _reconstructed_statistics(conn, db_type, start_time, end_time):
+    """(/api/sensors/statistics fields, threshold violation count) over the reconstructed grid.
+
+    The window is read and resampled RBE_STATISTICS_CHUNK_HOURS at a time
+    into mergeable partials, so memory stays bounded however long it is.
+    """
+    aggregates = cold_storage.empty_aggregates()
+    alerts_count = 0
+    devices = _rbe_devices()
+    thresholds = _alert_thresholds()
+    chunk = timedelta(hours=app.config['RBE_STATISTICS_CHUNK_HOURS'])
+    chunk_start = start_time
+    while chunk_start < end_time:
+        chunk_end = min(chunk_start + chunk, end_time)
+        alerts_count += reconstruction.accumulate(
+            aggregates, _fetch_sparse(conn, db_type, chunk_start, chunk_end), chunk_start, chunk_end,
+            step_seconds=app.config['RBE_STEP_SECONDS'],
+            max_gap_seconds=app.config['RBE_MAX_GAP_SECONDS'],
+            method=app.config['RBE_METHOD'],
+            devices=devices,
+            thresholds=thresholds
+        )
+        chunk_start = chunk_end
+    return sharding.statistics_from_aggregates(aggregates), alerts_count
+
+
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """Get latest reading, statistics, chart series and active alerts in one request.
+
+    Replaces the four separate calls the dashboard makes on load with a single
+    connection. Statistics and the alert count are SQL aggregates; rows are
+    only read for the chart window.
+    """
+    hours = request.args.get('hours', default=24, type=int)
+    hours = min(hours, app.config['MAX_TIME_RANGE_HOURS'])
+    chart_hours = request.args.get('chart_hours', default=1, type=int)
+    chart_hours = min(chart_hours, 24)
+    points = request.args.get('points', default=100, type=int)
+    points = max(1, min(points, app.config['MAX_CHART_POINTS']))
+    # chart=0 leaves the chart out (clients that sync chart-data with since=)
+    include_chart = request.args.get('chart', default=1, type=int) == 1
+
+    now = datetime.now()
+    start_time = now - timedelta(hours=max(hours, chart_hours))
+    stats_start = now - timedelta(hours=hours)
+    chart_start = now - timedelta(hours=chart_hours)
+    thresholds = _alert_thresholds()
+
+    hot = _hot_window(start_time)
+    latest = hot.latest() if hot else None
+    if latest:
+        stats = hot.statistics(stats_start)
+        stats['period_hours'] = hours
+        stats['start_time'] = stats_start.isoformat()
+        stats['end_time'] = now.isoformat()
+
+        _, columns = hot.series(stats_start)
+        pressure = np.nan_to_num(columns['pressure'])
+        violations = ((np.nan_to_num(columns['moisture']) > thresholds['moisture_max']) |
+                      (np.nan_to_num(columns['acoustic']) > thresholds['acoustic_max']) |
+                      (pressure < thresholds['pressure_min']) |
+                      (pressure > thresholds['pressure_max']))
+
+        chart_data = None
+        if include_chart:
+            ts, columns = hot.series(chart_start)
+            chart_data = _series_chart(ts, columns, points)
+        return jsonify({
+            'status': 'healthy',
+            'database': 'memory',
+            'timestamp': now.isoformat(),
+            'latest': latest,
+            'statistics': stats,
+            'chart': chart_data,
+            'alerts': {
+                'active': _alert_types(latest),
+                'count': int(violations.sum()),
+                'thresholds': thresholds
+            }
+        }), 200
+
+    conn, db_type = get_db_connection(db_router.LATEST)
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        hot = _hot_window()
+        latest = hot.latest() if hot else _latest_stored(conn, db_type)
+
+        if _rbe_enabled():
+            # Statistics and alerts are folded chunk by chunk on the reconstructed
+            # grid; per-point readings are only built for the (short) chart window
+            stats, alerts_count = _reconstructed_statistics(conn, db_type, stats_start, now)
+            chart_readings = _fetch_reconstructed(conn, db_type, chart_start, now) if include_chart else []
+            conn.close()
+        else:
+            # Aggregates in SQL; rows are only read for the (short) chart window
+            stats = _window_statistics(conn, db_type, stats_start, now)
+            alerts_count = _alert_count(conn, db_type, stats_start, now)
+            chart_readings = _fetch_window(conn, db_type, chart_start) if include_chart else []
+            conn.close()
+
+        stats['period_hours'] = hours
+        stats['start_time'] = stats_start.isoformat()
+        stats['end_time'] = now.isoformat()
+
+        chart_data = _downsample_chart(chart_readings, points) if include_chart else None
+
+        active_alerts = []
+        if latest:
+            active_alerts = _alert_types(latest)
+            for k in ('timestamp', 'created_at'):
+                v = latest.get(k)
+                if isinstance(v, datetime):
+                    latest[k] = v.isoformat()
+                elif not isinstance(v, str):
+                    latest[k] = None
+
+        return jsonify({
+            'status': 'healthy',
+            'database': db_type,
+            'timestamp': now.isoformat(),
+            'latest': latest,
+            'statistics': stats,
+            'chart': chart_data,
+            'alerts': {
+                'active': active_alerts,
+                'count': alerts_count,
+                'thresholds': thresholds
+            }
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+_features_table_ready = False
+
+
+@app.route('/api/acoustic/bursts', methods=['POST'])
+def upload_acoustic_bursts():
+    """Ingest a batch of raw acoustic sample bursts and store their spectral features
+
+    Body: {"bursts": [{"device_id", "timestamp", "sample_rate", "samples": [...]}, ...]}
+    """
+    global _features_table_ready
+
+    payload = request.get_json(silent=True) or {}
+    bursts = payload.get('bursts')
+    if not isinstance(bursts, list) or not bursts:
+        return jsonify({'error': 'Expected a non-empty "bursts" list'}), 400
+    if len(bursts) > app.config['MAX_BURSTS_PER_UPLOAD']:
+        return jsonify({'error': f"At most {app.config['MAX_BURSTS_PER_UPLOAD']} bursts per upload"}), 400
+
+    try:
+        for burst in bursts:
+            samples = burst['samples']
+            if not isinstance(samples, list) or not 16 <= len(samples) <= app.config['MAX_BURST_SAMPLES']:
+                raise ValueError(f"samples must be a list of 16-{app.config['MAX_BURST_SAMPLES']} values")
+            samples = np.asarray(samples, dtype=np.float64)
+            if samples.ndim != 1 or not np.isfinite(samples).all():
+                raise ValueError('samples must be a flat list of finite numbers')
+            burst['samples'] = samples
+            if int(burst['sample_rate']) <= 0:
+                raise ValueError('sample_rate must be positive')
+            burst['timestamp'] = (datetime.fromisoformat(burst['timestamp'])
+                                  if burst.get('timestamp') else datetime.now())
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid burst: {e}'}), 400
+
+    features = acoustic.analyze_bursts(
+        bursts,
+        high_band_min=app.config['ACOUSTIC_HIGH_BAND_MIN'],
+        kurtosis_max=app.config['ACOUSTIC_KURTOSIS_MAX']
+    )
+
+    conn, db_type = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        if db_type == 'postgres' and not _features_table_ready:
+            acoustic.ensure_features_table(conn, db_type)
+            _features_table_ready = True
+        acoustic.store_features(conn, db_type, features)
+        router.note_write()
+        conn.close()
+        for f in features:
+            f['timestamp'] = f['timestamp'].isoformat()
+        return jsonify({
+            'count': len(features),
+            'leak_signatures': sum(1 for f in features if f['leak_signature']),
+            'data': features
+        }), 201
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/acoustic/features', methods=['GET'])
+def get_acoustic_features():
+    """Get stored spectral features for acoustic bursts"""
+    hours = request.args.get('hours', default=24, type=int)
+    hours = min(hours, 168)
+    device_id = request.args.get('device')
+    leak_only = request.args.get('leak_only', default=0, type=int) == 1
+
+    start_time = datetime.now() - timedelta(hours=hours)
+
+    conn, db_type = get_db_connection(db_router.ANALYTIC)
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    try:
+        features = acoustic.fetch_features(conn, db_type, start_time, device_id, leak_only)
+        conn.close()
+        return jsonify({
+            'count': len(features),
+            'data': features
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+_localization_engine = None
+_localization_lock = threading.Lock()
+
+
+@app.route('/api/localization', methods=['GET'])
+def get_localization():
+    """Coarse leak-direction indicators for neighbouring node pairs
+
+    The engine keeps its correlation windows in memory; each call only reads
+    readings newer than the last one it has seen. The lock covers the cursor
+    read through ingest, so concurrent calls never ingest the same rows twice.
+    """
+    global _localization_engine
+
+    pairs = app.config['LOCALIZATION_PAIRS']
+    if not pairs:
+        return jsonify({'message': 'No node pairs configured (LOCALIZATION_PAIRS)', 'pairs': []}), 200
+
+    with _localization_lock:
+        if _localization_engine is None:
+            _localization_engine = LocalizationEngine(
+                pairs,
+                step_seconds=app.config['LOCALIZATION_STEP_SECONDS'],
+                window=app.config['LOCALIZATION_WINDOW'],
+                max_lag=app.config['LOCALIZATION_MAX_LAG']
+            )
+        engine = _localization_engine
+
+        since = engine.last_timestamp
+        if since is None:
+            # Bootstrap with enough history to fill every window
+            history = (app.config['LOCALIZATION_WINDOW'] + 2 * app.config['LOCALIZATION_MAX_LAG'] + 1)
+            since = datetime.now() - timedelta(seconds=history * app.config['LOCALIZATION_STEP_SECONDS'])
+
+        conn, db_type = get_db_connection(db_router.ANALYTIC)
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        try:
+            devices = sorted(engine.devices)
+            ph = '%s' if db_type == 'postgres' else '?'
+            query = f"""
+                SELECT device_id, timestamp, acoustic
+                FROM sensor_readings
+                WHERE timestamp > {ph} AND device_id IN ({', '.join([ph] * len(devices))})
+                ORDER BY timestamp ASC
+            """
+            if db_type == 'postgres' and _sharded():
+                # Every shard is asked: a device's rows stay on its old shard until rebalanced
+                rows = _scatter_readings(query, [to_ms(since)] + devices)
+            else:
+                cursor = conn.cursor()
+                cursor.execute(query, [to_ms(since)] + devices)
+                rows = [decode_row(dict(zip(('device_id', 'timestamp', 'acoustic'), tuple(row))))
+                        for row in cursor.fetchall()]
+                cursor.close()
+            conn.close()
+
+            for reading in rows:
+                engine.ingest(reading['device_id'], reading['timestamp'], reading['acoustic'])
+
+            return jsonify({
+                'step_seconds': engine.step_seconds,
+                'indicator': 'coarse',  # level-series correlation, not a leak position
+                'new_readings': len(rows),
+                'pairs': engine.results()
+            }), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+
+# Pipe-network topology
+
+_topology_index = None
+_topology_loaded = 0.0
+_topology_tables_ready = False
+_topology_lock = threading.Lock()
+
+
+def _topology():
+    """Current TopologyIndex, rebuilt from the database every TOPOLOGY_RELOAD_SECONDS.
+
+    Only one request reloads; the others keep answering from the previous
+    index, which also stays in service if the reload fails.
+    """
+    global _topology_index, _topology_loaded, _topology_tables_ready
+
+    index = _topology_index
+    if index is not None and time.time() - _topology_loaded < app.config['TOPOLOGY_RELOAD_SECONDS']:
+        return index
+    if not _topology_lock.acquire(blocking=index is None):
+        return index
+    try:
+        if _topology_index is not index:
+            return _topology_index  # reloaded while we waited
+        conn, db_type = get_db_connection(db_router.LATEST)
+        if not conn:
+            if index is None:
+                raise RuntimeError('Database connection failed')
+            return index
+        try:
+            if db_type == 'postgres' and not _topology_tables_ready:
+                topology.ensure_topology_tables(conn, db_type)
+                _topology_tables_ready = True
+            _topology_index = topology.TopologyIndex(topology.load_network(conn, db_type))
+        except Exception as e:
+            if index is None:
+                raise
+            print(f"⚠️  Topology reload failed, keeping the previous index: {e}")
+        finally:
+            conn.close()
+        _topology_loaded = time.time()
+        return _topology_index
+    finally:
+        _topology_lock.release()
+
+
+def _iso_times(reading):
+    for k in ('timestamp', 'created_at'):
+        if isinstance(reading.get(k), datetime):
+            reading[k] = reading[k].isoformat()
+    return reading
+
+
+def _node_readings(device_ids):
+    """Latest reading per device: hot-store ring lookups, else one index probe per device."""
+    hot = _hot_window()
+    if hot:
+        return hot.latest_by_device(device_ids)
+
+    conn, db_type = get_db_connection(db_router.LATEST)
+    if not conn:
+        raise RuntimeError('Database connection failed')
+    try:
+        if db_type == 'postgres' and _sharded():
+            readings = {}
+            for part in _scatter(lambda shard: topology.latest_readings(shard, 'postgres', device_ids)):
+                for device_id, reading in part.items():
+                    if device_id not in readings or reading['timestamp'] > readings[device_id]['timestamp']:
+                        readings[device_id] = reading
+        else:
+            readings = topology.latest_readings(conn, db_type, device_ids)
+    finally:
+        conn.close()
+    return {device_id: _iso_times(reading) for device_id, reading in readings.items()}
+
+
+def _with_readings(nodes):
+    """Attach each node's latest reading and its active alert types."""
+    readings = _node_readings([n['device_id'] for n in nodes])
+    for node in nodes:
+        reading = readings.get(node['device_id'])
+        node['reading'] = reading
+        node['alert_types'] = _alert_types(reading) if reading else []
+    return nodes
+
+
+def _segment_statistics(segment_devices, start_time, end_time):
+    """{segment_id: statistics} over the readings of each segment's nodes.
+
+    Served from the hot store's per-device running aggregates when the window
+    is in memory, else from one (device_id, timestamp) index range per segment.
+    """
+    hot = _hot_window(start_time)
+    if hot:
+        return {segment_id: hot.statistics(start_time, end_time, devices=device_ids)
+                for segment_id, device_ids in segment_devices.items()}
+
+    conn, db_type = get_db_connection(db_router.ANALYTIC)
+    if not conn:
+        raise RuntimeError('Database connection failed')
+    try:
+        stats = {}
+        for segment_id, device_ids in segment_devices.items():
+            if db_type == 'postgres' and _sharded() and device_ids:
+                merged = cold_storage.empty_aggregates()
+                for partial in _scatter(lambda shard: topology.device_aggregates(
+                        shard, 'postgres', device_ids, start_time, end_time)):
+                    cold_storage.merge_aggregates(merged, partial)
+            else:
+                merged = topology.device_aggregates(conn, db_type, device_ids, start_time, end_time)
+            stats[segment_id] = sharding.statistics_from_aggregates(merged)
+    finally:
+        conn.close()
+    return stats
+
+
+def _bbox_arg():
+    value = request.args.get('bbox')
+    if not value:
+        raise ValueError('bbox=min_x,min_y,max_x,max_y is required')
+    return topology.parse_bbox(value)
+
+
+@app.route('/api/topology', methods=['GET', 'PUT'])
+def topology_network():
+    """Topology index summary (GET) or replace the stored network (PUT, admin only)
+
+    PUT body: {"pipes": [...], "segments": [...], "nodes": [...]} with the
+    columns of the pipes / pipe_segments / node_placements tables.
+    """
+    global _topology_index, _topology_loaded, _topology_tables_ready
+
+    if request.method == 'GET':
+        try:
+            return jsonify(_topology().status()), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    denied = _require_admin()
+    if denied:
+        return denied
+    network = request.get_json(silent=True)
+    if not isinstance(network, dict):
+        return jsonify({'error': 'Expected a JSON object with pipes, segments and nodes'}), 400
+
+    conn, db_type = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+    try:
+        if db_type == 'postgres' and not _topology_tables_ready:
+            topology.ensure_topology_tables(conn, db_type)
+            _topology_tables_ready = True
+        index = topology.save_network(conn, db_type, network)
+    except (KeyError, TypeError, ValueError) as e:
+        conn.close()
+        return jsonify({'error': f'Invalid network: {e}'}), 400
+    except Exception as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 500
+    conn.close()
+    router.note_write()
+    with _topology_lock:
+        _topology_index, _topology_loaded = index, time.time()
+    return jsonify(index.status()), 200
+
+
+@app.route('/api/topology/nodes', methods=['GET'])
+def get_topology_nodes():
+    """Nodes placed inside a bounding box (readings=1 adds latest readings)"""
+    try:
+        bbox = _bbox_arg()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid bbox: {e}'}), 400
+
+    try:
+        nodes = _topology().nodes_in_bbox(bbox)
+        if request.args.get('readings', default=0, type=int) == 1:
+            _with_readings(nodes)
+        return jsonify({
+            'count': len(nodes),
+            'bbox': list(bbox),
+            'data': nodes
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/topology/nodes/<device_id>/<direction>', methods=['GET'])
+def trace_topology_node(device_id, direction):
+    """Nodes and segments upstream or downstream of a node, nearest first"""
+    if direction not in ('upstream', 'downstream'):
+        return jsonify({'error': 'Endpoint not found'}), 404
+    max_distance = request.args.get('max_distance_m', type=float)
+
+    try:
+        result = _topology().trace(device_id, direction, max_distance)
+        if result is None:
+            return jsonify({'error': f'Unknown node {device_id}'}), 404
+        if request.args.get('readings', default=0, type=int) == 1:
+            _with_readings(result['nodes'])
+        result['count'] = len(result['nodes'])
+        return jsonify(result), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/topology/segments', methods=['GET'])
+def get_topology_segments():
+    """Segments crossing a bounding box (stats=1 adds per-segment statistics)"""
+    try:
+        bbox = _bbox_arg()
+        start_time, end_time, hours = _time_window()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+
+    try:
+        segments = _topology().segments_in_bbox(bbox)
+        if request.args.get('stats', default=0, type=int) == 1:
+            stats = _segment_statistics({s['id']: s['nodes'] for s in segments}, start_time, end_time)
+            for segment in segments:
+                segment['statistics'] = stats[segment['id']]
+        return jsonify({
+            'count': len(segments),
+            'bbox': list(bbox),
+            'start_time': start_time.isoformat(),
+            'end_time': end_time.isoformat(),
+            'data': segments
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/topology/segments/<segment_id>', methods=['GET'])
+def get_topology_segment(segment_id):
+    """One segment with its nodes' latest readings and window statistics"""
+    try:
+        start_time, end_time, hours = _time_window()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid time window: {e}'}), 400
+
+    try:
+        index = _topology()
+        segment = index.segment(segment_id)
+        if segment is None:
+            return jsonify({'error': f'Unknown segment {segment_id}'}), 404
+        segment['nodes'] = _with_readings([index.node(d) for d in segment['nodes']])
+        stats = _segment_statistics({segment_id: [n['device_id'] for n in segment['nodes']]},
+                                    start_time, end_time)[segment_id]
+        stats['period_hours'] = hours
+        stats['start_time'] = start_time.isoformat()
+        stats['end_time'] = end_time.isoformat()
+        segment['statistics'] = stats
+        return jsonify(segment), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Admission control and load shedding
+
+admission_control = admission.AdmissionController(
+    capacity=app.config['ADMISSION_CAPACITY'],
+    reserved=app.config['ADMISSION_RESERVED'],
+    class_limits={
+        admission.ANALYTIC: app.config['ADMISSION_ANALYTIC_LIMIT'],
+        admission.INGEST: app.config['ADMISSION_INGEST_LIMIT']
+    },
+    rate=app.config['RATE_LIMIT_PER_SECOND'],
+    burst=app.config['RATE_LIMIT_BURST'],
+    retry_after=app.config['ADMISSION_RETRY_AFTER']
+)
+
+# View function -> endpoint class; anything not listed (static files, admin) is not limited
+ENDPOINT_CLASSES = {
+    'health_check': admission.CRITICAL,
+    'get_latest_reading': admission.CRITICAL,
+    'get_alerts': admission.CRITICAL,
+    'get_dashboard': admission.CRITICAL,
+    'get_recent_readings': admission.ANALYTIC,
+    'get_readings_by_range': admission.ANALYTIC,
+    'get_statistics': admission.ANALYTIC,
+    'get_chart_data': admission.ANALYTIC,
+    'get_acoustic_features': admission.ANALYTIC,
+    'get_localization': admission.ANALYTIC,
+    'topology_network': admission.ANALYTIC,
+    'get_topology_nodes': admission.ANALYTIC,
+    'trace_topology_node': admission.ANALYTIC,
+    'get_topology_segments': admission.ANALYTIC,
+    'get_topology_segment': admission.ANALYTIC,
+    'upload_acoustic_bursts': admission.INGEST
+}
+
+# Endpoints whose cost grows with the requested time window
+WINDOWED_ENDPOINTS = {'get_alerts', 'get_dashboard', 'get_readings_by_range', 'get_statistics',
+                      'get_chart_data', 'get_acoustic_features', 'get_topology_segments',
+                      'get_topology_segment'}
+
+
+def _request_cost():
+    """Cost units for this request: one per ADMISSION_COST_HOURS of requested window."""
+    if request.endpoint not in WINDOWED_ENDPOINTS:
+        return 1
+    if request.args.get('since', type=int) is not None:
+        return 1  # delta polls only read rows newer than the cursor
+    try:
+        start_time, end_time, _ = _time_window()
+    except ValueError:
+        return 1  # the endpoint itself answers 400
+    hours = max((end_time - start_time).total_seconds() / 3600, 0)
+    return max(1, math.ceil(hours / app.config['ADMISSION_COST_HOURS']))
+
+
+@app.before_request
+def _admit_request():
+    endpoint_class = ENDPOINT_CLASSES.get(request.endpoint)
+    if not app.config['ADMISSION_ENABLED'] or endpoint_class is None:
+        return None
+
+    cost = _request_cost()
+    status, retry_after = admission_control.admit(request.remote_addr, endpoint_class, cost)
+    if status is not None:
+        message = 'Rate limit exceeded' if status == 429 else 'Server busy, retry shortly'
+        response = jsonify({'error': message, 'retry_after': retry_after})
+        response.status_code = status
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    g.admission = (endpoint_class, cost)
+    return None
+
+
+@app.teardown_request
+def _release_admission(exc):
+    admitted = g.pop('admission', None)
+    if admitted:
+        admission_control.release(*admitted)
+
+
+# Admin diagnostics: per-request profiling and the stack sampler
+
+sampler = profiling.StackSampler()
+
+
+@app.before_request
+def _start_request_profile():
+    """Profile this request when ?profile=1 (or inline) comes with a valid admin token."""
+    if request.args.get('profile') in ('1', 'inline') and profiling.authorized(request, app.config['ADMIN_TOKEN']):
+        profile = profiling.RequestProfile(request.method, request.full_path)
+        if profile.start():
+            g.profile = profile
+        else:
+            g.profile_busy = True
+
+
+@app.after_request
+def _finish_request_profile(response):
+    if g.pop('profile_busy', False):
+        response.headers['X-Profile-Error'] = 'another request is being profiled'
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+
+    profile.stop()
+    report = profile.report(status=response.status_code)
+    try:
+        profile.save(app.config['PROFILE_DIR'], report)
+    except OSError as e:
+        print(f"⚠️  Could not save profile {profile.id}: {e}")
+    print(f"🔬 Profiled {profile.method} {profile.path}: {report['total_ms']:.1f} ms "
+          f"({report['sql_count']} SQL, {report['sql_ms']:.1f} ms)")
+
+    if request.args.get('profile') == 'inline':
+        response = jsonify(report)
+    response.headers['X-Profile-Id'] = profile.id
+    response.headers['Server-Timing'] = (f"sql;dur={report['sql_ms']:.1f}, "
+                                         f"app;dur={report['total_ms'] - report['sql_ms']:.1f}")
+    return response
+
+
+def _require_admin():
+    if not profiling.authorized(request, app.config['ADMIN_TOKEN']):
+        return jsonify({'error': 'Admin token required'}), 403
+    return None
+
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_request_profiles():
+    """List recent per-request profiles"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    return jsonify({'profiles': profiling.list_profiles(app.config['PROFILE_DIR'])}), 200
+
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def get_request_profile(profile_id):
+    """Get one profile report (or ?format=prof for the raw pstats file)"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    extension = 'prof' if request.args.get('format') == 'prof' else 'json'
+    filename = f'{profile_id}.{extension}'
+    if not os.path.exists(os.path.join(app.config['PROFILE_DIR'], filename)):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_from_directory(app.config['PROFILE_DIR'], filename, as_attachment=extension == 'prof')
+
+
+@app.route('/api/admin/sampler', methods=['GET', 'POST'])
+def stack_sampler():
+    """Start/stop the stack sampler (POST) or read its results (GET)"""
+    denied = _require_admin()
+    if denied:
+        return denied
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        action = data.get('action')
+        if action == 'start':
+            interval = min(max(float(data.get('interval', 0.01)), 0.001), 1.0)
+            started = sampler.start(interval)
+            print(f"🔬 Stack sampler {'started' if started else 'already running'} ({interval * 1000:.0f} ms)")
+        elif action == 'stop':
+            sampler.stop()
+            print(f"🔬 Stack sampler stopped after {sampler.samples} samples")
+        else:
+            return jsonify({'error': "action must be 'start' or 'stop'"}), 400
+
+    if request.args.get('format') == 'folded':
+        return Response(sampler.folded(), mimetype='text/plain')
+    return jsonify(sampler.summary()), 200
+
+
 # Static file routes
 @app.route('/css/<path:filename>')
 def serve_css(filename):
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+LeakSense binary columnar chart payload
+/api/sensors/chart-data?format=binary returns the full-resolution chart window
+as little-endian typed arrays, so the browser decodes and decimates it in a
+Web Worker (web_frontend/js/chart-worker.js) instead of parsing JSON labels
+
+Layout (little-endian):
+    offset 0   4 bytes  magic b'LSC1'
+    offset 4   uint32   point count n
+    offset 8   uint16   value column count c
+    offset 10  uint16   flags (0)
+    offset 12  uint32   header length H, a multiple of 8
+    offset 16  ASCII    comma-separated column names, zero-padded to H
+    offset H   int64[n]    timestamps, epoch milliseconds, ascending
+    then       float32[n]  one array per column, in name order; NaN = no value
+"""
+
+import struct
+
+import numpy as np
+
+MAGIC = b'LSC1'
+CONTENT_TYPE = 'application/vnd.leaksense.columns'
+FIELDS = ('pressure', 'moisture', 'acoustic')
+_HEADER = struct.Struct('<4sIHHI')
+
+
+def encode(ts_ms, columns, fields=FIELDS):
+    """Pack epoch-ms timestamps and per-field values into one payload."""
+    ts = np.ascontiguousarray(ts_ms, dtype='<i8')
+    names = ','.join(fields).encode('ascii')
+    names += b'\0' * (-(_HEADER.size + len(names)) % 8)
+    parts = [_HEADER.pack(MAGIC, len(ts), len(fields), 0, _HEADER.size + len(names)), names, ts.tobytes()]
+    for field in fields:
+        values = np.ascontiguousarray(columns[field], dtype='<f4')
+        if len(values) != len(ts):
+            raise ValueError(f"{field} has {len(values)} values for {len(ts)} timestamps")
+        parts.append(values.tobytes())
+    return b''.join(parts)
+
+
+def decode(payload):
+    """Inverse of encode(): (int64 timestamps, {field: float32 values})."""
+    magic, count, column_count, _, header_length = _HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError('Not a LeakSense chart payload')
+    names = payload[_HEADER.size:header_length].rstrip(b'\0').decode('ascii')
+    fields = names.split(',') if names else []
+    ts = np.frombuffer(payload, dtype='<i8', count=count, offset=header_length)
+    offset = header_length + 8 * count
+    columns = {}
+    for field in fields[:column_count]:
+        columns[field] = np.frombuffer(payload, dtype='<f4', count=count, offset=offset)
+        offset += 4 * count
+    return ts, columns
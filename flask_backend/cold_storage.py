@@ -0,0 +1,612 @@
+#!/usr/bin/env python3
+"""
+LeakSense cold storage tier
+Seals aged sensor_readings rows into compressed per-device time chunks
+(delta-of-delta timestamps, delta + zig-zag varint stored integers) and
+reads them back
+"""
+
+import json
+import math
+import struct
+import sys
+from datetime import datetime, timedelta
+
+from storage_format import (to_ms, from_ms, decode_row, scale, unscale, is_legacy,
+                            NOW_MS_POSTGRES, NOW_MS_SQLITE)
+
+# 1: float32 XOR values (still decoded), 2: varint stored integers
+BLOCK_VERSION = 2
+HEADER = struct.Struct('>BI')  # version, row count
+
+# Value columns, kept as their stored scaled integers. rssi/snr may be NULL.
+VALUE_FIELDS = ('pressure', 'moisture', 'acoustic', 'rssi', 'snr')
+# Columns with pre-computed aggregates in each block (used by statistics)
+AGGREGATE_FIELDS = ('pressure', 'moisture', 'acoustic', 'rssi')
+
+# Times are epoch ms, like sensor_readings.timestamp
+CREATE_BLOCKS_POSTGRES = f"""
+CREATE TABLE IF NOT EXISTS sensor_blocks (
+    id SERIAL PRIMARY KEY,
+    device_id VARCHAR(32) NOT NULL,
+    chunk_start BIGINT NOT NULL,
+    chunk_end BIGINT NOT NULL,
+    row_count INTEGER NOT NULL,
+    aggregates TEXT NOT NULL,
+    payload BYTEA NOT NULL,
+    sealed_at BIGINT NOT NULL DEFAULT {NOW_MS_POSTGRES},
+    UNIQUE (device_id, chunk_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_blocks_chunk ON sensor_blocks(chunk_start, chunk_end);
+"""
+
+CREATE_BLOCKS_SQLITE = f"""
+CREATE TABLE IF NOT EXISTS sensor_blocks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL,
+    chunk_start INTEGER NOT NULL,
+    chunk_end INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    aggregates TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    sealed_at INTEGER NOT NULL DEFAULT {NOW_MS_SQLITE},
+    UNIQUE (device_id, chunk_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_blocks_chunk ON sensor_blocks(chunk_start, chunk_end);
+"""
+
+# Tables created with TIMESTAMP chunk bounds. Python wrote chunk_start and
+# chunk_end as local time; sealed_at is the database default.
+MIGRATE_BLOCKS_POSTGRES = f"""
+ALTER TABLE sensor_blocks ALTER COLUMN sealed_at DROP DEFAULT;
+ALTER TABLE sensor_blocks
+    ALTER COLUMN chunk_start TYPE BIGINT USING round(EXTRACT(EPOCH FROM chunk_start::timestamptz) * 1000),
+    ALTER COLUMN chunk_end TYPE BIGINT USING round(EXTRACT(EPOCH FROM chunk_end::timestamptz) * 1000),
+    ALTER COLUMN sealed_at TYPE BIGINT USING round(EXTRACT(EPOCH FROM sealed_at::timestamptz) * 1000);
+ALTER TABLE sensor_blocks ALTER COLUMN sealed_at SET DEFAULT {NOW_MS_POSTGRES};
+"""
+
+MIGRATE_BLOCKS_SQLITE = f"""
+DROP INDEX IF EXISTS idx_blocks_chunk;
+ALTER TABLE sensor_blocks RENAME TO sensor_blocks_legacy;
+{CREATE_BLOCKS_SQLITE}
+INSERT INTO sensor_blocks (id, device_id, chunk_start, chunk_end, row_count, aggregates, payload, sealed_at)
+SELECT
+    id, device_id,
+    CAST(ROUND((julianday(chunk_start, 'utc') - 2440587.5) * 86400000) AS INTEGER),
+    CAST(ROUND((julianday(chunk_end, 'utc') - 2440587.5) * 86400000) AS INTEGER),
+    row_count, aggregates, payload,
+    CAST(ROUND((julianday(sealed_at) - 2440587.5) * 86400000) AS INTEGER)
+FROM sensor_blocks_legacy;
+DROP TABLE sensor_blocks_legacy;
+"""
+
+
+class BitWriter:
+    """Append-only big-endian bit stream"""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.acc = 0
+        self.nbits = 0
+
+    def write(self, value, nbits):
+        self.acc = (self.acc << nbits) | (value & ((1 << nbits) - 1))
+        self.nbits += nbits
+        while self.nbits >= 8:
+            self.nbits -= 8
+            self.buf.append((self.acc >> self.nbits) & 0xFF)
+        self.acc &= (1 << self.nbits) - 1
+
+    def getvalue(self):
+        if self.nbits:
+            return bytes(self.buf) + bytes([(self.acc << (8 - self.nbits)) & 0xFF])
+        return bytes(self.buf)
+
+
+class BitReader:
+    """Sequential reader over a big-endian bit stream"""
+
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.pos = offset * 8
+
+    def read(self, nbits):
+        if nbits == 0:
+            return 0
+        start = self.pos >> 3
+        shift = self.pos & 7
+        nbytes = (shift + nbits + 7) >> 3
+        window = self.data[start:start + nbytes]
+        chunk = int.from_bytes(window, 'big') << (8 * (nbytes - len(window)))
+        self.pos += nbits
+        return (chunk >> (nbytes * 8 - shift - nbits)) & ((1 << nbits) - 1)
+
+    def read_signed(self, nbits):
+        value = self.read(nbits)
+        if value >= 1 << (nbits - 1):
+            value -= 1 << nbits
+        return value
+
+
+# Delta-of-delta buckets: (prefix, prefix bits, value bits)
+_DOD_BUCKETS = (
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12),
+    (0b1111, 4, 64),
+)
+
+
+def _encode_timestamps(writer, millis):
+    writer.write(millis[0], 64)
+    prev, prev_delta = millis[0], 0
+    for ts in millis[1:]:
+        delta = ts - prev
+        dod = delta - prev_delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+                if -(1 << (value_bits - 1)) <= dod < (1 << (value_bits - 1)):
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod, value_bits)
+                    break
+        prev, prev_delta = ts, delta
+
+
+def _decode_timestamps(reader, count):
+    millis = [reader.read_signed(64)]
+    prev_delta = 0
+    for _ in range(count - 1):
+        if reader.read(1) == 0:
+            dod = 0
+        elif reader.read(1) == 0:
+            dod = reader.read_signed(7)
+        elif reader.read(1) == 0:
+            dod = reader.read_signed(9)
+        elif reader.read(1) == 0:
+            dod = reader.read_signed(12)
+        else:
+            dod = reader.read_signed(64)
+        prev_delta += dod
+        millis.append(millis[-1] + prev_delta)
+    return millis
+
+
+def _bits_float(bits):
+    value = struct.unpack('>f', struct.pack('>I', bits))[0]
+    return None if math.isnan(value) else value
+
+
+def _decode_floats(reader, count):
+    prev = reader.read(32)
+    values = [_bits_float(prev)]
+    lead, trail = 0, 0
+    for _ in range(count - 1):
+        if reader.read(1) == 1:
+            if reader.read(1) == 1:
+                lead = reader.read(5)
+                length = reader.read(5) + 1
+                trail = 32 - lead - length
+            prev ^= reader.read(32 - lead - trail) << trail
+        values.append(_bits_float(prev))
+    return values
+
+
+def _write_varint(buf, n):
+    while n >= 0x80:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def _read_varint(data, pos):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _encode_ints(buf, values):
+    """Append integers as delta-to-previous tokens (varints).
+
+    0 is NULL; 1 starts a run of unchanged values, followed by the run length
+    minus one; otherwise zig-zag(delta) + 1. Deltas are taken from the
+    previous non-NULL value.
+    """
+    prev = 0
+    i = 0
+    while i < len(values):
+        value = values[i]
+        i += 1
+        if value is None:
+            buf.append(0)
+            continue
+        delta = value - prev
+        if delta == 0:
+            run = 1
+            while i < len(values) and values[i] == prev:
+                run += 1
+                i += 1
+            buf.append(1)
+            _write_varint(buf, run - 1)
+            continue
+        _write_varint(buf, (delta << 1 if delta > 0 else (-delta << 1) - 1) + 1)
+        prev = value
+
+
+def _decode_ints(data, pos, count):
+    values = []
+    prev = 0
+    while len(values) < count:
+        n, pos = _read_varint(data, pos)
+        if n == 0:
+            values.append(None)
+        elif n == 1:
+            run, pos = _read_varint(data, pos)
+            values.extend([prev] * (run + 1))
+        else:
+            n -= 1
+            prev += -((n + 1) >> 1) if n & 1 else n >> 1
+            values.append(prev)
+    return values, pos
+
+
+def _to_millis(ts):
+    return int(round(ts.timestamp() * 1000))
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return None
+
+
+def encode_block(readings):
+    """Encode readings (sorted by timestamp) into a compressed block payload.
+
+    Timestamps are a delta-of-delta bit stream. Each value column follows as
+    varints of its stored scaled integers, so blocks are lossless.
+    """
+    writer = BitWriter()
+    _encode_timestamps(writer, [_to_millis(_as_datetime(r['timestamp'])) for r in readings])
+    body = bytearray(writer.getvalue())
+    for field in VALUE_FIELDS:
+        _encode_ints(body, [scale(field, r.get(field)) for r in readings])
+    return HEADER.pack(BLOCK_VERSION, len(readings)) + bytes(body)
+
+
+def _stored_resolution(field, value):
+    """Round a decoded float32 (version 1 blocks) to the resolution of the scaled-integer column."""
+    if value is None:
+        return None
+    return unscale(field, scale(field, value))
+
+
+def decode_block(payload, device_id=None):
+    """Decode a block payload back into reading dicts.
+
+    Values come back exactly as decode_row() returns the unsealed row;
+    id and created_at are not kept in blocks and are None.
+    """
+    payload = bytes(payload)
+    version, count = HEADER.unpack_from(payload)
+    if version not in (1, BLOCK_VERSION):
+        raise ValueError(f"Unsupported block version: {version}")
+    if count == 0:
+        return []
+    reader = BitReader(payload, HEADER.size)
+    millis = _decode_timestamps(reader, count)
+    if version == 1:
+        columns = {field: [_stored_resolution(field, v) for v in _decode_floats(reader, count)]
+                   for field in VALUE_FIELDS}
+    else:
+        pos = (reader.pos + 7) // 8
+        columns = {}
+        for field in VALUE_FIELDS:
+            values, pos = _decode_ints(payload, pos, count)
+            columns[field] = [unscale(field, v) for v in values]
+
+    readings = []
+    for i, ms in enumerate(millis):
+        rssi = columns['rssi'][i]
+        readings.append({
+            'id': None,
+            'device_id': device_id,
+            'pressure': columns['pressure'][i],
+            'moisture': columns['moisture'][i],
+            'acoustic': columns['acoustic'][i],
+            'rssi': int(round(rssi)) if rssi is not None else None,
+            'snr': columns['snr'][i],
+            'timestamp': datetime.fromtimestamp(ms / 1000.0),
+            'created_at': None
+        })
+    return readings
+
+
+def empty_aggregates():
+    return {field: {'count': 0, 'sum': 0.0, 'sumsq': 0.0, 'min': None, 'max': None}
+            for field in AGGREGATE_FIELDS}
+
+
+def accumulate(aggregates, readings):
+    """Fold readings into mergeable count/sum/sumsq/min/max partials."""
+    for field in AGGREGATE_FIELDS:
+        agg = aggregates[field]
+        for r in readings:
+            value = r.get(field)
+            if value is None:
+                continue
+            value = float(value)
+            agg['count'] += 1
+            agg['sum'] += value
+            agg['sumsq'] += value * value
+            agg['min'] = value if agg['min'] is None else min(agg['min'], value)
+            agg['max'] = value if agg['max'] is None else max(agg['max'], value)
+    return aggregates
+
+
+def merge_aggregates(target, other):
+    for field in AGGREGATE_FIELDS:
+        a, b = target[field], other[field]
+        a['count'] += b['count']
+        a['sum'] += b['sum']
+        a['sumsq'] += b['sumsq']
+        for key, pick in (('min', min), ('max', max)):
+            if b[key] is not None:
+                a[key] = b[key] if a[key] is None else pick(a[key], b[key])
+    return target
+
+
+def ensure_blocks_table(conn, db_type):
+    """Create the sensor_blocks table if missing (idempotent)."""
+    cursor = conn.cursor()
+    if db_type == 'postgres':
+        cursor.execute(CREATE_BLOCKS_POSTGRES)
+    else:
+        cursor.executescript(CREATE_BLOCKS_SQLITE)
+    conn.commit()
+    cursor.close()
+
+
+def migrate_blocks(conn, db_type, timezone=None):
+    """Convert a sensor_blocks table with TIMESTAMP chunk bounds to epoch ms (single transaction).
+
+    timezone has the same meaning as for storage_format.migrate(). Returns
+    False when there is nothing to convert.
+    """
+    if not is_legacy(conn, db_type, 'sensor_blocks', 'chunk_start'):
+        return False
+    cursor = conn.cursor()
+    try:
+        if db_type == 'postgres':
+            if timezone:
+                cursor.execute("SET LOCAL TIME ZONE %s", (timezone,))
+            cursor.execute(MIGRATE_BLOCKS_POSTGRES)
+            conn.commit()
+        else:
+            cursor.executescript(f"BEGIN;\n{MIGRATE_BLOCKS_SQLITE}\nCOMMIT;")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return True
+
+
+def _chunk_floor(ts, chunk_hours):
+    span = chunk_hours * 3600
+    return datetime.fromtimestamp(math.floor(ts.timestamp() / span) * span)
+
+
+def _fetch_blocks(conn, db_type, start, end):
+    ph = '%s' if db_type == 'postgres' else '?'
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT device_id, chunk_start, chunk_end, row_count, aggregates, payload
+        FROM sensor_blocks
+        WHERE chunk_end > {ph} AND chunk_start < {ph}
+        ORDER BY chunk_start ASC, device_id ASC
+    """, (to_ms(start), to_ms(end)))
+    rows = cursor.fetchall()
+    cursor.close()
+    return [tuple(row) for row in rows]
+
+
+def fetch_cold_readings(conn, db_type, start, end):
+    """Return sealed readings with start <= timestamp < end, oldest first.
+
+    Returns an empty list when the sensor_blocks table has not been created.
+    """
+    try:
+        blocks = _fetch_blocks(conn, db_type, start, end)
+    except Exception as e:
+        print(f"Cold storage unavailable: {e}")
+        conn.rollback()
+        return []
+
+    readings = []
+    for device_id, _, _, _, _, payload in blocks:
+        for r in decode_block(payload, device_id):
+            if start <= r['timestamp'] < end:
+                readings.append(r)
+    readings.sort(key=lambda r: r['timestamp'])
+    return readings
+
+
+def cold_aggregates(conn, db_type, start, end):
+    """Return mergeable partial aggregates for sealed readings in [start, end).
+
+    Blocks fully inside the window use their stored aggregates; only boundary
+    blocks are decoded.
+    """
+    aggregates = empty_aggregates()
+    try:
+        blocks = _fetch_blocks(conn, db_type, start, end)
+    except Exception as e:
+        print(f"Cold storage unavailable: {e}")
+        conn.rollback()
+        return aggregates
+
+    for device_id, chunk_start, chunk_end, _, stored, payload in blocks:
+        if from_ms(chunk_start) >= start and from_ms(chunk_end) <= end:
+            merge_aggregates(aggregates, json.loads(stored))
+        else:
+            inside = [r for r in decode_block(payload, device_id) if start <= r['timestamp'] < end]
+            accumulate(aggregates, inside)
+    return aggregates
+
+
+def merge_statistics(stats, aggregates):
+    """Fold cold partial aggregates into a /api/sensors/statistics result in place."""
+    hot_count = int(stats.get('total_readings') or 0)
+    cold_count = aggregates['pressure']['count']
+    if cold_count == 0:
+        return stats
+
+    for field in AGGREGATE_FIELDS:
+        cold = aggregates[field]
+        if cold['count'] == 0:
+            continue
+        # rssi has no per-column count in the hot query; weight by row count
+        n = hot_count
+        avg = stats.get(f'avg_{field}')
+        total = cold['count'] + (n if avg is not None else 0)
+        hot_sum = avg * n if avg is not None else 0.0
+        mean = (hot_sum + cold['sum']) / total
+        stats[f'avg_{field}'] = mean
+
+        for key, pick in (('min', min), ('max', max)):
+            if f'{key}_{field}' in stats or field != 'rssi':
+                hot_value = stats.get(f'{key}_{field}')
+                stats[f'{key}_{field}'] = cold[key] if hot_value is None else pick(hot_value, cold[key])
+
+        if f'std_{field}' in stats:
+            std = stats.get(f'std_{field}')
+            hot_sumsq = 0.0
+            if avg is not None and n:
+                hot_sumsq = (std or 0.0) ** 2 * (n - 1) + n * avg * avg
+            if total > 1:
+                variance = (hot_sumsq + cold['sumsq'] - total * mean * mean) / (total - 1)
+                stats[f'std_{field}'] = math.sqrt(max(variance, 0.0))
+
+    stats['total_readings'] = float(hot_count + cold_count)
+    return stats
+
+
+def seal_old_readings(conn, db_type, older_than_days=30, chunk_hours=24):
+    """Move readings older than the cutoff into compressed per-device blocks.
+
+    Works one chunk at a time and commits after each, so an interrupted run can
+    simply be restarted. Late rows for an already sealed chunk are merged into
+    the existing block.
+
+    Returns a (blocks_written, rows_sealed) tuple.
+    """
+    ph = '%s' if db_type == 'postgres' else '?'
+    cutoff = _chunk_floor(datetime.now() - timedelta(days=older_than_days), chunk_hours)
+    ensure_blocks_table(conn, db_type)
+
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MIN(timestamp) FROM sensor_readings WHERE timestamp < {ph}", (to_ms(cutoff),))
+    oldest = from_ms(cursor.fetchone()[0])
+    cursor.close()
+    if oldest is None:
+        return 0, 0
+
+    blocks_written = rows_sealed = 0
+    chunk_start = _chunk_floor(oldest, chunk_hours)
+    while chunk_start < cutoff:
+        chunk_end = chunk_start + timedelta(hours=chunk_hours)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT device_id, timestamp, pressure, moisture, acoustic, rssi, snr
+                FROM sensor_readings
+                WHERE timestamp >= {ph} AND timestamp < {ph}
+                ORDER BY device_id ASC, timestamp ASC
+            """, (to_ms(chunk_start), to_ms(chunk_end)))
+            columns = ('device_id', 'timestamp') + VALUE_FIELDS
+            by_device = {}
+            for row in cursor.fetchall():
+                reading = decode_row(zip(columns, tuple(row)))
+                by_device.setdefault(reading['device_id'], []).append(reading)
+
+            for device_id, readings in by_device.items():
+                cursor.execute(f"""
+                    SELECT payload FROM sensor_blocks
+                    WHERE device_id = {ph} AND chunk_start = {ph}
+                """, (device_id, to_ms(chunk_start)))
+                existing = cursor.fetchone()
+                if existing:
+                    readings = decode_block(existing[0], device_id) + readings
+                    readings.sort(key=lambda r: r['timestamp'])
+                    cursor.execute(f"""
+                        DELETE FROM sensor_blocks
+                        WHERE device_id = {ph} AND chunk_start = {ph}
+                    """, (device_id, to_ms(chunk_start)))
+
+                payload = encode_block(readings)
+                aggregates = accumulate(empty_aggregates(), readings)
+                if db_type == 'postgres':
+                    import psycopg2
+                    payload = psycopg2.Binary(payload)
+                cursor.execute(f"""
+                    INSERT INTO sensor_blocks
+                        (device_id, chunk_start, chunk_end, row_count, aggregates, payload)
+                    VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+                """, (device_id, to_ms(chunk_start), to_ms(chunk_end), len(readings), json.dumps(aggregates),
+                      payload))
+                blocks_written += 1
+
+            cursor.execute(f"""
+                DELETE FROM sensor_readings
+                WHERE timestamp >= {ph} AND timestamp < {ph}
+            """, (to_ms(chunk_start), to_ms(chunk_end)))
+            rows_sealed += cursor.rowcount
+            conn.commit()
+        except Exception as e:
+            print(f"❌ Error sealing chunk {chunk_start.isoformat()}: {e}")
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        chunk_start = chunk_end
+
+    return blocks_written, rows_sealed
+
+
+def main():
+    """Seal aged readings (run periodically, e.g. from cron)"""
+    from app import app, get_db_connection, shards, _sharded
+
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else app.config['COLD_SEAL_AFTER_DAYS']
+    if _sharded():
+        # Each shard seals its own readings into its own sensor_blocks
+        results = shards.scatter(lambda conn: seal_old_readings(conn, 'postgres', days, app.config['COLD_CHUNK_HOURS']))
+        blocks, rows = sum(r[0] for r in results), sum(r[1] for r in results)
+        print(f"✅ Sealed {rows} readings into {blocks} blocks on {len(results)} shards (older than {days} days)")
+        return
+
+    conn, db_type = get_db_connection()
+    if not conn:
+        print("❌ Database connection failed")
+        sys.exit(1)
+    try:
+        blocks, rows = seal_old_readings(conn, db_type, days, app.config['COLD_CHUNK_HOURS'])
+        print(f"✅ Sealed {rows} readings into {blocks} blocks (older than {days} days)")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@
 Configuration file for Flask backend
 """
 
+import json
 import os
 
 class Config:
@@ -19,11 +20,86 @@ class Config:
     DB_NAME = os.getenv('DB_NAME', 'leaksense')
     DB_USER = os.getenv('DB_USER', 'leaksense_user')
     DB_PASSWORD = os.getenv('DB_PASSWORD', 'leaksense_pass')
+    # Read replicas for analytic queries: 'host1:5433,host2:5434' (empty = primary only)
+    DB_REPLICAS = os.getenv('DB_REPLICAS', '')
+    DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', 10))
+    DB_REPLICA_HEALTH_INTERVAL = float(os.getenv('DB_REPLICA_HEALTH_INTERVAL', 5))
+    DB_REPLICA_CONNECT_TIMEOUT = int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', 2))  # seconds, probes and reads
+    # After a write through the API, reads stay on the primary for this long
+    DB_READ_YOUR_WRITES_SECONDS = float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', 10))
+    # Horizontal sharding of sensor_readings, as a JSON list
+    # [{"name": "s1", "host": "db1", "port": "5432"}, ...] (empty = all on DB_HOST).
+    # Devices are placed by shard name, so names must stay stable.
+    DB_SHARDS = json.loads(os.getenv('DB_SHARDS') or '[]')
+    # Optional region placement: device-id prefix -> shard name, e.g. {"north-": "s1"}
+    DB_SHARD_REGIONS = json.loads(os.getenv('DB_SHARD_REGIONS') or '{}')
+    DB_SHARD_WORKERS = int(os.getenv('DB_SHARD_WORKERS', 8))  # parallel shard queries per process
     # Local fallback (development) - SQLite file path
     SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(__file__), '..', 'database', 'leaksense.db'))
     # Optional DB type override: 'postgres' or 'sqlite' (auto-fallback if postgres not reachable)
     DB_TYPE = os.getenv('DB_TYPE', 'postgres')
     
+    # Cold storage tier: readings older than this are sealed into compressed blocks
+    COLD_SEAL_AFTER_DAYS = int(os.getenv('COLD_SEAL_AFTER_DAYS', 30))
+    COLD_CHUNK_HOURS = int(os.getenv('COLD_CHUNK_HOURS', 24))
+    
+    # Acoustic burst analysis
+    MAX_BURSTS_PER_UPLOAD = 1000
+    MAX_BURST_SAMPLES = 8192
+    ACOUSTIC_HIGH_BAND_MIN = float(os.getenv('ACOUSTIC_HIGH_BAND_MIN', 0.5))  # share of energy >= 500 Hz
+    ACOUSTIC_KURTOSIS_MAX = float(os.getenv('ACOUSTIC_KURTOSIS_MAX', 4.5))    # Gaussian noise ~= 3
+    
+    # Leak localization indicators: neighbouring node pairs as a JSON list, e.g.
+    # [{"a": "node-01", "b": "node-02", "distance_m": 120, "wave_speed": 1200}]
+    LOCALIZATION_PAIRS = json.loads(os.getenv('LOCALIZATION_PAIRS', '[]'))
+    LOCALIZATION_STEP_SECONDS = float(os.getenv('LOCALIZATION_STEP_SECONDS', 5))
+    LOCALIZATION_WINDOW = int(os.getenv('LOCALIZATION_WINDOW', 120))   # aligned samples
+    LOCALIZATION_MAX_LAG = int(os.getenv('LOCALIZATION_MAX_LAG', 6))   # samples each way
+    
+    # Pipe-network topology index (pipes / pipe_segments / node_placements),
+    # rebuilt in memory from the database at most this often
+    TOPOLOGY_RELOAD_SECONDS = float(os.getenv('TOPOLOGY_RELOAD_SECONDS', 60))
+    
+    # Report-by-exception nodes send only on change or heartbeat; their charts
+    # and statistics are computed on a reconstructed regular grid. 'auto'
+    # reconstructs the devices the receiver has seen sending RBE packets
+    # (device_modes table); 'true' / 'false' force every / no device.
+    REPORT_BY_EXCEPTION = os.getenv('REPORT_BY_EXCEPTION', 'auto').lower()
+    RBE_MODE_RELOAD_SECONDS = float(os.getenv('RBE_MODE_RELOAD_SECONDS', 30))
+    RBE_STEP_SECONDS = float(os.getenv('RBE_STEP_SECONDS', 5))         # node sampling interval
+    RBE_MAX_GAP_SECONDS = float(os.getenv('RBE_MAX_GAP_SECONDS', 180))  # > heartbeat interval
+    RBE_METHOD = os.getenv('RBE_METHOD', 'locf')                        # 'locf' or 'linear'
+    # Long statistics windows are resampled this many hours at a time (bounds memory)
+    RBE_STATISTICS_CHUNK_HOURS = float(os.getenv('RBE_STATISTICS_CHUNK_HOURS', 6))
+    
+    # Hot-window store: recent readings kept in per-device in-memory ring
+    # buffers so latest/chart/short-window statistics skip the database
+    HOT_STORE_ENABLED = os.getenv('HOT_STORE_ENABLED', 'True').lower() == 'true'
+    HOT_WINDOW_HOURS = int(os.getenv('HOT_WINDOW_HOURS', 24))
+    HOT_CAPACITY_PER_DEVICE = int(os.getenv('HOT_CAPACITY_PER_DEVICE', 20000))  # > 24 h at 5 s
+    HOT_REFRESH_SECONDS = float(os.getenv('HOT_REFRESH_SECONDS', 1))            # max staleness
+    HOT_GAP_LOOKBACK_IDS = int(os.getenv('HOT_GAP_LOOKBACK_IDS', 500))          # re-check skipped ids
+    HOT_GAP_SECONDS = float(os.getenv('HOT_GAP_SECONDS', 10))                  # ... for this long
+    
+    # Admission control: requests hold cost units (1 per ADMISSION_COST_HOURS
+    # of requested window) while running; ADMISSION_RESERVED units are kept
+    # for latest/alerts/dashboard/health. Per-client token buckets refill at
+    # RATE_LIMIT_PER_SECOND cost units per second.
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'True').lower() == 'true'
+    ADMISSION_CAPACITY = int(os.getenv('ADMISSION_CAPACITY', 16))
+    ADMISSION_RESERVED = int(os.getenv('ADMISSION_RESERVED', 4))
+    ADMISSION_ANALYTIC_LIMIT = int(os.getenv('ADMISSION_ANALYTIC_LIMIT', 10))
+    ADMISSION_INGEST_LIMIT = int(os.getenv('ADMISSION_INGEST_LIMIT', 4))
+    ADMISSION_COST_HOURS = float(os.getenv('ADMISSION_COST_HOURS', 24))
+    ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 1))  # seconds, on 503
+    RATE_LIMIT_PER_SECOND = float(os.getenv('RATE_LIMIT_PER_SECOND', 10))
+    RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 40))
+    
+    # Admin-only diagnostics (request profiling, stack sampler); disabled
+    # unless ADMIN_TOKEN is set. Clients send it as the X-Admin-Token header.
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+    PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/leaksense_profiles')
+    
     # CORS settings
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*')
     
@@ -31,3 +107,16 @@ class Config:
     MAX_RECORDS_PER_REQUEST = 1000
     DEFAULT_RECORDS_LIMIT = 50
     MAX_TIME_RANGE_HOURS = 168  # 7 days
+    MAX_CHART_POINTS = 500
+    # since= polls re-read this far behind the cursor: readings can commit
+    # after a newer one was served (received_at is stamped before the
+    # receiver's decode queue)
+    DELTA_OVERLAP_SECONDS = float(os.getenv('DELTA_OVERLAP_SECONDS', 30))
+
+    # Alert thresholds (shared by /api/sensors/alerts, /api/dashboard and redetect.py)
+    MOISTURE_THRESHOLD = float(os.getenv('MOISTURE_THRESHOLD', 70.0))
+    ACOUSTIC_THRESHOLD = float(os.getenv('ACOUSTIC_THRESHOLD', 75.0))
+    PRESSURE_MIN = float(os.getenv('PRESSURE_MIN', 20.0))
+    PRESSURE_MAX = float(os.getenv('PRESSURE_MAX', 80.0))
+    # Label stored with re-detected alert events; bump when thresholds change
+    ALERT_RULE_VERSION = os.getenv('ALERT_RULE_VERSION', 'v1')
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+LeakSense read/write routing
+Sends writes and freshness-sensitive reads to the PostgreSQL primary and
+latency-tolerant analytic reads to healthy, sufficiently caught-up replicas
+"""
+
+import math
+import threading
+import time
+
+# Replication lag in seconds. A streaming replica that has replayed everything
+# it received reports 0. Without a WAL receiver it cannot know what the primary
+# has since written, so its lag is the age of the last replayed transaction
+# (infinite if it never replayed one). The receiver row exists whenever the
+# process runs; status is NULL for roles without pg_read_all_stats.
+LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN NULL
+    WHEN EXISTS (
+        SELECT 1 FROM pg_stat_wal_receiver
+        WHERE COALESCE(status, 'streaming') = 'streaming'
+    ) AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(
+        EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()),
+        'Infinity'
+    )
+END
+"""
+
+# Route names used by the API
+PRIMARY = 'primary'   # writes and health checks
+LATEST = 'latest'     # read-your-writes: newest readings must be visible
+ANALYTIC = 'analytic' # range/statistics/alerts scans; may lag slightly
+
+
+def parse_endpoints(value, default_port='5432'):
+    """Parse 'host1:5433,host2' into [{'host': 'host1', 'port': '5433'}, ...]."""
+    endpoints = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(':')
+        endpoints.append({'host': host, 'port': port or default_port})
+    return endpoints
+
+
+class ReplicaRouter:
+    """Chooses a database endpoint per request
+
+    Replica health and lag are probed lazily, at most once per health_interval
+    per replica. A replica is skipped when its last probe failed or its lag
+    exceeded max_lag_seconds. Probes run outside the lock and one at a time per
+    replica; meanwhile other requests use that replica's last known state. For
+    pin_seconds after a write made through this process, every read goes to the
+    primary so it can see that write.
+    """
+
+    def __init__(self, primary, replicas, connect, max_lag_seconds=10.0, health_interval=5.0, pin_seconds=10.0):
+        self.primary = dict(primary, role='primary')
+        self.replicas = [dict(r, role='replica', healthy=True, lag=None, checked=0.0, probing=False) for r in replicas]
+        self.connect = connect
+        self.max_lag = max_lag_seconds
+        self.health_interval = health_interval
+        self.pin_seconds = pin_seconds
+        self.last_write = 0.0
+        self.next_index = 0
+        self.lock = threading.Lock()
+
+    def note_write(self):
+        self.last_write = time.time()
+
+    def _probe(self, replica):
+        """Return (healthy, lag) for a replica without touching shared state."""
+        try:
+            conn = self.connect(replica['host'], replica['port'])
+            try:
+                cursor = conn.cursor()
+                cursor.execute(LAG_QUERY)
+                lag = cursor.fetchone()[0]
+                cursor.close()
+            finally:
+                conn.close()
+            lag = float(lag) if lag is not None else None
+            # A replica that was promoted (lag None) is no longer a read replica
+            healthy = lag is not None and lag <= self.max_lag
+            # Infinite lag (cut off before replaying anything) is not valid JSON
+            return healthy, (lag if lag is not None and math.isfinite(lag) else None)
+        except Exception as e:
+            print(f"Replica {replica['host']}:{replica['port']} unavailable: {e}")
+            return False, None
+
+    def mark_down(self, endpoint):
+        """Record a failed connection so the replica is skipped until re-probed."""
+        if endpoint.get('role') == 'replica':
+            with self.lock:
+                endpoint['healthy'] = False
+                endpoint['checked'] = time.time()
+
+    def choose(self, route=PRIMARY):
+        """Return the endpoint dict (host, port, role) to use for this route."""
+        if route != ANALYTIC or not self.replicas:
+            return self.primary
+        if time.time() - self.last_write < self.pin_seconds:
+            return self.primary
+
+        for _ in range(len(self.replicas)):
+            with self.lock:
+                replica = self.replicas[self.next_index % len(self.replicas)]
+                self.next_index += 1
+                probe = (not replica['probing']
+                         and time.time() - replica['checked'] >= self.health_interval)
+                if probe:
+                    replica['probing'] = True
+            if probe:
+                # The probe can block for the connect timeout; publish under the lock
+                healthy, lag = False, None
+                try:
+                    healthy, lag = self._probe(replica)
+                finally:
+                    with self.lock:
+                        replica.update(healthy=healthy, lag=lag, checked=time.time(), probing=False)
+            if replica['healthy']:
+                return replica
+        # Every replica is down or lagging: fail over to the primary
+        return self.primary
+
+    def status(self):
+        return [
+            {
+                'host': r['host'],
+                'port': r['port'],
+                'healthy': r['healthy'],
+                'lag_seconds': r['lag']
+            }
+            for r in self.replicas
+        ]
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+LeakSense hot-window store
+In-process per-device ring buffers holding the most recent readings, so the
+latest/chart/short-window statistics endpoints can be served from memory
+"""
+
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from storage_format import decode_row
+
+FIELDS = ('pressure', 'moisture', 'acoustic', 'rssi', 'snr')
+# Fields with running sums (for O(1) full-window averages / standard deviations)
+SUM_FIELDS = ('pressure', 'moisture', 'acoustic', 'rssi')
+
+
+def _epoch(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp() if isinstance(value, datetime) else np.nan
+
+
+class DeviceRing:
+    """Fixed-capacity ring of typed arrays for one device
+
+    Entries older than window_seconds (relative to the newest entry) or beyond
+    capacity are evicted on append. Entries stay in timestamp order: a late row
+    is inserted in place, and one older than the eviction horizon is dropped.
+    Running count/sum/sum-of-squares are kept for the retained entries.
+    """
+
+    def __init__(self, capacity, window_seconds):
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.ts = np.zeros(capacity, dtype=np.float64)
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.values = {field: np.zeros(capacity, dtype=np.float64) for field in FIELDS}
+        self.start = 0
+        self.count = 0
+        self.appends = 0
+        self.horizon = -np.inf  # timestamp of the newest evicted entry
+        self.n = {field: 0 for field in SUM_FIELDS}
+        self.sum = {field: 0.0 for field in SUM_FIELDS}
+        self.sumsq = {field: 0.0 for field in SUM_FIELDS}
+
+    def _account(self, index, sign):
+        for field in SUM_FIELDS:
+            v = self.values[field][index]
+            if not np.isnan(v):
+                self.n[field] += sign
+                self.sum[field] += sign * v
+                self.sumsq[field] += sign * v * v
+
+    def _evict_oldest(self):
+        self._account(self.start, -1)
+        self.horizon = max(self.horizon, self.ts[self.start])
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+
+    def append(self, reading_id, ts, created, values):
+        if ts <= self.horizon or (self.count == self.capacity and ts < self.ts[self.start]):
+            return
+        while self.count and (self.count == self.capacity or self.ts[self.start] < ts - self.window_seconds):
+            self._evict_oldest()
+        index = (self.start + self.count) % self.capacity
+        if self.count and ts < self.newest():
+            # Shift the newer entries up one slot (the free slot follows them)
+            order = self._order()
+            tail = order[np.searchsorted(self.ts[order], ts, side='right'):]
+            for array in (self.ids, self.ts, self.created, *self.values.values()):
+                array[(tail + 1) % self.capacity] = array[tail]
+            index = tail[0]
+        self.ids[index] = reading_id
+        self.ts[index] = ts
+        self.created[index] = created
+        for field in FIELDS:
+            v = values.get(field)
+            self.values[field][index] = np.nan if v is None else float(v)
+        self._account(index, +1)
+        self.count += 1
+
+        self.appends += 1
+        if self.appends % self.capacity == 0:
+            self._resum()
+
+    def _resum(self):
+        """Recompute running sums from scratch to cancel floating-point drift."""
+        order = self._order()
+        for field in SUM_FIELDS:
+            v = self.values[field][order]
+            v = v[~np.isnan(v)]
+            self.n[field] = len(v)
+            self.sum[field] = float(v.sum())
+            self.sumsq[field] = float((v * v).sum())
+
+    def _order(self):
+        """Physical indexes of retained entries, oldest first."""
+        return (self.start + np.arange(self.count)) % self.capacity
+
+    def oldest(self):
+        return self.ts[self.start] if self.count else None
+
+    def newest_index(self):
+        return (self.start + self.count - 1) % self.capacity if self.count else None
+
+    def newest(self):
+        return self.ts[self.newest_index()] if self.count else None
+
+    def between(self, start_epoch, end_epoch):
+        """Physical indexes of entries with start_epoch <= ts < end_epoch, oldest first."""
+        order = self._order()
+        ts = self.ts[order]
+        first = np.searchsorted(ts, start_epoch, side='left')
+        last = np.searchsorted(ts, end_epoch, side='left')
+        return order[first:last]
+
+
+class HotStore:
+    """Per-device ring buffers plus the tail position in sensor_readings
+
+    Ids are assigned at insert but become visible at commit, so a refresh can
+    see id N+1 before N. Unseen ids within gap_lookback_ids of the tail are
+    kept in self.gaps ({id: time first missed}) and asked for again on every
+    refresh until they show up, fall out of the lookback, or have been missing
+    for gap_seconds (rolled back or deleted rather than still committing).
+    """
+
+    def __init__(self, window_hours=24, capacity_per_device=20000, refresh_seconds=1.0, gap_lookback_ids=500,
+                 gap_seconds=10.0):
+        self.window_seconds = window_hours * 3600
+        self.capacity = capacity_per_device
+        self.refresh_seconds = refresh_seconds
+        self.gap_lookback_ids = gap_lookback_ids
+        self.gap_seconds = gap_seconds
+        self.devices = {}
+        self.last_id = 0
+        self.gaps = {}
+        self.primed_from = None
+        self.refreshed = 0.0
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+    def covers(self, start_time):
+        """True when every reading since start_time is held in memory."""
+        start_epoch = start_time.timestamp()
+        if self.primed_from is None or start_epoch < self.primed_from:
+            return False
+        with self.lock:
+            return all(start_epoch > ring.horizon for ring in self.devices.values())
+
+    def append(self, row):
+        device_id = row.get('device_id') or 'default'
+        ring = self.devices.get(device_id)
+        if ring is None:
+            ring = self.devices[device_id] = DeviceRing(self.capacity, self.window_seconds)
+        ring.append(int(row['id']), _epoch(row['timestamp']), _epoch(row.get('created_at')), row)
+        if row['id'] > self.last_id:
+            self.last_id = row['id']
+
+    def refresh(self, connect):
+        """Pull rows inserted since the last refresh (throttled to refresh_seconds).
+
+        connect() must return (conn, db_type). The first call loads the whole
+        window; later calls read ids above the last one seen plus the pending
+        gaps, which are primary-key lookups. The store is polled from requests,
+        not fed by ingest. Readers are only blocked while rows are appended,
+        not while the query runs.
+        """
+        if time.time() - self.refreshed < self.refresh_seconds:
+            return
+        with self.refresh_lock:
+            if time.time() - self.refreshed < self.refresh_seconds:
+                return
+            conn, db_type = connect()
+            if not conn:
+                return
+            ph = '%s' if db_type == 'postgres' else '?'
+            try:
+                if db_type == 'postgres':
+                    from psycopg2.extras import RealDictCursor
+                    cursor = conn.cursor(cursor_factory=RealDictCursor)
+                else:
+                    cursor = conn.cursor()
+                if self.primed_from is None:
+                    primed_from = time.time() - self.window_seconds
+                    cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM sensor_readings")
+                    tail_id = cursor.fetchone()['max_id']
+                    gap_floor = max(tail_id - self.gap_lookback_ids, 0)
+                    # Ids near the tail that exist, in the window or not, are not gaps
+                    cursor.execute(f"SELECT id FROM sensor_readings WHERE id > {ph} AND id <= {ph}",
+                                   (gap_floor, tail_id))
+                    seen = {row['id'] for row in cursor.fetchall()}
+                    cursor.execute(f"""
+                        SELECT * FROM sensor_readings
+                        WHERE timestamp >= {ph}
+                        ORDER BY id ASC
+                    """, (int(primed_from * 1000),))
+                else:
+                    primed_from, tail_id = self.primed_from, self.last_id
+                    gaps = sorted(self.gaps)
+                    in_gaps = f" OR id IN ({', '.join([ph] * len(gaps))})" if gaps else ''
+                    cursor.execute(f"""
+                        SELECT * FROM sensor_readings
+                        WHERE id > {ph}{in_gaps}
+                        ORDER BY id ASC
+                    """, (self.last_id, *gaps))
+                rows = [decode_row(row) for row in cursor.fetchall()]
+                cursor.close()
+            finally:
+                conn.close()
+
+            now = time.time()
+            if self.primed_from is None:
+                # Ids at or below tail_id with no row yet may still commit
+                self.gaps = dict.fromkeys(range(gap_floor + 1, tail_id + 1), now)
+                seen |= {row['id'] for row in rows}
+            else:
+                seen = {row['id'] for row in rows}
+            new_tail = max(seen | {tail_id})
+            floor = new_tail - self.gap_lookback_ids
+            for i in range(max(tail_id, floor) + 1, new_tail + 1):
+                self.gaps.setdefault(i, now)
+            # A gap closes once its row has been seen, even when that row is
+            # dropped below for being older than the window
+            self.gaps = {i: missed for i, missed in self.gaps.items()
+                         if i not in seen and i > floor and now - missed < self.gap_seconds}
+            rows = [row for row in rows if _epoch(row['timestamp']) >= primed_from]
+
+            with self.lock:
+                self.last_id = tail_id
+                for row in rows:
+                    self.append(row)
+                self.primed_from = primed_from
+            self.refreshed = time.time()
+
+    def _reading(self, device_id, ring, i):
+        reading = {
+            'id': int(ring.ids[i]),
+            'device_id': device_id,
+            'timestamp': datetime.fromtimestamp(ring.ts[i]).isoformat(),
+            'created_at': (datetime.fromtimestamp(ring.created[i]).isoformat()
+                           if not np.isnan(ring.created[i]) else None)
+        }
+        for field in FIELDS:
+            v = ring.values[field][i]
+            reading[field] = None if np.isnan(v) else float(v)
+        if reading['rssi'] is not None:
+            reading['rssi'] = int(reading['rssi'])
+        return reading
+
+    def latest(self):
+        """Most recent reading across all devices, or None."""
+        with self.lock:
+            best, best_ts = None, None
+            for device_id, ring in self.devices.items():
+                i = ring.newest_index()
+                if i is not None and (best_ts is None or ring.ts[i] > best_ts):
+                    best, best_ts = (device_id, ring, i), ring.ts[i]
+            return self._reading(*best) if best else None
+
+    def latest_by_device(self, device_ids):
+        """{device_id: most recent reading} for the given devices that have one in memory."""
+        with self.lock:
+            readings = {}
+            for device_id in device_ids:
+                ring = self.devices.get(device_id)
+                i = ring.newest_index() if ring else None
+                if i is not None:
+                    readings[device_id] = self._reading(device_id, ring, i)
+            return readings
+
+    def series(self, start_time, end_time=None):
+        """Timestamps and field arrays in [start_time, end_time) across devices, time-ordered."""
+        start_epoch = start_time.timestamp()
+        end_epoch = end_time.timestamp() if end_time else np.inf
+        with self.lock:
+            parts = [(ring, ring.between(start_epoch, end_epoch)) for ring in self.devices.values()]
+            ts = np.concatenate([ring.ts[idx] for ring, idx in parts]) if parts else np.zeros(0)
+            columns = {
+                field: (np.concatenate([ring.values[field][idx] for ring, idx in parts]) if parts else np.zeros(0))
+                for field in FIELDS
+            }
+        order = np.argsort(ts, kind='stable')
+        return ts[order], {field: values[order] for field, values in columns.items()}
+
+    def statistics(self, start_time, end_time=None, devices=None):
+        """Same fields as the PostgreSQL /api/sensors/statistics query, over [start_time, end_time).
+
+        devices limits the statistics to those device ids (default: all).
+        """
+        start_epoch = start_time.timestamp()
+        end_epoch = end_time.timestamp() if end_time else np.inf
+        with self.lock:
+            rings = (list(self.devices.values()) if devices is None
+                     else [self.devices[d] for d in devices if d in self.devices])
+            full = all(ring.count == 0 or (ring.oldest() >= start_epoch and ring.newest() < end_epoch)
+                       for ring in rings)
+            parts = [ring.between(start_epoch, end_epoch) for ring in rings]
+            total = sum(len(idx) for idx in parts)
+            stats = {'total_readings': float(total)}
+            for field in SUM_FIELDS:
+                values = np.concatenate([ring.values[field][idx] for ring, idx in
+                                         zip(rings, parts)]) if parts else np.zeros(0)
+                values = values[~np.isnan(values)]
+                if full:
+                    # Whole window requested: use running aggregates
+                    n = sum(ring.n[field] for ring in rings)
+                    s = sum(ring.sum[field] for ring in rings)
+                    ss = sum(ring.sumsq[field] for ring in rings)
+                else:
+                    n, s, ss = len(values), float(values.sum()), float((values * values).sum())
+                stats[f'avg_{field}'] = s / n if n else None
+                stats[f'min_{field}'] = float(values.min()) if len(values) else None
+                stats[f'max_{field}'] = float(values.max()) if len(values) else None
+                if field != 'rssi':
+                    stats[f'std_{field}'] = (float(np.sqrt(max(ss - s * s / n, 0.0) / (n - 1)))
+                                             if n > 1 else None)
+            return stats
+
+    def status(self):
+        with self.lock:
+            return {
+                'primed': self.primed_from is not None,
+                'devices': len(self.devices),
+                'readings': sum(ring.count for ring in self.devices.values()),
+                'last_id': self.last_id,
+                'pending_ids': len(self.gaps)
+            }
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+LeakSense profiling hooks
+Per-request cProfile capture with SQL timings broken out, and a low-overhead
+stack sampler that can be started and stopped while the API is running
+"""
+
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from flask import g, has_request_context
+
+SQL_TEXT_LIMIT = 300  # characters of each statement kept in reports
+TOP_FUNCTIONS = 40
+
+# Only one cProfile profiler can be active per interpreter (Python 3.12+),
+# so concurrent profile requests are refused instead of queued
+_profile_lock = threading.Lock()
+
+
+def authorized(request, admin_token):
+    """True when the request carries the configured admin token."""
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(admin_token) and hmac.compare_digest(supplied, admin_token)
+
+
+def current():
+    """The RequestProfile of the request being handled, if it is being profiled."""
+    return g.get('profile') if has_request_context() else None
+
+
+class RequestProfile:
+    """cProfile capture of one request plus the SQL statements it executed"""
+
+    def __init__(self, method, path):
+        self.id = datetime.now().strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:8]
+        self.method = method
+        self.path = path
+        self.profiler = cProfile.Profile()
+        self.sql = []
+        self.started = None
+        self.elapsed = None
+
+    def start(self):
+        """Start profiling; returns False if another request is already being profiled."""
+        if not _profile_lock.acquire(blocking=False):
+            return False
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Another profiling tool (debugger, coverage) owns the interpreter
+            _profile_lock.release()
+            return False
+        self.started = time.perf_counter()
+        return True
+
+    def stop(self):
+        self.profiler.disable()
+        self.elapsed = time.perf_counter() - self.started
+        _profile_lock.release()
+
+    def record_sql(self, statement, seconds, rowcount):
+        self.sql.append({
+            'statement': ' '.join(str(statement).split())[:SQL_TEXT_LIMIT],
+            'ms': seconds * 1000.0,
+            'rows': rowcount if rowcount is not None and rowcount >= 0 else None
+        })
+
+    def sql_ms(self):
+        return sum(s['ms'] for s in self.sql)
+
+    def report(self, status=None):
+        stats = pstats.Stats(self.profiler)
+        functions = []
+        for (filename, line, name), (cc, nc, tt, ct, _) in stats.stats.items():
+            functions.append({
+                'function': f"{name} ({os.path.basename(filename)}:{line})",
+                'calls': nc,
+                'self_ms': tt * 1000.0,
+                'cumulative_ms': ct * 1000.0
+            })
+        functions.sort(key=lambda f: f['cumulative_ms'], reverse=True)
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'status': status,
+            'total_ms': self.elapsed * 1000.0,
+            'sql_ms': self.sql_ms(),
+            'sql_count': len(self.sql),
+            'sql': sorted(self.sql, key=lambda s: s['ms'], reverse=True),
+            'functions': functions[:TOP_FUNCTIONS]
+        }
+
+    def save(self, directory, report):
+        """Write <id>.prof (pstats, loadable by snakeviz/flameprof) and <id>.json."""
+        os.makedirs(directory, exist_ok=True)
+        self.profiler.dump_stats(os.path.join(directory, f'{self.id}.prof'))
+        with open(os.path.join(directory, f'{self.id}.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def list_profiles(directory, limit=50):
+    """Summaries of the most recent saved profiles, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((n for n in os.listdir(directory) if n.endswith('.json')), reverse=True)[:limit]
+    summaries = []
+    for name in names:
+        with open(os.path.join(directory, name)) as f:
+            report = json.load(f)
+        summaries.append({k: report.get(k) for k in ('id', 'method', 'path', 'status', 'total_ms', 'sql_ms', 'sql_count')})
+    return summaries
+
+
+class ProfiledCursor:
+    """Cursor proxy that times execute calls into a RequestProfile"""
+
+    def __init__(self, cursor, profile):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_profile', profile)
+
+    def _timed(self, method, statement, *args):
+        started = time.perf_counter()
+        try:
+            return getattr(self._cursor, method)(statement, *args)
+        finally:
+            self._profile.record_sql(statement, time.perf_counter() - started,
+                                     getattr(self._cursor, 'rowcount', None))
+
+    def execute(self, statement, *args):
+        return self._timed('execute', statement, *args)
+
+    def executemany(self, statement, *args):
+        return self._timed('executemany', statement, *args)
+
+    def executescript(self, script):
+        return self._timed('executescript', script)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+
+class ProfiledConnection:
+    """Connection proxy whose cursors (and sqlite's conn.execute) are timed"""
+
+    def __init__(self, conn, profile):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_profile', profile)
+
+    def cursor(self, *args, **kwargs):
+        return ProfiledCursor(self._conn.cursor(*args, **kwargs), self._profile)
+
+    def execute(self, statement, *args):
+        return self.cursor().execute(statement, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+
+class StackSampler:
+    """Samples every thread's Python stack at a fixed interval
+
+    Stacks are aggregated as folded lines ("outer;inner;leaf count"), the input
+    format of flamegraph.pl and speedscope. Cost is one sys._current_frames()
+    walk per interval on a background thread; nothing is hooked into the
+    profiled code. raspberry_pi_receiver/sampling_profiler.py carries a copy
+    for the receiver; keep the two in sync.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.samples = 0
+        self.interval = None
+        self.started = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()         # start/stop
+        self.counts_lock = threading.Lock()  # counts/samples, shared with the sampling thread
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval=0.01):
+        with self.lock:
+            if self.running:
+                return False
+            with self.counts_lock:
+                self.counts = Counter()
+                self.samples = 0
+            self.interval = interval
+            self.started = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        with self.lock:
+            if not self.running:
+                return False
+            self.stop_event.set()
+            self.thread.join()
+            return True
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(stack)))
+            with self.counts_lock:
+                self.counts.update(stacks)
+                self.samples += 1
+
+    def snapshot(self):
+        """(copy of counts, samples), consistent with each other."""
+        with self.counts_lock:
+            return Counter(self.counts), self.samples
+
+    def folded(self):
+        """Folded stacks, most frequent first."""
+        counts, _ = self.snapshot()
+        return '\n'.join(f'{stack} {count}' for stack, count in counts.most_common()) + '\n'
+
+    def summary(self, limit=25):
+        """Functions ranked by how often they were on top of a sampled stack."""
+        counts, samples = self.snapshot()
+        leaves = Counter()
+        for stack, count in counts.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'started': datetime.fromtimestamp(self.started).isoformat() if self.started else None,
+            'samples': samples,
+            'top': [{'function': name, 'samples': count, 'percent': 100.0 * count / total}
+                    for name, count in leaves.most_common(limit)]
+        }
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+LeakSense series reconstruction
+Rebuilds regular per-device series from sparse report-by-exception samples
+
+The receiver records each device's transmission mode in device_modes (from
+the "rbe" flag of its packets), so only report-by-exception devices are
+resampled.
+"""
+
+import math
+from datetime import datetime
+
+import numpy as np
+
+VALUE_FIELDS = ('pressure', 'moisture', 'acoustic', 'rssi', 'snr')
+
+# Kept with each device's readings (on its shard when sharded)
+CREATE_DEVICE_MODES_POSTGRES = """
+CREATE TABLE IF NOT EXISTS device_modes (
+    device_id VARCHAR(32) PRIMARY KEY,
+    report_by_exception BOOLEAN NOT NULL,
+    updated_at BIGINT NOT NULL
+);
+"""
+
+CREATE_DEVICE_MODES_SQLITE = """
+CREATE TABLE IF NOT EXISTS device_modes (
+    device_id TEXT PRIMARY KEY,
+    report_by_exception BOOLEAN NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+
+def fetch_rbe_devices(conn):
+    """Device ids recorded as sending report-by-exception packets."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT device_id FROM device_modes WHERE report_by_exception")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def _to_seconds(ts):
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    return ts.timestamp()
+
+
+def _split(readings, start_time, end_time, step_seconds, devices):
+    """Group readings of resampled devices; readings of the others inside the window pass through."""
+    start, end = start_time.timestamp(), end_time.timestamp()
+    by_device = {}
+    passthrough = []
+    for r in readings:
+        device_id = r.get('device_id', 'default')
+        if devices is None or device_id in devices:
+            by_device.setdefault(device_id, []).append(r)
+        elif start <= _to_seconds(r['timestamp']) < end:
+            passthrough.append(r)
+    first = math.ceil(start / step_seconds) * step_seconds
+    return by_device, passthrough, np.arange(first, end, step_seconds)
+
+
+def _resample(rows, grid, max_gap_seconds, method):
+    """One device's rows on the grid: (mask of grid points with a value, {field: values})."""
+    rows.sort(key=lambda r: _to_seconds(r['timestamp']))
+    ts = np.array([_to_seconds(r['timestamp']) for r in rows])
+    prev = np.searchsorted(ts, grid, side='right') - 1
+    valid = prev >= 0
+    valid[valid] &= (grid[valid] - ts[prev[valid]]) <= max_gap_seconds
+
+    nxt = np.minimum(prev + 1, len(ts) - 1)
+    columns = {}
+    for field in VALUE_FIELDS:
+        values = np.array([r.get(field) if r.get(field) is not None else np.nan for r in rows],
+                          dtype=np.float64)
+        carried = values[np.maximum(prev, 0)]
+        if method == 'linear':
+            span = ts[nxt] - ts[np.maximum(prev, 0)]
+            interpolate = (nxt > prev) & (span > 0) & (span <= max_gap_seconds)
+            frac = np.where(interpolate, (grid - ts[np.maximum(prev, 0)]) / np.where(span > 0, span, 1.0), 0.0)
+            carried = np.where(interpolate, carried + frac * (values[nxt] - carried), carried)
+        columns[field] = carried
+    columns['rssi'] = np.round(columns['rssi'])
+    return valid, columns
+
+
+def reconstruct(readings, start_time, end_time, step_seconds=5.0, max_gap_seconds=180.0, method='locf',
+                devices=None):
+    """Resample readings onto a regular grid per device.
+
+    Args:
+        readings: reading dicts (any order, any devices). Include samples from up
+            to max_gap_seconds before start_time so the first grid points have a
+            value to carry forward.
+        start_time, end_time: grid bounds (end exclusive)
+        step_seconds: grid spacing, normally the nodes' sampling interval
+        max_gap_seconds: a value is only carried across gaps up to this long;
+            longer silences (node offline) produce no grid points
+        method: 'locf' (last value carried forward) or 'linear'
+        devices: ids of the devices to resample (None = every device). Readings
+            of other devices inside [start_time, end_time) are kept as stored.
+
+    Returns reading dicts on the grid, ordered by timestamp then device.
+    """
+    by_device, output, grid = _split(readings, start_time, end_time, step_seconds, devices)
+    for device_id, rows in (by_device.items() if len(grid) else ()):
+        valid, columns = _resample(rows, grid, max_gap_seconds, method)
+        for i in np.flatnonzero(valid):
+            point = {'device_id': device_id, 'timestamp': datetime.fromtimestamp(grid[i])}
+            for field in VALUE_FIELDS:
+                value = columns[field][i]
+                point[field] = None if np.isnan(value) else float(value)
+            if point['rssi'] is not None:
+                point['rssi'] = int(point['rssi'])
+            output.append(point)
+
+    output.sort(key=lambda p: (_to_seconds(p['timestamp']), p['device_id']))
+    return output
+
+
+def accumulate(aggregates, readings, start_time, end_time, step_seconds=5.0, max_gap_seconds=180.0,
+               method='locf', devices=None, thresholds=None):
+    """Fold what reconstruct() would return into count/sum/sumsq/min/max partials.
+
+    Same arguments as reconstruct(); aggregates maps each field to a
+    {'count', 'sum', 'sumsq', 'min', 'max'} dict (cold_storage partial format)
+    and is updated in place. Grid points stay NumPy arrays, so no per-point
+    dicts are built.
+
+    thresholds ({'moisture_max', 'acoustic_max', 'pressure_min', 'pressure_max'})
+    also counts the points that violate any of them, missing values as 0.
+    Returns that count (0 without thresholds).
+    """
+    by_device, passthrough, grid = _split(readings, start_time, end_time, step_seconds, devices)
+    series = [_resample(rows, grid, max_gap_seconds, method) for rows in (by_device.values() if len(grid) else ())]
+    columns = {}
+    for field in VALUE_FIELDS:
+        parts = [values[field][valid] for valid, values in series]
+        parts.append(np.array([r[field] if r.get(field) is not None else np.nan for r in passthrough],
+                              dtype=np.float64))
+        columns[field] = np.concatenate(parts)
+
+    for field, agg in aggregates.items():
+        values = columns[field][~np.isnan(columns[field])]
+        if not len(values):
+            continue
+        agg['count'] += int(len(values))
+        agg['sum'] += float(values.sum())
+        agg['sumsq'] += float(np.dot(values, values))
+        low, high = float(values.min()), float(values.max())
+        agg['min'] = low if agg['min'] is None else min(agg['min'], low)
+        agg['max'] = high if agg['max'] is None else max(agg['max'], high)
+
+    if not thresholds:
+        return 0
+    pressure = np.nan_to_num(columns['pressure'])
+    violations = ((np.nan_to_num(columns['moisture']) > thresholds['moisture_max']) |
+                  (np.nan_to_num(columns['acoustic']) > thresholds['acoustic_max']) |
+                  (pressure < thresholds['pressure_min']) |
+                  (pressure > thresholds['pressure_max']))
+    return int(violations.sum())
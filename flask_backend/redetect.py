@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+LeakSense historical re-detection / backfill job
+Re-evaluates alert rules over stored history in parallel and writes the
+resulting events to the alert_events table
+
+Usage:
+    python3 redetect.py --start 2024-01-01 [--end 2024-06-01] [--rule-version v2]
+                        [--shard-hours 24] [--workers 8] [--restart]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import cold_storage
+from storage_format import to_ms, decode_row
+
+CREATE_EVENTS_POSTGRES = """
+CREATE TABLE IF NOT EXISTS alert_events (
+    id SERIAL PRIMARY KEY,
+    rule_version VARCHAR(32) NOT NULL,
+    device_id VARCHAR(32) NOT NULL,
+    reading_timestamp TIMESTAMP NOT NULL,
+    alert_type VARCHAR(32) NOT NULL,
+    value REAL NOT NULL,
+    threshold REAL NOT NULL,
+    detected_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (rule_version, device_id, reading_timestamp, alert_type)
+);
+
+CREATE INDEX IF NOT EXISTS idx_alert_events_timestamp ON alert_events(reading_timestamp DESC);
+
+CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+    rule_version VARCHAR(32) NOT NULL,
+    shard_start TIMESTAMP NOT NULL,
+    shard_end TIMESTAMP NOT NULL,
+    rows_scanned INTEGER NOT NULL,
+    events_written INTEGER NOT NULL,
+    completed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (rule_version, shard_start)
+);
+"""
+
+CREATE_EVENTS_SQLITE = """
+CREATE TABLE IF NOT EXISTS alert_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    rule_version TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    reading_timestamp TIMESTAMP NOT NULL,
+    alert_type TEXT NOT NULL,
+    value REAL NOT NULL,
+    threshold REAL NOT NULL,
+    detected_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (rule_version, device_id, reading_timestamp, alert_type)
+);
+
+CREATE INDEX IF NOT EXISTS idx_alert_events_timestamp ON alert_events(reading_timestamp DESC);
+
+CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+    rule_version TEXT NOT NULL,
+    shard_start TIMESTAMP NOT NULL,
+    shard_end TIMESTAMP NOT NULL,
+    rows_scanned INTEGER NOT NULL,
+    events_written INTEGER NOT NULL,
+    completed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (rule_version, shard_start)
+);
+"""
+
+
+def current_rules(config):
+    """Alert rules as (alert_type, field, comparison, threshold) tuples."""
+    return (
+        ('high_moisture', 'moisture', '>', config['MOISTURE_THRESHOLD']),
+        ('high_acoustic', 'acoustic', '>', config['ACOUSTIC_THRESHOLD']),
+        ('low_pressure', 'pressure', '<', config['PRESSURE_MIN']),
+        ('high_pressure', 'pressure', '>', config['PRESSURE_MAX']),
+    )
+
+
+def evaluate(readings, rules):
+    """Vectorized rule evaluation.
+
+    Returns a list of (device_id, timestamp, alert_type, value, threshold).
+    """
+    if not readings:
+        return []
+    columns = {
+        field: np.array([r[field] if r[field] is not None else np.nan for r in readings], dtype=np.float64)
+        for field in {rule[1] for rule in rules}
+    }
+    events = []
+    for alert_type, field, comparison, threshold in rules:
+        values = columns[field]
+        mask = values > threshold if comparison == '>' else values < threshold
+        for i in np.flatnonzero(mask):
+            r = readings[i]
+            events.append((r['device_id'], r['timestamp'], alert_type, float(values[i]), float(threshold)))
+    return events
+
+
+def ensure_tables(conn, db_type):
+    cursor = conn.cursor()
+    if db_type == 'postgres':
+        cursor.execute(CREATE_EVENTS_POSTGRES)
+    else:
+        cursor.executescript(CREATE_EVENTS_SQLITE)
+    conn.commit()
+    cursor.close()
+
+
+def _load_shard(conn, db_type, start, end):
+    ph = '%s' if db_type == 'postgres' else '?'
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT device_id, timestamp, pressure, moisture, acoustic
+        FROM sensor_readings
+        WHERE timestamp >= {ph} AND timestamp < {ph}
+    """, (to_ms(start), to_ms(end)))
+    columns = ('device_id', 'timestamp', 'pressure', 'moisture', 'acoustic')
+    readings = [decode_row(zip(columns, tuple(row))) for row in cursor.fetchall()]
+    cursor.close()
+    return cold_storage.fetch_cold_readings(conn, db_type, start, end) + readings
+
+
+def process_shard(shard_start, shard_end, rule_version, rules):
+    """Re-detect one shard and write its events and checkpoint in one transaction.
+
+    Existing events for this rule version in the shard are replaced, so
+    re-running a shard is idempotent.
+    """
+    from app import get_db_connection, shards, _sharded
+
+    started = time.time()
+    conn, db_type = get_db_connection()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+    ph = '%s' if db_type == 'postgres' else '?'
+    try:
+        if db_type == 'postgres' and _sharded():
+            # Readings come from every DB_SHARDS instance; events stay on DB_HOST
+            readings = [r for part in shards.scatter(lambda c: _load_shard(c, db_type, shard_start, shard_end))
+                        for r in part]
+        else:
+            readings = _load_shard(conn, db_type, shard_start, shard_end)
+        events = evaluate(readings, rules)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                DELETE FROM alert_events
+                WHERE rule_version = {ph} AND reading_timestamp >= {ph} AND reading_timestamp < {ph}
+            """, (rule_version, shard_start, shard_end))
+            cursor.executemany(f"""
+                INSERT INTO alert_events
+                    (rule_version, device_id, reading_timestamp, alert_type, value, threshold)
+                VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+            """, [(rule_version,) + event for event in events])
+            cursor.execute(f"""
+                DELETE FROM backfill_checkpoints WHERE rule_version = {ph} AND shard_start = {ph}
+            """, (rule_version, shard_start))
+            cursor.execute(f"""
+                INSERT INTO backfill_checkpoints
+                    (rule_version, shard_start, shard_end, rows_scanned, events_written)
+                VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
+            """, (rule_version, shard_start, shard_end, len(readings), len(events)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+    return shard_start, len(readings), len(events), time.time() - started
+
+
+def _completed_shards(conn, db_type, rule_version):
+    """Checkpointed shards as {shard_start: shard_end}."""
+    ph = '%s' if db_type == 'postgres' else '?'
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT shard_start, shard_end FROM backfill_checkpoints WHERE rule_version = {ph}",
+                   (rule_version,))
+    done = {_as_datetime(start): _as_datetime(end) for start, end in cursor.fetchall()}
+    cursor.close()
+    return done
+
+
+def _as_datetime(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def main():
+    from app import app, get_db_connection
+
+    parser = argparse.ArgumentParser(description='Re-evaluate alert rules over stored history')
+    parser.add_argument('--start', required=True, help='ISO start of the backfill window')
+    parser.add_argument('--end', help='ISO end of the backfill window (default: now)')
+    parser.add_argument('--rule-version', default=app.config['ALERT_RULE_VERSION'],
+                        help='Label stored with every event (default: ALERT_RULE_VERSION)')
+    parser.add_argument('--shard-hours', type=int, default=24, help='Hours of history per shard')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('--restart', action='store_true', help='Ignore checkpoints and reprocess every shard')
+    args = parser.parse_args()
+
+    start = datetime.fromisoformat(args.start)
+    end = datetime.fromisoformat(args.end) if args.end else datetime.now()
+    rules = current_rules(app.config)
+
+    conn, db_type = get_db_connection()
+    if not conn:
+        print("❌ Database connection failed")
+        sys.exit(1)
+    ensure_tables(conn, db_type)
+    done = set() if args.restart else _completed_shards(conn, db_type, args.rule_version)
+    conn.close()
+
+    # A checkpoint only counts if it reaches the end of the planned shard: the
+    # last shard of a run with --end is short, and is scanned again in full
+    # when a later run extends the window past it
+    shards = []
+    skipped = 0
+    shard_start = start
+    while shard_start < end:
+        shard_end = min(shard_start + timedelta(hours=args.shard_hours), end)
+        if shard_start in done and done[shard_start] >= shard_end:
+            skipped += 1
+        else:
+            shards.append((shard_start, shard_end))
+        shard_start = shard_end
+
+    print("=" * 60)
+    print(f"Re-detection {args.rule_version}: {start.isoformat()} -> {end.isoformat()}")
+    print(f"Shards: {len(shards)} pending, {skipped} already checkpointed, workers: {args.workers}")
+    for alert_type, field, comparison, threshold in rules:
+        print(f"  {alert_type}: {field} {comparison} {threshold}")
+    print("=" * 60)
+
+    started = time.time()
+    total_rows = total_events = completed = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(process_shard, s, e, args.rule_version, rules): s for s, e in shards}
+        for future in as_completed(futures):
+            try:
+                shard, rows, events, seconds = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ Shard {futures[future].isoformat()} failed: {e}")
+                continue
+            completed += 1
+            total_rows += rows
+            total_events += events
+            elapsed = time.time() - started
+            print(f"[{completed}/{len(shards)}] {shard.isoformat()}: {rows} rows, {events} events "
+                  f"({seconds:.2f}s) | {total_rows / elapsed:,.0f} rows/s overall")
+
+    elapsed = time.time() - started
+    print("=" * 60)
+    print(f"✅ Done: {total_rows} rows, {total_events} events in {elapsed:.1f}s "
+          f"({total_rows / elapsed if elapsed else 0:,.0f} rows/s)")
+    if failed:
+        print(f"⚠️  {failed} shards failed; re-run the same command to resume")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+LeakSense horizontal sharding of sensor_readings
+Devices are placed on PostgreSQL shards by rendezvous hashing of the device id
+(or an explicit region prefix map); reads scatter to every shard in parallel
+and merge per-shard rows or partial aggregates
+
+Usage (after adding a shard to DB_SHARDS and restarting the receiver):
+    python3 sharding.py status
+    python3 sharding.py rebalance [--dry-run] [--batch-size 5000]
+"""
+
+import argparse
+import hashlib
+import heapq
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+import cold_storage
+from storage_format import SCALES, to_ms, unscale
+
+# Stored-unit partials per aggregate field, in cold_storage.AGGREGATE_FIELDS
+# order: count, sum, sum of squares, min, max
+PARTIAL_AGGREGATES_QUERY = """
+    SELECT
+        COUNT(pressure), SUM(pressure), SUM(pressure::FLOAT8 * pressure), MIN(pressure), MAX(pressure),
+        COUNT(moisture), SUM(moisture), SUM(moisture::FLOAT8 * moisture), MIN(moisture), MAX(moisture),
+        COUNT(acoustic), SUM(acoustic), SUM(acoustic::FLOAT8 * acoustic), MIN(acoustic), MAX(acoustic),
+        COUNT(rssi), SUM(rssi), SUM(rssi::FLOAT8 * rssi), MIN(rssi), MAX(rssi)
+    FROM sensor_readings
+    WHERE timestamp >= %s AND timestamp < %s
+"""
+
+# Distinct devices via the (device_id, timestamp) index, one probe per device
+DEVICES_QUERY = """
+    WITH RECURSIVE devices AS (
+        (SELECT device_id FROM sensor_readings ORDER BY device_id LIMIT 1)
+        UNION ALL
+        SELECT (SELECT device_id FROM sensor_readings WHERE device_id > d.device_id ORDER BY device_id LIMIT 1)
+        FROM devices d
+        WHERE d.device_id IS NOT NULL
+    )
+    SELECT device_id FROM devices WHERE device_id IS NOT NULL
+"""
+
+MOVE_COLUMNS = ('device_id', 'pressure', 'moisture', 'acoustic', 'rssi', 'snr', 'timestamp', 'created_at')
+
+
+class ShardError(Exception):
+    """One or more shards failed during a scatter-gather read"""
+
+
+def _score(shard_name, device_id):
+    digest = hashlib.md5(f'{shard_name}:{device_id}'.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class ShardMap:
+    """Maps device ids to shards
+
+    shards: [{"name": "s1", "host": "db1", "port": "5432"}, ...]. Placement
+    uses the shard names, so a shard can move hosts without moving data.
+    regions: optional {"device-id prefix": "shard name"}; the longest matching
+    prefix wins and everything else is placed by rendezvous hashing. Adding a
+    shard to the hashed set only moves the devices that now score highest on
+    the new shard (about 1/N of them).
+    """
+
+    def __init__(self, shards, regions=None, default_port='5432'):
+        self.shards = []
+        for shard in shards:
+            port = str(shard.get('port', default_port))
+            self.shards.append({
+                'name': shard.get('name') or f"{shard['host']}:{port}",
+                'host': shard['host'],
+                'port': port
+            })
+        self.by_name = {s['name']: s for s in self.shards}
+        regions = dict(regions or {})
+        unknown = set(regions.values()) - set(self.by_name)
+        if unknown:
+            raise ValueError(f"DB_SHARD_REGIONS refers to unknown shards: {', '.join(sorted(unknown))}")
+        self.regions = sorted(regions.items(), key=lambda item: -len(item[0]))
+
+    def shard_for(self, device_id):
+        device_id = str(device_id)
+        for prefix, name in self.regions:
+            if device_id.startswith(prefix):
+                return self.by_name[name]
+        return max(self.shards, key=lambda s: _score(s['name'], device_id))
+
+    def status(self):
+        return [{'name': s['name'], 'host': s['host'], 'port': s['port']} for s in self.shards]
+
+
+class ShardSet:
+    """Parallel access to every shard of a ShardMap
+
+    connect(host, port) opens a PostgreSQL connection; each scatter call opens
+    one connection per shard on a small thread pool and closes it afterwards.
+    """
+
+    def __init__(self, shard_map, connect, max_workers=8):
+        self.map = shard_map
+        self.connect = connect
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shard') if shard_map.shards else None
+
+    @property
+    def enabled(self):
+        return bool(self.map.shards)
+
+    def _run(self, shard, fn):
+        conn = self.connect(shard['host'], shard['port'])
+        try:
+            return fn(conn)
+        finally:
+            conn.close()
+
+    def scatter(self, fn, shards=None):
+        """Run fn(conn) on every shard in parallel and return the results in shard order.
+
+        Raises ShardError naming every failed shard: a partial answer would
+        silently under-count readings.
+        """
+        shards = shards or self.map.shards
+        futures = [self.pool.submit(self._run, shard, fn) for shard in shards]
+        results, failed = [], []
+        for shard, future in zip(shards, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failed.append(f"{shard['name']}: {e}")
+        if failed:
+            raise ShardError(f"Shard query failed ({'; '.join(failed)})")
+        return results
+
+
+def merge_by_timestamp(results, reverse=False):
+    """Merge per-shard reading lists that are each sorted by timestamp."""
+    return list(heapq.merge(*results, key=lambda r: r['timestamp'], reverse=reverse))
+
+
+def partial_aggregates(conn, start, end):
+    """Mergeable count/sum/sumsq/min/max partials for one shard, sealed blocks included."""
+    cursor = conn.cursor()
+    cursor.execute(PARTIAL_AGGREGATES_QUERY, (to_ms(start), to_ms(end)))
+    row = cursor.fetchone()
+    cursor.close()
+
+    aggregates = cold_storage.empty_aggregates()
+    for i, field in enumerate(cold_storage.AGGREGATE_FIELDS):
+        count, total, sumsq, low, high = row[i * 5:(i + 1) * 5]
+        factor = SCALES.get(field, 1)
+        aggregates[field] = {
+            'count': int(count),
+            'sum': float(total or 0) / factor,
+            'sumsq': float(sumsq or 0) / (factor * factor),
+            'min': unscale(field, low),
+            'max': unscale(field, high)
+        }
+    return cold_storage.merge_aggregates(aggregates, cold_storage.cold_aggregates(conn, 'postgres', start, end))
+
+
+def statistics_from_aggregates(aggregates):
+    """/api/sensors/statistics fields from merged partials (same keys as the PostgreSQL query)."""
+    stats = {'total_readings': float(aggregates['pressure']['count'])}
+    for field in cold_storage.AGGREGATE_FIELDS:
+        agg = aggregates[field]
+        n = agg['count']
+        mean = agg['sum'] / n if n else None
+        stats[f'avg_{field}'] = mean
+        stats[f'min_{field}'] = agg['min']
+        stats[f'max_{field}'] = agg['max']
+        if field != 'rssi':
+            # Sample standard deviation, matching PostgreSQL STDDEV()
+            stats[f'std_{field}'] = (math.sqrt(max((agg['sumsq'] - n * mean * mean) / (n - 1), 0.0))
+                                     if n > 1 else None)
+    return stats
+
+
+def list_devices(conn):
+    cursor = conn.cursor()
+    cursor.execute(DEVICES_QUERY)
+    devices = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return devices
+
+
+def _row_count(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM sensor_readings")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+def plan_moves(shard_set):
+    """Return (device_id, source, target) for every device stored on a shard it no longer maps to."""
+    moves = []
+    for shard, devices in zip(shard_set.map.shards, shard_set.scatter(list_devices)):
+        for device_id in devices:
+            target = shard_set.map.shard_for(device_id)
+            if target['name'] != shard['name']:
+                moves.append((device_id, shard, target))
+    return moves
+
+
+def _move_batch(source, target, device_id, batch_size):
+    """Copy the oldest batch of a device's rows to target, then delete them from source.
+
+    Batches end on a whole timestamp. Exact copies left on the target by an
+    interrupted run are removed before inserting, so re-running is safe.
+    Returns the number of rows moved.
+    """
+    cursor = source.cursor()
+    cursor.execute("""
+        SELECT timestamp FROM sensor_readings
+        WHERE device_id = %s
+        ORDER BY timestamp
+        LIMIT 1 OFFSET %s
+    """, (device_id, batch_size - 1))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute("SELECT MAX(timestamp) FROM sensor_readings WHERE device_id = %s", (device_id,))
+        row = cursor.fetchone()
+    upper = row[0] if row else None
+    if upper is None:
+        cursor.close()
+        return 0
+
+    cursor.execute(f"""
+        SELECT {', '.join(MOVE_COLUMNS)} FROM sensor_readings
+        WHERE device_id = %s AND timestamp <= %s
+    """, (device_id, upper))
+    rows = cursor.fetchall()
+
+    target_cursor = target.cursor()
+    try:
+        execute_values(target_cursor, """
+            DELETE FROM sensor_readings t
+            USING (VALUES %s) AS v (device_id, timestamp, created_at)
+            WHERE t.device_id = v.device_id AND t.timestamp = v.timestamp AND t.created_at = v.created_at
+        """, [(r[0], r[6], r[7]) for r in rows])
+        execute_values(target_cursor, f"""
+            INSERT INTO sensor_readings ({', '.join(MOVE_COLUMNS)}) VALUES %s
+        """, rows)
+        target.commit()
+    except Exception:
+        target.rollback()
+        cursor.close()
+        raise
+    finally:
+        target_cursor.close()
+
+    try:
+        cursor.execute("DELETE FROM sensor_readings WHERE device_id = %s AND timestamp <= %s", (device_id, upper))
+        source.commit()
+    except Exception:
+        source.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(rows)
+
+
+def rebalance(shard_set, batch_size=5000, dry_run=False):
+    """Move every misplaced device's rows to the shard the current map assigns it to.
+
+    Sealed cold-storage blocks stay where they are; reads scatter to every
+    shard, so they remain visible. Returns (devices, rows) moved.
+    """
+    moves = plan_moves(shard_set)
+    if dry_run:
+        for device_id, source, target in moves:
+            print(f"  {device_id}: {source['name']} -> {target['name']}")
+        return len(moves), 0
+
+    total = 0
+    for device_id, source_shard, target_shard in moves:
+        started = time.time()
+        source = shard_set.connect(source_shard['host'], source_shard['port'])
+        target = shard_set.connect(target_shard['host'], target_shard['port'])
+        moved = 0
+        try:
+            while True:
+                count = _move_batch(source, target, device_id, batch_size)
+                if count == 0:
+                    break
+                moved += count
+        finally:
+            source.close()
+            target.close()
+        total += moved
+        print(f"  {device_id}: {moved:,} rows {source_shard['name']} -> {target_shard['name']} "
+              f"({time.time() - started:.1f}s)")
+    return len(moves), total
+
+
+def main():
+    from app import shards
+
+    parser = argparse.ArgumentParser(description='sensor_readings shard tools')
+    parser.add_argument('command', choices=['status', 'rebalance'])
+    parser.add_argument('--dry-run', action='store_true', help='List the devices that would move')
+    parser.add_argument('--batch-size', type=int, default=5000, help='Rows per copy/delete transaction')
+    args = parser.parse_args()
+
+    if not shards.enabled:
+        print("❌ DB_SHARDS is not set")
+        sys.exit(1)
+
+    try:
+        if args.command == 'status':
+            counts = shards.scatter(lambda conn: (len(list_devices(conn)), _row_count(conn)))
+            for shard, (devices, rows) in zip(shards.map.shards, counts):
+                print(f"{shard['name']:<16} {shard['host']}:{shard['port']:<6} {devices:>6} devices {rows:>12,} rows")
+            moves = plan_moves(shards)
+            print(f"{len(moves)} devices are on the wrong shard" if moves else "✅ Every device is on its shard")
+        else:
+            started = time.time()
+            devices, rows = rebalance(shards, args.batch_size, args.dry_run)
+            if args.dry_run:
+                print(f"{devices} devices would move")
+            else:
+                print(f"✅ Moved {rows:,} rows of {devices} devices in {time.time() - started:.1f}s")
+    except Exception as e:
+        print(f"❌ {args.command} failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+LeakSense sensor_readings storage format
+sensor_readings keeps timestamps as integer epoch milliseconds and sensor
+values as scaled integers; these helpers convert at the API edge
+
+Usage (convert a database created with TIMESTAMP/REAL columns, including
+sealed sensor_blocks):
+    python3 storage_format.py migrate [--timezone Europe/Berlin]
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+# Stored value = round(value * scale). Resolution: 0.01 PSI / % / dB, 0.1 dB SNR.
+SCALES = {
+    'pressure': 100,
+    'moisture': 100,
+    'acoustic': 100,
+    'snr': 10
+}
+TIME_FIELDS = ('timestamp', 'created_at')
+AGGREGATE_PREFIXES = ('avg_', 'min_', 'max_', 'std_')
+
+# Defaults replace the old per-row set_created_at trigger
+NOW_MS_POSTGRES = "(EXTRACT(EPOCH FROM clock_timestamp()) * 1000)::BIGINT"
+NOW_MS_SQLITE = "(CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER))"
+
+CREATE_READINGS_SQLITE = f"""
+CREATE TABLE IF NOT EXISTS sensor_readings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL DEFAULT 'default',
+    pressure INTEGER NOT NULL,              -- PSI x 100
+    moisture INTEGER NOT NULL,              -- % x 100
+    acoustic INTEGER NOT NULL,              -- dB x 100
+    rssi INTEGER,                           -- dBm
+    snr INTEGER,                            -- dB x 10
+    timestamp INTEGER NOT NULL DEFAULT {NOW_MS_SQLITE},   -- epoch ms
+    created_at INTEGER NOT NULL DEFAULT {NOW_MS_SQLITE}   -- epoch ms
+);
+"""
+
+CREATE_READINGS_INDEXES_SQLITE = """
+CREATE INDEX IF NOT EXISTS idx_timestamp ON sensor_readings(timestamp);
+CREATE INDEX IF NOT EXISTS idx_device_timestamp ON sensor_readings(device_id, timestamp);
+"""
+
+# Legacy SQLite rows hold local-time text timestamps (written by Python) and
+# UTC text created_at (CURRENT_TIMESTAMP default)
+MIGRATE_SQLITE = f"""
+ALTER TABLE sensor_readings RENAME TO sensor_readings_legacy;
+{CREATE_READINGS_SQLITE}
+INSERT INTO sensor_readings (id, device_id, pressure, moisture, acoustic, rssi, snr, timestamp, created_at)
+SELECT
+    id, device_id,
+    CAST(ROUND(pressure * 100) AS INTEGER),
+    CAST(ROUND(moisture * 100) AS INTEGER),
+    CAST(ROUND(acoustic * 100) AS INTEGER),
+    rssi,
+    CAST(ROUND(snr * 10) AS INTEGER),
+    CAST(ROUND((julianday(timestamp, 'utc') - 2440587.5) * 86400000) AS INTEGER),
+    CAST(ROUND((julianday(created_at) - 2440587.5) * 86400000) AS INTEGER)
+FROM sensor_readings_legacy;
+DROP TABLE sensor_readings_legacy;
+{CREATE_READINGS_INDEXES_SQLITE}
+"""
+
+# Views depending on the old column types are dropped here and recreated
+# from database/schema.sql
+MIGRATE_POSTGRES = f"""
+DROP VIEW IF EXISTS recent_readings, hourly_averages, daily_statistics, alert_readings;
+DROP TRIGGER IF EXISTS set_created_at ON sensor_readings;
+DROP FUNCTION IF EXISTS update_created_at();
+
+ALTER TABLE sensor_readings
+    DROP CONSTRAINT IF EXISTS sensor_readings_pressure_check,
+    DROP CONSTRAINT IF EXISTS sensor_readings_moisture_check,
+    DROP CONSTRAINT IF EXISTS sensor_readings_acoustic_check,
+    DROP CONSTRAINT IF EXISTS sensor_readings_rssi_check,
+    ALTER COLUMN timestamp DROP DEFAULT,
+    ALTER COLUMN created_at DROP DEFAULT;
+
+ALTER TABLE sensor_readings
+    ALTER COLUMN pressure TYPE SMALLINT USING round(pressure * 100),
+    ALTER COLUMN moisture TYPE SMALLINT USING round(moisture * 100),
+    ALTER COLUMN acoustic TYPE SMALLINT USING round(acoustic * 100),
+    ALTER COLUMN rssi TYPE SMALLINT,
+    ALTER COLUMN snr TYPE SMALLINT USING round(snr * 10),
+    ALTER COLUMN timestamp TYPE BIGINT USING round(EXTRACT(EPOCH FROM "timestamp"::timestamptz) * 1000),
+    ALTER COLUMN created_at TYPE BIGINT USING round(EXTRACT(EPOCH FROM created_at::timestamptz) * 1000);
+
+ALTER TABLE sensor_readings
+    ALTER COLUMN timestamp SET DEFAULT {NOW_MS_POSTGRES},
+    ALTER COLUMN created_at SET DEFAULT {NOW_MS_POSTGRES},
+    ADD CONSTRAINT sensor_readings_pressure_check CHECK (pressure >= 0 AND pressure <= 20000),
+    ADD CONSTRAINT sensor_readings_moisture_check CHECK (moisture >= 0 AND moisture <= 10000),
+    ADD CONSTRAINT sensor_readings_acoustic_check CHECK (acoustic >= 0 AND acoustic <= 15000),
+    ADD CONSTRAINT sensor_readings_rssi_check CHECK (rssi >= -120 AND rssi <= 0);
+"""
+
+
+def to_ms(value):
+    """datetime (naive = local time), ISO string or epoch ms -> epoch ms."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return int(round(value.timestamp() * 1000))
+    return int(value)
+
+
+def from_ms(value):
+    """Epoch ms -> naive local datetime (the form the rest of the API uses)."""
+    return datetime.fromtimestamp(value / 1000.0) if value is not None else None
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def scale(field, value):
+    """Engineering value -> stored integer."""
+    if value is None:
+        return None
+    return int(round(float(value) * SCALES.get(field, 1)))
+
+
+def unscale(field, value):
+    """Stored integer (or an aggregate of stored integers) -> engineering value."""
+    if value is None:
+        return None
+    if field in SCALES:
+        return float(value) / SCALES[field]
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def decode_row(row):
+    """Stored sensor_readings row -> dict with datetimes and float sensor values."""
+    reading = dict(row)
+    for field in TIME_FIELDS:
+        if field in reading:
+            reading[field] = from_ms(reading[field])
+    for field in SCALES:
+        if field in reading:
+            reading[field] = unscale(field, reading[field])
+    return reading
+
+
+def decode_aggregates(stats):
+    """Unscale avg_/min_/max_/std_<field> values of an aggregate row; counts become floats."""
+    decoded = {}
+    for key, value in dict(stats).items():
+        field = key.split('_', 1)[1] if key.startswith(AGGREGATE_PREFIXES) else None
+        decoded[key] = float(value) if value is not None else None
+        if field in SCALES and value is not None:
+            decoded[key] = unscale(field, value)
+    return decoded
+
+
+def is_legacy(conn, db_type, table='sensor_readings', column='timestamp'):
+    """True when table.column is still a TIMESTAMP column."""
+    cursor = conn.cursor()
+    if db_type == 'postgres':
+        cursor.execute("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = %s AND column_name = %s
+        """, (table, column))
+        row = cursor.fetchone()
+        declared = row[0] if row else None
+    else:
+        rows = cursor.execute(f"PRAGMA table_info({table})").fetchall()
+        declared = next((r[2] for r in rows if r[1] == column), None)
+    cursor.close()
+    return declared is not None and declared.lower().startswith('timestamp')
+
+
+def migrate(conn, db_type, timezone=None):
+    """Convert a legacy sensor_readings table in place (single transaction).
+
+    PostgreSQL interprets the stored naive timestamps in the session time zone;
+    pass timezone when the receiver's clock ran in a different zone than the
+    database server's TimeZone setting. Returns False if already migrated.
+    """
+    if not is_legacy(conn, db_type):
+        return False
+    cursor = conn.cursor()
+    try:
+        if db_type == 'postgres':
+            if timezone:
+                cursor.execute("SET LOCAL TIME ZONE %s", (timezone,))
+            cursor.execute(MIGRATE_POSTGRES)
+            conn.commit()
+        else:
+            # executescript commits first, so wrap the rebuild explicitly
+            cursor.executescript(f"BEGIN;\n{MIGRATE_SQLITE}\nCOMMIT;")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return True
+
+
+def main():
+    from app import get_db_connection
+    import cold_storage
+
+    parser = argparse.ArgumentParser(description='sensor_readings storage format tools')
+    parser.add_argument('command', choices=['migrate'])
+    parser.add_argument('--timezone', help='Zone the legacy timestamps were written in (PostgreSQL only)')
+    args = parser.parse_args()
+
+    conn, db_type = get_db_connection()
+    if not conn:
+        print("❌ Database connection failed")
+        sys.exit(1)
+    try:
+        started = time.time()
+        if migrate(conn, db_type, args.timezone):
+            print(f"✅ sensor_readings converted to epoch-ms / scaled-integer columns "
+                  f"({db_type}, {time.time() - started:.1f}s)")
+            if db_type == 'postgres':
+                print("⚠️  Re-create the reporting views: run the view and function section of database/schema.sql")
+        else:
+            print("sensor_readings already uses the epoch-ms layout; nothing to do")
+        if cold_storage.migrate_blocks(conn, db_type, args.timezone):
+            print("✅ sensor_blocks chunk bounds converted to epoch ms")
+    except Exception as e:
+        print(f"❌ Migration failed, nothing was changed: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+LeakSense pipe-network topology index
+Pipes, their segments and the placement of sensor nodes on them, held in an
+in-memory graph with a uniform-grid spatial index so bounding-box and
+upstream/downstream queries never touch sensor_readings
+
+Segments are directed in the flow direction (from_junction -> to_junction);
+a node sits offset_m along its segment from the upstream end. Coordinates
+are whatever the map uses (lon/lat or projected metres); distances along the
+network come from length_m.
+
+Usage:
+    python3 topology.py load network.json
+    python3 topology.py export > network.json
+"""
+
+import heapq
+import json
+import math
+import sys
+import time
+from datetime import datetime
+
+import cold_storage
+from storage_format import SCALES, decode_row, to_ms, unscale
+
+PIPE_COLUMNS = ('id', 'name', 'district', 'material', 'diameter_mm')
+SEGMENT_COLUMNS = ('id', 'pipe_id', 'from_junction', 'to_junction', 'length_m',
+                   'start_x', 'start_y', 'end_x', 'end_y')
+NODE_COLUMNS = ('device_id', 'segment_id', 'offset_m', 'x', 'y')
+
+CREATE_TOPOLOGY_POSTGRES = """
+CREATE TABLE IF NOT EXISTS pipes (
+    id VARCHAR(32) PRIMARY KEY,
+    name VARCHAR(128),
+    district VARCHAR(64),
+    material VARCHAR(32),
+    diameter_mm REAL
+);
+
+CREATE TABLE IF NOT EXISTS pipe_segments (
+    id VARCHAR(32) PRIMARY KEY,
+    pipe_id VARCHAR(32) NOT NULL REFERENCES pipes(id),
+    from_junction VARCHAR(32) NOT NULL,
+    to_junction VARCHAR(32) NOT NULL,
+    length_m REAL NOT NULL CHECK (length_m > 0),
+    start_x DOUBLE PRECISION NOT NULL,
+    start_y DOUBLE PRECISION NOT NULL,
+    end_x DOUBLE PRECISION NOT NULL,
+    end_y DOUBLE PRECISION NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS node_placements (
+    device_id VARCHAR(32) PRIMARY KEY,
+    segment_id VARCHAR(32) NOT NULL REFERENCES pipe_segments(id),
+    offset_m REAL NOT NULL CHECK (offset_m >= 0),
+    x DOUBLE PRECISION,
+    y DOUBLE PRECISION
+);
+"""
+
+CREATE_TOPOLOGY_SQLITE = """
+CREATE TABLE IF NOT EXISTS pipes (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    district TEXT,
+    material TEXT,
+    diameter_mm REAL
+);
+
+CREATE TABLE IF NOT EXISTS pipe_segments (
+    id TEXT PRIMARY KEY,
+    pipe_id TEXT NOT NULL REFERENCES pipes(id),
+    from_junction TEXT NOT NULL,
+    to_junction TEXT NOT NULL,
+    length_m REAL NOT NULL CHECK (length_m > 0),
+    start_x REAL NOT NULL,
+    start_y REAL NOT NULL,
+    end_x REAL NOT NULL,
+    end_y REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS node_placements (
+    device_id TEXT PRIMARY KEY,
+    segment_id TEXT NOT NULL REFERENCES pipe_segments(id),
+    offset_m REAL NOT NULL CHECK (offset_m >= 0),
+    x REAL,
+    y REAL
+);
+"""
+
+# Stored-unit partials per aggregate field (cold_storage.AGGREGATE_FIELDS
+# order: count, sum, sum of squares, min, max) for a set of devices; served by
+# the (device_id, timestamp) index. Works on PostgreSQL and SQLite.
+DEVICE_AGGREGATES_QUERY = """
+    SELECT
+        COUNT(pressure), SUM(pressure), SUM(CAST(pressure AS DOUBLE PRECISION) * pressure), MIN(pressure), MAX(pressure),
+        COUNT(moisture), SUM(moisture), SUM(CAST(moisture AS DOUBLE PRECISION) * moisture), MIN(moisture), MAX(moisture),
+        COUNT(acoustic), SUM(acoustic), SUM(CAST(acoustic AS DOUBLE PRECISION) * acoustic), MIN(acoustic), MAX(acoustic),
+        COUNT(rssi), SUM(rssi), SUM(CAST(rssi AS DOUBLE PRECISION) * rssi), MIN(rssi), MAX(rssi)
+    FROM sensor_readings
+    WHERE device_id IN ({devices}) AND timestamp >= {ph} AND timestamp < {ph}
+"""
+
+
+def parse_bbox(value):
+    """'min_x,min_y,max_x,max_y' -> tuple of floats (ValueError if malformed)."""
+    parts = [float(v) for v in value.split(',')]
+    if len(parts) != 4 or not all(math.isfinite(v) for v in parts):
+        raise ValueError('bbox must be min_x,min_y,max_x,max_y')
+    min_x, min_y, max_x, max_y = parts
+    if min_x > max_x or min_y > max_y:
+        raise ValueError('bbox minimum exceeds maximum')
+    return min_x, min_y, max_x, max_y
+
+
+def _clips(x1, y1, x2, y2, bbox):
+    """True when the line segment (x1, y1)-(x2, y2) touches bbox (Liang-Barsky)."""
+    min_x, min_y, max_x, max_y = bbox
+    t0, t1 = 0.0, 1.0
+    dx, dy = x2 - x1, y2 - y1
+    for p, q in ((-dx, x1 - min_x), (dx, max_x - x1), (-dy, y1 - min_y), (dy, max_y - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+            if t0 > t1:
+                return False
+    return True
+
+
+class SpatialGrid:
+    """Uniform grid of cells -> item keys over axis-aligned boxes
+
+    An item is listed in every cell its box overlaps. A query collects the
+    keys in the cells the box covers; callers apply the exact test. Queries
+    that would visit more cells than there are items scan the items instead.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.cells = {}
+        self.boxes = {}
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, key, min_x, min_y, max_x, max_y):
+        self.boxes[key] = (min_x, min_y, max_x, max_y)
+        (cx0, cy0), (cx1, cy1) = self._cell(min_x, min_y), self._cell(max_x, max_y)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.cells.setdefault((cx, cy), []).append(key)
+
+    def query(self, bbox):
+        """Keys whose box intersects bbox."""
+        min_x, min_y, max_x, max_y = bbox
+        (cx0, cy0), (cx1, cy1) = self._cell(min_x, min_y), self._cell(max_x, max_y)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.boxes):
+            candidates = self.boxes
+        else:
+            candidates = set()
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    candidates.update(self.cells.get((cx, cy), ()))
+        result = []
+        for key in candidates:
+            bx0, by0, bx1, by1 = self.boxes[key]
+            if bx0 <= max_x and bx1 >= min_x and by0 <= max_y and by1 >= min_y:
+                result.append(key)
+        return result
+
+
+class TopologyIndex:
+    """Immutable in-memory view of a network: graph adjacency plus spatial grids
+
+    Built from the rows of pipes / pipe_segments / node_placements (see
+    load_network). Raises ValueError when the network is inconsistent.
+    """
+
+    def __init__(self, network):
+        self.pipes = {p['id']: dict(p) for p in network.get('pipes', [])}
+        self.segments = {}
+        self.nodes = {}
+        self.downstream_of = {}  # junction -> segment ids leaving it
+        self.upstream_of = {}    # junction -> segment ids entering it
+        self.segment_nodes = {}  # segment id -> device ids, ordered by offset
+
+        for s in network.get('segments', []):
+            s = dict(s)
+            if s['pipe_id'] not in self.pipes:
+                raise ValueError(f"Segment {s['id']} references unknown pipe {s['pipe_id']}")
+            if s['id'] in self.segments:
+                raise ValueError(f"Duplicate segment {s['id']}")
+            s['length_m'] = float(s['length_m'])
+            if not s['length_m'] > 0:
+                raise ValueError(f"Segment {s['id']} needs a positive length_m")
+            for key in ('start_x', 'start_y', 'end_x', 'end_y'):
+                s[key] = float(s[key])
+            self.segments[s['id']] = s
+            self.downstream_of.setdefault(s['from_junction'], []).append(s['id'])
+            self.upstream_of.setdefault(s['to_junction'], []).append(s['id'])
+            self.segment_nodes[s['id']] = []
+
+        for n in network.get('nodes', []):
+            n = dict(n)
+            segment = self.segments.get(n['segment_id'])
+            if segment is None:
+                raise ValueError(f"Node {n['device_id']} references unknown segment {n['segment_id']}")
+            if n['device_id'] in self.nodes:
+                raise ValueError(f"Duplicate node {n['device_id']}")
+            n['offset_m'] = float(n['offset_m'])
+            if not 0 <= n['offset_m'] <= segment['length_m']:
+                raise ValueError(f"Node {n['device_id']} offset_m is outside segment {segment['id']}")
+            if n.get('x') is None or n.get('y') is None:
+                # Interpolate along the straight segment
+                f = n['offset_m'] / segment['length_m']
+                n['x'] = segment['start_x'] + f * (segment['end_x'] - segment['start_x'])
+                n['y'] = segment['start_y'] + f * (segment['end_y'] - segment['start_y'])
+            n['x'], n['y'] = float(n['x']), float(n['y'])
+            self.nodes[n['device_id']] = n
+            self.segment_nodes[n['segment_id']].append(n['device_id'])
+
+        for device_ids in self.segment_nodes.values():
+            device_ids.sort(key=lambda d: self.nodes[d]['offset_m'])
+
+        # Aim for a few items per cell over the network's extent
+        xs = [v for s in self.segments.values() for v in (s['start_x'], s['end_x'])]
+        ys = [v for s in self.segments.values() for v in (s['start_y'], s['end_y'])]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys)) if xs else None
+        items = max(len(self.segments) + len(self.nodes), 1)
+        if self.bounds:
+            width, height = self.bounds[2] - self.bounds[0], self.bounds[3] - self.bounds[1]
+            cell = math.sqrt(width * height / items) if width and height else max(width, height) / items
+        else:
+            cell = 0.0
+        self.cell_size = cell if cell > 0 else 1.0
+
+        self.node_grid = SpatialGrid(self.cell_size)
+        for device_id, n in self.nodes.items():
+            self.node_grid.insert(device_id, n['x'], n['y'], n['x'], n['y'])
+        self.segment_grid = SpatialGrid(self.cell_size)
+        for segment_id, s in self.segments.items():
+            self.segment_grid.insert(segment_id, min(s['start_x'], s['end_x']), min(s['start_y'], s['end_y']),
+                                     max(s['start_x'], s['end_x']), max(s['start_y'], s['end_y']))
+        self.built_at = time.time()
+
+    def node(self, device_id):
+        """Placement of one node with its pipe context, or None."""
+        n = self.nodes.get(device_id)
+        if n is None:
+            return None
+        segment = self.segments[n['segment_id']]
+        pipe = self.pipes[segment['pipe_id']]
+        return dict(n, pipe_id=pipe['id'], district=pipe.get('district'))
+
+    def nodes_in_bbox(self, bbox):
+        """Node placements inside bbox, ordered by device id."""
+        return [self.node(d) for d in sorted(self.node_grid.query(bbox))]
+
+    def segments_in_bbox(self, bbox):
+        """Segments crossing bbox, ordered by id."""
+        hits = []
+        for segment_id in self.segment_grid.query(bbox):
+            s = self.segments[segment_id]
+            if _clips(s['start_x'], s['start_y'], s['end_x'], s['end_y'], bbox):
+                hits.append(segment_id)
+        return [self.segment(s) for s in sorted(hits)]
+
+    def segment(self, segment_id):
+        """One segment with its pipe attributes and node ids, or None."""
+        s = self.segments.get(segment_id)
+        if s is None:
+            return None
+        pipe = self.pipes[s['pipe_id']]
+        return dict(s, district=pipe.get('district'), pipe_name=pipe.get('name'),
+                    nodes=list(self.segment_nodes[segment_id]))
+
+    def trace(self, device_id, direction='downstream', max_distance_m=None):
+        """Nodes and segments reachable from a node along (or against) the flow.
+
+        Shortest network distance per node (Dijkstra over junctions), nearest
+        first. Returns None for an unknown device.
+        """
+        start = self.nodes.get(device_id)
+        if start is None:
+            return None
+        limit = math.inf if max_distance_m is None else float(max_distance_m)
+        downstream = direction == 'downstream'
+        found = {}
+        segments = {start['segment_id']: 0.0}
+
+        def visit(segment_id, entry_distance, from_offset=None):
+            """Reach nodes on a segment entered at entry_distance."""
+            length = self.segments[segment_id]['length_m']
+            for other in self.segment_nodes[segment_id]:
+                if other == device_id:
+                    continue
+                offset = self.nodes[other]['offset_m']
+                if from_offset is not None:
+                    # Starting segment: only nodes on the far side of the start node
+                    if offset <= from_offset if downstream else offset >= from_offset:
+                        continue
+                    distance = abs(offset - from_offset)
+                else:
+                    distance = entry_distance + (offset if downstream else length - offset)
+                if distance <= limit and distance < found.get(other, math.inf):
+                    found[other] = distance
+
+        segment = self.segments[start['segment_id']]
+        visit(segment['id'], 0.0, start['offset_m'])
+        if downstream:
+            first_junction, first_distance = segment['to_junction'], segment['length_m'] - start['offset_m']
+        else:
+            first_junction, first_distance = segment['from_junction'], start['offset_m']
+
+        best = {first_junction: first_distance}
+        heap = [(first_distance, first_junction)]
+        edges = self.downstream_of if downstream else self.upstream_of
+        while heap:
+            distance, junction = heapq.heappop(heap)
+            if distance > best.get(junction, math.inf) or distance > limit:
+                continue
+            for segment_id in edges.get(junction, ()):
+                s = self.segments[segment_id]
+                if distance < segments.get(segment_id, math.inf):
+                    segments[segment_id] = distance
+                visit(segment_id, distance)
+                nxt = s['to_junction'] if downstream else s['from_junction']
+                total = distance + s['length_m']
+                if total < best.get(nxt, math.inf):
+                    best[nxt] = total
+                    heapq.heappush(heap, (total, nxt))
+
+        nodes = [dict(self.node(d), distance_m=round(found[d], 3))
+                 for d in sorted(found, key=lambda d: (found[d], d))]
+        return {
+            'device_id': device_id,
+            'direction': direction,
+            'nodes': nodes,
+            'segments': sorted(segments, key=lambda s: (segments[s], s))
+        }
+
+    def status(self):
+        return {
+            'pipes': len(self.pipes),
+            'segments': len(self.segments),
+            'nodes': len(self.nodes),
+            'bounds': list(self.bounds) if self.bounds else None,
+            'cell_size': self.cell_size,
+            'built_at': datetime.fromtimestamp(self.built_at).isoformat()
+        }
+
+
+def ensure_topology_tables(conn, db_type):
+    """Create the topology tables if missing (idempotent)."""
+    cursor = conn.cursor()
+    if db_type == 'postgres':
+        cursor.execute(CREATE_TOPOLOGY_POSTGRES)
+    else:
+        cursor.executescript(CREATE_TOPOLOGY_SQLITE)
+    conn.commit()
+    cursor.close()
+
+
+def load_network(conn, db_type):
+    """Rows of pipes / pipe_segments / node_placements as {'pipes', 'segments', 'nodes'} lists."""
+    cursor = conn.cursor()
+    network = {}
+    try:
+        for key, table, columns in (('pipes', 'pipes', PIPE_COLUMNS),
+                                    ('segments', 'pipe_segments', SEGMENT_COLUMNS),
+                                    ('nodes', 'node_placements', NODE_COLUMNS)):
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {columns[0]}")
+            network[key] = [dict(zip(columns, tuple(row))) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    return network
+
+
+def save_network(conn, db_type, network):
+    """Replace the stored network in one transaction (validated first).
+
+    Returns the TopologyIndex built from it.
+    """
+    index = TopologyIndex(network)
+    ph = '%s' if db_type == 'postgres' else '?'
+    cursor = conn.cursor()
+    try:
+        for table in ('node_placements', 'pipe_segments', 'pipes'):
+            cursor.execute(f"DELETE FROM {table}")
+        for table, columns, rows in (('pipes', PIPE_COLUMNS, index.pipes.values()),
+                                     ('pipe_segments', SEGMENT_COLUMNS, index.segments.values()),
+                                     ('node_placements', NODE_COLUMNS, network.get('nodes', []))):
+            cursor.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([ph] * len(columns))})",
+                [tuple(row.get(c) for c in columns) for row in rows]
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return index
+
+
+def latest_readings(conn, db_type, device_ids):
+    """Newest decoded reading per device: one (device_id, timestamp) index probe each."""
+    ph = '%s' if db_type == 'postgres' else '?'
+    if db_type == 'postgres':
+        from psycopg2.extras import RealDictCursor
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+    else:
+        cursor = conn.cursor()
+    readings = {}
+    try:
+        for device_id in device_ids:
+            cursor.execute(f"""
+                SELECT * FROM sensor_readings
+                WHERE device_id = {ph}
+                ORDER BY timestamp DESC
+                LIMIT 1
+            """, (device_id,))
+            row = cursor.fetchone()
+            if row:
+                readings[device_id] = decode_row(row)
+    finally:
+        cursor.close()
+    return readings
+
+
+def device_aggregates(conn, db_type, device_ids, start, end):
+    """Mergeable count/sum/sumsq/min/max partials (cold_storage layout) for a set of devices."""
+    aggregates = cold_storage.empty_aggregates()
+    if not device_ids:
+        return aggregates
+    ph = '%s' if db_type == 'postgres' else '?'
+    cursor = conn.cursor()
+    try:
+        cursor.execute(DEVICE_AGGREGATES_QUERY.format(devices=', '.join([ph] * len(device_ids)), ph=ph),
+                       list(device_ids) + [to_ms(start), to_ms(end)])
+        row = tuple(cursor.fetchone())
+    finally:
+        cursor.close()
+    for i, field in enumerate(cold_storage.AGGREGATE_FIELDS):
+        count, total, sumsq, low, high = row[i * 5:(i + 1) * 5]
+        factor = SCALES.get(field, 1)
+        aggregates[field] = {
+            'count': int(count),
+            'sum': float(total or 0) / factor,
+            'sumsq': float(sumsq or 0) / (factor * factor),
+            'min': unscale(field, low),
+            'max': unscale(field, high)
+        }
+    return aggregates
+
+
+def main():
+    """Load a network from JSON into the database, or export the stored one"""
+    from app import get_db_connection
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('load', 'export') or (sys.argv[1] == 'load' and len(sys.argv) < 3):
+        print(__doc__.split('Usage:')[1].rstrip())
+        sys.exit(2)
+
+    conn, db_type = get_db_connection()
+    if not conn:
+        print("❌ Database connection failed")
+        sys.exit(1)
+    try:
+        ensure_topology_tables(conn, db_type)
+        if sys.argv[1] == 'export':
+            print(json.dumps(load_network(conn, db_type), indent=2))
+            return
+        with open(sys.argv[2]) as f:
+            network = json.load(f)
+        try:
+            index = save_network(conn, db_type, network)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"❌ Invalid network: {e}")
+            sys.exit(1)
+        status = index.status()
+        print(f"✅ Loaded {status['pipes']} pipes, {status['segments']} segments, {status['nodes']} nodes")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Acoustic burst handling for the LeakSense receiver
+Reassembles fragmented raw-sample bursts from LoRa and uploads them in batches
+to the Flask API for spectral analysis
+"""
+
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+API_URL = os.getenv('LEAKSENSE_API_URL', 'http://localhost:5000')
+UPLOAD_BATCH_SIZE = int(os.getenv('BURST_UPLOAD_BATCH', 32))
+UPLOAD_INTERVAL = float(os.getenv('BURST_UPLOAD_INTERVAL', 10))  # seconds
+UPLOAD_QUEUE_SIZE = int(os.getenv('BURST_QUEUE_SIZE', 1000))  # completed bursts waiting for upload
+UPLOAD_MAX_ATTEMPTS = int(os.getenv('BURST_MAX_ATTEMPTS', 5))
+UPLOAD_RETRY_SECONDS = float(os.getenv('BURST_RETRY_SECONDS', 2))  # doubled after each failed attempt
+FRAGMENT_TIMEOUT = 30  # seconds before an incomplete burst is dropped
+
+
+class BurstAssembler:
+    """Collects burst fragments until every part of a burst has arrived
+
+    Fragment packet format (JSON):
+        {"device": "node-01", "burst": 12, "frag": 0, "of": 4, "sr": 4000, "data": "<hex u8 samples>"}
+    """
+
+    def __init__(self, timeout=FRAGMENT_TIMEOUT):
+        self.timeout = timeout
+        self.pending = {}
+        self.dropped = 0    # incomplete bursts that timed out
+        self.rejected = 0   # bursts dropped because of a corrupt fragment header
+
+    def add(self, packet):
+        """Add a fragment; returns the completed burst dict or None.
+
+        A fragment whose index is outside 0..of-1, or whose "of" disagrees with
+        earlier fragments of the same burst, discards the whole burst.
+        """
+        self._expire()
+        key = (str(packet.get('device', 'default')), int(packet['burst']))
+        total = int(packet['of'])
+        frag = int(packet['frag'])
+        entry = self.pending.get(key)
+        if not 0 <= frag < total or (entry is not None and entry['total'] != total):
+            self.pending.pop(key, None)
+            self.rejected += 1
+            return None
+
+        if entry is None:
+            entry = self.pending[key] = {
+                'first_seen': time.time(),
+                'total': total,
+                'sample_rate': int(packet['sr']),
+                'fragments': {}
+            }
+        entry['fragments'][frag] = bytes.fromhex(packet['data'])
+
+        if len(entry['fragments']) < entry['total']:
+            return None
+
+        del self.pending[key]
+        raw = b''.join(entry['fragments'][i] for i in range(entry['total']))
+        return {
+            'device_id': key[0],
+            'timestamp': datetime.fromtimestamp(entry['first_seen']).isoformat(),
+            'sample_rate': entry['sample_rate'],
+            # Unsigned 8-bit ADC samples centred on 128
+            'samples': [b - 128 for b in raw]
+        }
+
+    def _expire(self):
+        now = time.time()
+        for key in [k for k, v in self.pending.items() if now - v['first_seen'] > self.timeout]:
+            del self.pending[key]
+            self.dropped += 1
+
+
+class BurstUploader(threading.Thread):
+    """Background thread that posts completed bursts to the API in batches
+
+    The queue holds at most queue_size bursts; further bursts are dropped and
+    counted. A batch that fails with a network or server error is retried
+    after an exponential backoff, up to max_attempts times.
+    """
+
+    def __init__(self, api_url=API_URL, batch_size=UPLOAD_BATCH_SIZE, interval=UPLOAD_INTERVAL, on_features=None,
+                 queue_size=UPLOAD_QUEUE_SIZE, max_attempts=UPLOAD_MAX_ATTEMPTS, retry_seconds=UPLOAD_RETRY_SECONDS):
+        super(BurstUploader, self).__init__(daemon=True)
+        self.url = api_url.rstrip('/') + '/api/acoustic/bursts'
+        self.batch_size = batch_size
+        self.interval = interval
+        self.on_features = on_features  # called with the API's per-burst features
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.queue = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.uploaded = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def submit(self, burst):
+        """Queue a completed burst; never blocks."""
+        with self.lock:
+            if len(self.queue) >= self.queue_size:
+                self.dropped += 1
+                print(f"❌ Acoustic burst queue is full; dropped burst from {burst['device_id']}")
+                return
+            self.queue.append(burst)
+            if len(self.queue) >= self.batch_size:
+                self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            with self.lock:
+                batch, self.queue = self.queue[:self.batch_size * 4], self.queue[self.batch_size * 4:]
+            if batch:
+                self._upload(batch)
+
+    def _upload(self, batch):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                result = self._post(batch)
+            except urllib.error.HTTPError as e:
+                error = e
+                if e.code < 500 and e.code != 429:
+                    break  # rejected by the API; resending will not help
+            except Exception as e:
+                error = e
+            else:
+                self.uploaded += len(batch)
+                print(f"🎙️  Uploaded {len(batch)} acoustic bursts "
+                      f"({result.get('leak_signatures', 0)} leak signatures)")
+                if self.on_features:
+                    self.on_features(result.get('data', []))
+                return
+            if attempt < self.max_attempts:
+                self.retried += 1
+                time.sleep(self.retry_seconds * 2 ** (attempt - 1))
+        self.failed += len(batch)
+        print(f"❌ Acoustic burst upload failed after {attempt} attempts, {len(batch)} bursts lost: {error}")
+
+    def _post(self, batch):
+        body = json.dumps({'bursts': batch}).encode('utf-8')
+        req = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return json.loads(resp.read().decode('utf-8'))
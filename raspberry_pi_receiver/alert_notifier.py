@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Alert notifications for the LeakSense receiver
+Debounces and coalesces alerts per device on a background thread and fans them
+out to webhook / SMTP / MQTT sinks through retrying per-sink queues, so a slow
+or unreachable sink never delays packet handling
+
+Run directly to exercise the dispatcher against local stand-in sinks:
+    python3 alert_notifier.py
+"""
+
+import json
+import os
+import queue
+import smtplib
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from email.message import EmailMessage
+
+# Thresholds (same variables as the Flask API)
+MOISTURE_THRESHOLD = float(os.getenv('MOISTURE_THRESHOLD', 70.0))
+ACOUSTIC_THRESHOLD = float(os.getenv('ACOUSTIC_THRESHOLD', 75.0))
+PRESSURE_MIN = float(os.getenv('PRESSURE_MIN', 20.0))
+PRESSURE_MAX = float(os.getenv('PRESSURE_MAX', 80.0))
+ACOUSTIC_HIGH_BAND_MIN = float(os.getenv('ACOUSTIC_HIGH_BAND_MIN', 0.5))
+
+# Dispatch
+ALERT_DEBOUNCE_SECONDS = float(os.getenv('ALERT_DEBOUNCE_SECONDS', 10))  # collect repeats before the first notification
+ALERT_REPEAT_SECONDS = float(os.getenv('ALERT_REPEAT_SECONDS', 600))     # at most one follow-up per alert per period
+ALERT_CLEAR_SECONDS = float(os.getenv('ALERT_CLEAR_SECONDS', 300))       # quiet this long and the alert starts over
+ALERT_QUEUE_SIZE = int(os.getenv('ALERT_QUEUE_SIZE', 1000))
+ALERT_MAX_ATTEMPTS = int(os.getenv('ALERT_MAX_ATTEMPTS', 5))
+ALERT_RETRY_SECONDS = float(os.getenv('ALERT_RETRY_SECONDS', 2))         # doubled after each failed attempt
+
+# Sinks: each one is enabled by setting its host/URL
+ALERT_WEBHOOK_URL = os.getenv('ALERT_WEBHOOK_URL', '')
+ALERT_WEBHOOK_CONCURRENCY = int(os.getenv('ALERT_WEBHOOK_CONCURRENCY', 4))
+ALERT_SMTP_HOST = os.getenv('ALERT_SMTP_HOST', '')
+ALERT_SMTP_PORT = int(os.getenv('ALERT_SMTP_PORT', 587))
+ALERT_SMTP_USER = os.getenv('ALERT_SMTP_USER', '')
+ALERT_SMTP_PASSWORD = os.getenv('ALERT_SMTP_PASSWORD', '')
+ALERT_SMTP_STARTTLS = os.getenv('ALERT_SMTP_STARTTLS', 'True').lower() == 'true'
+ALERT_SMTP_FROM = os.getenv('ALERT_SMTP_FROM', 'leaksense@localhost')
+ALERT_SMTP_TO = [a.strip() for a in os.getenv('ALERT_SMTP_TO', '').split(',') if a.strip()]
+ALERT_SMTP_CONCURRENCY = int(os.getenv('ALERT_SMTP_CONCURRENCY', 1))
+ALERT_MQTT_HOST = os.getenv('ALERT_MQTT_HOST', '')
+ALERT_MQTT_PORT = int(os.getenv('ALERT_MQTT_PORT', 1883))
+ALERT_MQTT_TOPIC = os.getenv('ALERT_MQTT_TOPIC', 'leaksense/alerts')
+ALERT_MQTT_CONCURRENCY = int(os.getenv('ALERT_MQTT_CONCURRENCY', 1))
+
+
+def detect_alerts(device_id, pressure, moisture, acoustic, timestamp=None):
+    """Threshold checks for one reading; returns a list of alert events."""
+    timestamp = (timestamp or datetime.now()).isoformat()
+    checks = [
+        ('high_moisture', moisture > MOISTURE_THRESHOLD, moisture, MOISTURE_THRESHOLD, 'High moisture level!'),
+        ('high_acoustic', acoustic > ACOUSTIC_THRESHOLD, acoustic, ACOUSTIC_THRESHOLD, 'High acoustic level!'),
+        ('low_pressure', pressure < PRESSURE_MIN, pressure, PRESSURE_MIN, 'Abnormal pressure!'),
+        ('high_pressure', pressure > PRESSURE_MAX, pressure, PRESSURE_MAX, 'Abnormal pressure!')
+    ]
+    return [
+        {'device_id': device_id, 'type': alert_type, 'value': value, 'threshold': threshold,
+         'message': message, 'timestamp': timestamp}
+        for alert_type, triggered, value, threshold, message in checks if triggered
+    ]
+
+
+def signature_alerts(features):
+    """Alert events for bursts the API flagged as leak signatures."""
+    return [
+        {'device_id': f['device_id'], 'type': 'acoustic_signature', 'value': f['high_band_ratio'],
+         'threshold': ACOUSTIC_HIGH_BAND_MIN, 'message': 'Leak signature in acoustic burst!',
+         'timestamp': f['timestamp']}
+        for f in features if f.get('leak_signature')
+    ]
+
+
+def _summary(notification):
+    return ', '.join(f"{a['type']} x{a['count']}" for a in notification['alerts'])
+
+
+class WebhookSink:
+    """POSTs each notification as JSON"""
+
+    name = 'webhook'
+
+    def __init__(self, url, concurrency=ALERT_WEBHOOK_CONCURRENCY, timeout=10):
+        self.url = url
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def send(self, notification):
+        body = json.dumps(notification).encode('utf-8')
+        req = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        # HTTP errors raise, so they are retried like connection failures
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            resp.read()
+
+
+class SmtpSink:
+    """Sends each notification as a plain-text email"""
+
+    name = 'smtp'
+
+    def __init__(self, host, port=ALERT_SMTP_PORT, sender=ALERT_SMTP_FROM, recipients=None,
+                 user=ALERT_SMTP_USER, password=ALERT_SMTP_PASSWORD, starttls=ALERT_SMTP_STARTTLS,
+                 concurrency=ALERT_SMTP_CONCURRENCY, timeout=20):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients or ALERT_SMTP_TO
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def send(self, notification):
+        msg = EmailMessage()
+        msg['Subject'] = f"[LeakSense] {notification['device_id']}: {_summary(notification)}"
+        msg['From'] = self.sender
+        msg['To'] = ', '.join(self.recipients)
+        lines = [f"Device: {notification['device_id']}", '']
+        for a in notification['alerts']:
+            lines.append(f"- {a['type']}: peak {a['peak']:.2f} (threshold {a['threshold']:.2f}), "
+                         f"{a['count']} readings from {a['first']} to {a['last']}")
+        msg.set_content('\n'.join(lines))
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            smtp.send_message(msg)
+
+
+class MqttSink:
+    """Publishes each notification to <topic>/<device_id> (requires paho-mqtt)"""
+
+    name = 'mqtt'
+
+    def __init__(self, host, port=ALERT_MQTT_PORT, topic=ALERT_MQTT_TOPIC, concurrency=ALERT_MQTT_CONCURRENCY):
+        from paho.mqtt import publish
+        self.publish = publish
+        self.host = host
+        self.port = port
+        self.topic = topic.rstrip('/')
+        self.concurrency = concurrency
+
+    def send(self, notification):
+        self.publish.single(f"{self.topic}/{notification['device_id']}", json.dumps(notification),
+                            qos=1, hostname=self.host, port=self.port)
+
+
+def configured_sinks():
+    """Sinks enabled through environment variables."""
+    sinks = []
+    if ALERT_WEBHOOK_URL:
+        sinks.append(WebhookSink(ALERT_WEBHOOK_URL))
+    if ALERT_SMTP_HOST and ALERT_SMTP_TO:
+        sinks.append(SmtpSink(ALERT_SMTP_HOST))
+    if ALERT_MQTT_HOST:
+        try:
+            sinks.append(MqttSink(ALERT_MQTT_HOST))
+        except ImportError:
+            print("⚠️  ALERT_MQTT_HOST is set but paho-mqtt is not installed; MQTT alerts disabled")
+    return sinks
+
+
+class SinkWorker:
+    """Delivers notifications to one sink with its own bounded queue and thread pool
+
+    Failed sends are re-queued after an exponential backoff until max_attempts;
+    the threads only ever block on this sink, never on ingest or other sinks.
+    """
+
+    def __init__(self, sink, max_attempts=ALERT_MAX_ATTEMPTS, retry_seconds=ALERT_RETRY_SECONDS,
+                 queue_size=ALERT_QUEUE_SIZE):
+        self.sink = sink
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.in_flight = 0      # sending now or waiting for a retry
+        self.stats = {'sent': 0, 'retried': 0, 'failed': 0, 'dropped': 0}
+        for i in range(max(1, sink.concurrency)):
+            threading.Thread(target=self._run, name=f'alert-{sink.name}-{i}', daemon=True).start()
+
+    def put(self, notification, attempt=1):
+        try:
+            self.queue.put_nowait((notification, attempt))
+        except queue.Full:
+            self._count('dropped')
+            print(f"❌ Alert queue for {self.sink.name} is full; dropped notification for {notification['device_id']}")
+
+    def _retry(self, notification, attempt):
+        self.put(notification, attempt)
+        with self.lock:
+            self.in_flight -= 1
+
+    def idle(self):
+        with self.lock:
+            return self.queue.empty() and self.in_flight == 0
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _run(self):
+        while True:
+            notification, attempt = self.queue.get()
+            with self.lock:
+                self.in_flight += 1
+            try:
+                self.sink.send(notification)
+                self._count('sent')
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    self._count('failed')
+                    print(f"❌ {self.sink.name} alert for {notification['device_id']} failed "
+                          f"after {attempt} attempts: {e}")
+                else:
+                    with self.lock:
+                        self.stats['retried'] += 1
+                        self.in_flight += 1
+                    retry = threading.Timer(self.retry_seconds * 2 ** (attempt - 1), self._retry,
+                                            (notification, attempt + 1))
+                    retry.daemon = True
+                    retry.start()
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+
+
+class AlertDispatcher(threading.Thread):
+    """Background thread that turns alert events into per-device notifications
+
+    submit() only enqueues and is safe to call from the packet callback. Each
+    (device, alert type) is tracked as an incident: the first notification goes
+    out once debounce seconds have passed (so a burst of repeats becomes one
+    message with a count and peak value), further repeats are summarised at most
+    every repeat seconds, and an incident quiet for clear seconds is forgotten.
+    Incidents of one device that fall due together share a notification.
+    """
+
+    def __init__(self, sinks=None, debounce=ALERT_DEBOUNCE_SECONDS, repeat=ALERT_REPEAT_SECONDS,
+                 clear=ALERT_CLEAR_SECONDS, queue_size=ALERT_QUEUE_SIZE, **worker_options):
+        super(AlertDispatcher, self).__init__(name='alert-dispatcher', daemon=True)
+        sinks = configured_sinks() if sinks is None else sinks
+        self.workers = [SinkWorker(sink, queue_size=queue_size, **worker_options) for sink in sinks]
+        self.debounce = debounce
+        self.repeat = repeat
+        self.clear = clear
+        self.events = queue.Queue(queue_size)
+        self.incidents = {}
+        self.notifications = 0
+        self.dropped = 0
+        self.flush_now = threading.Event()
+
+    def submit(self, event):
+        """Queue an alert event; never blocks (events are dropped if the queue is full)."""
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        if not self.workers:
+            print("🔕 No alert sinks configured (ALERT_WEBHOOK_URL, ALERT_SMTP_HOST, ALERT_MQTT_HOST)")
+        while True:
+            try:
+                self._record(self.events.get(timeout=0.5))
+                while True:
+                    self._record(self.events.get_nowait())
+            except queue.Empty:
+                pass
+            force = self.flush_now.is_set()
+            self._flush(time.monotonic(), force)
+            if force:
+                self.flush_now.clear()
+
+    def _record(self, event):
+        now = time.monotonic()
+        key = (event['device_id'], event['type'])
+        incident = self.incidents.get(key)
+        if incident is None or now - incident['seen'] > self.clear:
+            incident = self.incidents[key] = {
+                'type': event['type'], 'message': event['message'], 'threshold': event['threshold'],
+                'opened': now, 'notified': None, 'count': 0, 'pending': 0,
+                'peak': event['value'], 'first': event['timestamp']
+            }
+        incident['seen'] = now
+        incident['last'] = event['timestamp']
+        incident['count'] += 1
+        incident['pending'] += 1
+        if abs(event['value'] - event['threshold']) > abs(incident['peak'] - incident['threshold']):
+            incident['peak'] = event['value']
+
+    def _flush(self, now, force=False):
+        due = {}
+        for key, incident in list(self.incidents.items()):
+            if incident['pending'] and (
+                    force
+                    or (incident['notified'] is None and now - incident['opened'] >= self.debounce)
+                    or (incident['notified'] is not None and now - incident['notified'] >= self.repeat)):
+                due.setdefault(key[0], []).append({
+                    'type': incident['type'],
+                    'message': incident['message'],
+                    'repeat': incident['notified'] is not None,
+                    'count': incident['pending'],
+                    'total': incident['count'],
+                    'peak': incident['peak'],
+                    'threshold': incident['threshold'],
+                    'first': incident['first'],
+                    'last': incident['last']
+                })
+                incident['pending'] = 0
+                incident['notified'] = now
+            elif not incident['pending'] and now - incident['seen'] > self.clear:
+                del self.incidents[key]
+
+        for device_id, alerts in due.items():
+            notification = {'device_id': device_id, 'alerts': alerts, 'sent_at': datetime.now().isoformat()}
+            self.notifications += 1
+            print(f"📣 Alert notification for {device_id}: {_summary(notification)}")
+            for worker in self.workers:
+                worker.put(notification)
+
+    def close(self, timeout=10):
+        """Send everything still being debounced and wait (bounded) for the sinks to drain."""
+        if not self.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        while not self.events.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.flush_now.set()
+        while self.flush_now.is_set() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        while not all(w.idle() for w in self.workers) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def status(self):
+        return {
+            'incidents': len(self.incidents),
+            'notifications': self.notifications,
+            'dropped_events': self.dropped,
+            'sinks': {w.sink.name: dict(w.stats) for w in self.workers}
+        }
+
+
+# Exercise the dispatcher against local stand-in sinks
+if __name__ == "__main__":
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    print("Testing alert dispatch against local stand-in sinks...\n")
+
+    received = []
+
+    class FlakyWebhook(BaseHTTPRequestHandler):
+        """Stand-in webhook receiver that rejects its first two requests"""
+        calls = 0
+
+        def do_POST(self):
+            FlakyWebhook.calls += 1
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            if FlakyWebhook.calls <= 2:
+                self.send_response(503)
+            else:
+                received.append(json.loads(body))
+                self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    class SlowSink:
+        """Stand-in for an SMTP server that takes seconds to answer"""
+        name = 'slow-smtp'
+        concurrency = 1
+
+        def __init__(self):
+            self.sent = []
+
+        def send(self, notification):
+            time.sleep(2)
+            self.sent.append(notification)
+
+    server = HTTPServer(('127.0.0.1', 0), FlakyWebhook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    slow = SlowSink()
+
+    dispatcher = AlertDispatcher(
+        sinks=[WebhookSink(f'http://127.0.0.1:{server.server_port}/alerts'), slow],
+        debounce=1, repeat=2, clear=30, retry_seconds=0.2
+    )
+    dispatcher.start()
+
+    # 3 s of packets: node-01 leaks continuously, node-02 spikes once
+    worst = 0.0
+    for i in range(60):
+        events = detect_alerts('node-01', pressure=15.0 - i * 0.01, moisture=85.0, acoustic=60.0)
+        if i == 10:
+            events += detect_alerts('node-02', pressure=45.0, moisture=40.0, acoustic=90.0)
+        started = time.perf_counter()
+        for event in events:
+            dispatcher.submit(event)
+        worst = max(worst, time.perf_counter() - started)
+        time.sleep(0.05)
+
+    dispatcher.close(timeout=15)
+    server.shutdown()
+
+    print(f"\n✅ Slowest submit(): {worst * 1000:.3f} ms")
+    print(f"✅ Webhook: {len(received)} notifications delivered after {FlakyWebhook.calls - len(received)} "
+          f"rejected attempts")
+    print(f"✅ Slow sink: {len(slow.sent)} notifications")
+    for notification in received:
+        print(f"  {notification['device_id']}: {_summary(notification)}")
+    print(f"\n{json.dumps(dispatcher.status(), indent=2)}")
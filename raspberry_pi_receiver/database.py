@@ -7,8 +7,35 @@ Handles PostgreSQL connections and data storage
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from datetime import datetime, timedelta
+import hashlib
+import json
 import os
 
+# sensor_readings stores epoch-millisecond timestamps and scaled integers
+# (value * scale); must match flask_backend/storage_format.py
+SCALES = {'pressure': 100, 'moisture': 100, 'acoustic': 100, 'snr': 10}
+
+
+def _to_ms(ts):
+    return int(round(ts.timestamp() * 1000))
+
+
+def _scale(field, value):
+    return int(round(float(value) * SCALES[field])) if value is not None else None
+
+
+def _decode(row):
+    """Stored row -> engineering units with datetime timestamps."""
+    reading = dict(row)
+    for field in ('timestamp', 'created_at'):
+        if reading.get(field) is not None:
+            reading[field] = datetime.fromtimestamp(reading[field] / 1000.0)
+    for field, factor in SCALES.items():
+        if reading.get(field) is not None:
+            reading[field] = float(reading[field]) / factor
+    return reading
+
+
 # Database configuration
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', 'localhost'),
@@ -18,6 +45,27 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'leaksense_pass')
 }
 
+# Horizontal sharding: the same DB_SHARDS / DB_SHARD_REGIONS JSON as the
+# Flask API (empty = every reading goes to DB_HOST)
+DB_SHARDS = json.loads(os.getenv('DB_SHARDS') or '[]')
+DB_SHARD_REGIONS = json.loads(os.getenv('DB_SHARD_REGIONS') or '{}')
+
+
+def _shard_name(shard):
+    return shard.get('name') or f"{shard['host']}:{shard.get('port', DB_CONFIG['port'])}"
+
+
+def _shard_for(device_id):
+    """Shard name for a device; must match ShardMap.shard_for in flask_backend/sharding.py"""
+    device_id = str(device_id)
+    for prefix, name in sorted(DB_SHARD_REGIONS.items(), key=lambda item: -len(item[0])):
+        if device_id.startswith(prefix):
+            return name
+
+    def score(name):
+        return int.from_bytes(hashlib.md5(f'{name}:{device_id}'.encode('utf-8')).digest()[:8], 'big')
+    return max((_shard_name(shard) for shard in DB_SHARDS), key=score)
+
 
 class Database:
     """Database handler for sensor data"""
@@ -25,63 +73,144 @@ class Database:
     def __init__(self):
         self.conn = None
         self.cursor = None
+        self.shards = {}  # shard name -> (conn, cursor) when DB_SHARDS is set
     
     def connect(self):
-        """Establish database connection"""
+        """Establish database connection (one per shard when sharded)"""
         try:
-            self.conn = psycopg2.connect(**DB_CONFIG)
-            self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
-            print(f"✅ Connected to PostgreSQL database: {DB_CONFIG['database']}")
+            if not DB_SHARDS:
+                self.conn = psycopg2.connect(**DB_CONFIG)
+                self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
+                print(f"✅ Connected to PostgreSQL database: {DB_CONFIG['database']}")
+                return
+            for shard in DB_SHARDS:
+                conn = psycopg2.connect(**dict(DB_CONFIG, host=shard['host'],
+                                               port=str(shard.get('port', DB_CONFIG['port']))))
+                self.shards[_shard_name(shard)] = (conn, conn.cursor(cursor_factory=RealDictCursor))
+                print(f"✅ Connected to shard {_shard_name(shard)} ({shard['host']})")
+            self.conn, self.cursor = next(iter(self.shards.values()))
         except psycopg2.Error as e:
             print(f"❌ Database connection error: {e}")
             raise
     
+    def _targets(self):
+        """(conn, cursor) for every database holding sensor_readings"""
+        return list(self.shards.values()) if self.shards else [(self.conn, self.cursor)]
+    
     def create_tables(self):
-        """Create necessary database tables"""
+        """Create necessary database tables (on every shard)"""
+        for conn, cursor in self._targets():
+            self._create_tables(conn, cursor)
+    
+    def _create_tables(self, conn, cursor):
+        cursor.execute("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'sensor_readings' AND column_name = 'timestamp'
+        """)
+        row = cursor.fetchone()
+        if row and row['data_type'].startswith('timestamp'):
+            raise RuntimeError("sensor_readings still uses TIMESTAMP/REAL columns; "
+                               "run `python3 storage_format.py migrate` in flask_backend first")
+        
         create_table_query = """
         CREATE TABLE IF NOT EXISTS sensor_readings (
             id SERIAL PRIMARY KEY,
-            pressure REAL NOT NULL,
-            moisture REAL NOT NULL,
-            acoustic REAL NOT NULL,
-            rssi INTEGER,
-            snr REAL,
-            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            device_id VARCHAR(32) NOT NULL DEFAULT 'default',
+            pressure SMALLINT NOT NULL,
+            moisture SMALLINT NOT NULL,
+            acoustic SMALLINT NOT NULL,
+            rssi SMALLINT,
+            snr SMALLINT,
+            timestamp BIGINT NOT NULL DEFAULT (EXTRACT(EPOCH FROM clock_timestamp()) * 1000)::BIGINT,
+            created_at BIGINT NOT NULL DEFAULT (EXTRACT(EPOCH FROM clock_timestamp()) * 1000)::BIGINT
         );
         
         CREATE INDEX IF NOT EXISTS idx_timestamp ON sensor_readings(timestamp DESC);
         CREATE INDEX IF NOT EXISTS idx_created_at ON sensor_readings(created_at DESC);
+        
+        ALTER TABLE sensor_readings ADD COLUMN IF NOT EXISTS device_id VARCHAR(32) NOT NULL DEFAULT 'default';
+        CREATE INDEX IF NOT EXISTS idx_device_timestamp ON sensor_readings(device_id, timestamp DESC);
+        
+        CREATE TABLE IF NOT EXISTS sensor_blocks (
+            id SERIAL PRIMARY KEY,
+            device_id VARCHAR(32) NOT NULL,
+            chunk_start BIGINT NOT NULL,
+            chunk_end BIGINT NOT NULL,
+            row_count INTEGER NOT NULL,
+            aggregates TEXT NOT NULL,
+            payload BYTEA NOT NULL,
+            sealed_at BIGINT NOT NULL DEFAULT (EXTRACT(EPOCH FROM clock_timestamp()) * 1000)::BIGINT,
+            UNIQUE (device_id, chunk_start)
+        );
+        
+        CREATE INDEX IF NOT EXISTS idx_blocks_chunk ON sensor_blocks(chunk_start, chunk_end);
+        
+        CREATE TABLE IF NOT EXISTS device_modes (
+            device_id VARCHAR(32) PRIMARY KEY,
+            report_by_exception BOOLEAN NOT NULL,
+            updated_at BIGINT NOT NULL
+        );
         """
         
         try:
-            self.cursor.execute(create_table_query)
-            self.conn.commit()
+            cursor.execute(create_table_query)
+            conn.commit()
             print("✅ Database tables verified/created")
         except psycopg2.Error as e:
             print(f"❌ Error creating tables: {e}")
-            self.conn.rollback()
+            conn.rollback()
             raise
     
-    def insert_sensor_data(self, pressure, moisture, acoustic, rssi=None, snr=None, timestamp=None):
-        """Insert sensor reading into database"""
+    def insert_sensor_data(self, pressure, moisture, acoustic, rssi=None, snr=None, timestamp=None,
+                           device_id='default'):
+        """Insert sensor reading into database (the device's shard when sharded)"""
         if timestamp is None:
             timestamp = datetime.now()
         
         insert_query = """
-        INSERT INTO sensor_readings (pressure, moisture, acoustic, rssi, snr, timestamp)
-        VALUES (%s, %s, %s, %s, %s, %s)
+        INSERT INTO sensor_readings (device_id, pressure, moisture, acoustic, rssi, snr, timestamp)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
         RETURNING id;
         """
         
+        conn, cursor = self.shards[_shard_for(device_id)] if self.shards else (self.conn, self.cursor)
         try:
-            self.cursor.execute(insert_query, (pressure, moisture, acoustic, rssi, snr, timestamp))
-            self.conn.commit()
-            record_id = self.cursor.fetchone()['id']
+            cursor.execute(insert_query, (
+                device_id,
+                _scale('pressure', pressure),
+                _scale('moisture', moisture),
+                _scale('acoustic', acoustic),
+                rssi,
+                _scale('snr', snr),
+                _to_ms(timestamp)
+            ))
+            conn.commit()
+            record_id = cursor.fetchone()['id']
             return record_id
         except psycopg2.Error as e:
             print(f"❌ Error inserting data: {e}")
-            self.conn.rollback()
+            conn.rollback()
+            raise
+    
+    def set_report_mode(self, device_id, report_by_exception):
+        """Record whether a device sends report-by-exception packets (on its shard)
+
+        The API reconstructs only these devices' readings onto a regular grid.
+        """
+        upsert_query = """
+        INSERT INTO device_modes (device_id, report_by_exception, updated_at)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (device_id) DO UPDATE
+        SET report_by_exception = EXCLUDED.report_by_exception, updated_at = EXCLUDED.updated_at;
+        """
+        
+        conn, cursor = self.shards[_shard_for(device_id)] if self.shards else (self.conn, self.cursor)
+        try:
+            cursor.execute(upsert_query, (device_id, bool(report_by_exception), _to_ms(datetime.now())))
+            conn.commit()
+        except psycopg2.Error as e:
+            print(f"❌ Error recording device mode: {e}")
+            conn.rollback()
             raise
     
     def get_latest_readings(self, limit=10):
@@ -93,8 +222,12 @@ class Database:
         """
         
         try:
-            self.cursor.execute(query, (limit,))
-            return self.cursor.fetchall()
+            rows = []
+            for _, cursor in self._targets():
+                cursor.execute(query, (limit,))
+                rows.extend(cursor.fetchall())
+            rows.sort(key=lambda row: row['timestamp'], reverse=True)
+            return [_decode(row) for row in rows[:limit]]
         except psycopg2.Error as e:
             print(f"❌ Error fetching data: {e}")
             return []
@@ -111,8 +244,12 @@ class Database:
         """
         
         try:
-            self.cursor.execute(query, (start_time, end_time))
-            return self.cursor.fetchall()
+            rows = []
+            for _, cursor in self._targets():
+                cursor.execute(query, (_to_ms(start_time), _to_ms(end_time)))
+                rows.extend(cursor.fetchall())
+            rows.sort(key=lambda row: row['timestamp'])
+            return [_decode(row) for row in rows]
         except psycopg2.Error as e:
             print(f"❌ Error fetching data: {e}")
             return []
@@ -121,32 +258,54 @@ class Database:
         """Get statistical summary of sensor data"""
         start_time = datetime.now() - timedelta(hours=hours)
         
+        # Sums and counts rather than averages, so shards can be combined
         query = """
         SELECT 
             COUNT(*) as total_readings,
-            AVG(pressure) as avg_pressure,
+            SUM(pressure) as sum_pressure,
             MIN(pressure) as min_pressure,
             MAX(pressure) as max_pressure,
-            AVG(moisture) as avg_moisture,
+            SUM(moisture) as sum_moisture,
             MIN(moisture) as min_moisture,
             MAX(moisture) as max_moisture,
-            AVG(acoustic) as avg_acoustic,
+            SUM(acoustic) as sum_acoustic,
             MIN(acoustic) as min_acoustic,
             MAX(acoustic) as max_acoustic,
-            AVG(rssi) as avg_rssi
+            SUM(rssi) as sum_rssi,
+            COUNT(rssi) as count_rssi
         FROM sensor_readings
         WHERE timestamp >= %s;
         """
         
         try:
-            self.cursor.execute(query, (start_time,))
-            return self.cursor.fetchone()
+            parts = []
+            for _, cursor in self._targets():
+                cursor.execute(query, (_to_ms(start_time),))
+                parts.append(cursor.fetchone())
+            total = sum(part['total_readings'] for part in parts)
+            stats = {'total_readings': total}
+            for field in ('pressure', 'moisture', 'acoustic'):
+                factor = SCALES[field]
+                lows = [part[f'min_{field}'] for part in parts if part[f'min_{field}'] is not None]
+                highs = [part[f'max_{field}'] for part in parts if part[f'max_{field}'] is not None]
+                stats[f'avg_{field}'] = (sum(float(part[f'sum_{field}'] or 0) for part in parts) / total / factor
+                                         if total else None)
+                stats[f'min_{field}'] = min(lows) / factor if lows else None
+                stats[f'max_{field}'] = max(highs) / factor if highs else None
+            rssi_count = sum(part['count_rssi'] for part in parts)
+            stats['avg_rssi'] = (sum(float(part['sum_rssi'] or 0) for part in parts) / rssi_count
+                                 if rssi_count else None)
+            return stats
         except psycopg2.Error as e:
             print(f"❌ Error fetching statistics: {e}")
             return None
     
     def cleanup_old_data(self, days=30):
-        """Delete sensor readings older than specified days"""
+        """Delete sensor readings older than specified days
+
+        Prefer sealing into cold storage (flask_backend/cold_storage.py) when
+        history must be kept for audits; this permanently discards rows.
+        """
         cutoff_date = datetime.now() - timedelta(days=days)
         
         delete_query = """
@@ -154,23 +313,25 @@ class Database:
         WHERE timestamp < %s;
         """
         
-        try:
-            self.cursor.execute(delete_query, (cutoff_date,))
-            deleted_count = self.cursor.rowcount
-            self.conn.commit()
-            print(f"✅ Deleted {deleted_count} old records")
-            return deleted_count
-        except psycopg2.Error as e:
-            print(f"❌ Error deleting old data: {e}")
-            self.conn.rollback()
-            return 0
+        deleted_count = 0
+        for conn, cursor in self._targets():
+            try:
+                cursor.execute(delete_query, (_to_ms(cutoff_date),))
+                deleted_count += cursor.rowcount
+                conn.commit()
+            except psycopg2.Error as e:
+                print(f"❌ Error deleting old data: {e}")
+                conn.rollback()
+        print(f"✅ Deleted {deleted_count} old records")
+        return deleted_count
     
     def close(self):
-        """Close database connection"""
-        if self.cursor:
-            self.cursor.close()
-        if self.conn:
-            self.conn.close()
+        """Close database connection(s)"""
+        for conn, cursor in self._targets():
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
         print("✅ Database connection closed")
 
 
@@ -1,176 +1,305 @@
 #!/usr/bin/env python3
 """
 LeakSense LoRa Receiver for Raspberry Pi
-Receives sensor data via LoRa and stores in PostgreSQL database
+Receives sensor data via one or more LoRa radios and stores it in PostgreSQL
+
+Usage:
+    python3 lora_receiver.py                         # radios from LORA_RADIOS (default: one)
+    python3 lora_receiver.py --assign node-01 node-02
+    python3 lora_receiver.py --simulate --radios 4 --nodes 120 --no-db
 """
 
-import time
+import argparse
 import json
+import os
+import queue
 import sys
+import threading
+import time
 from datetime import datetime
-from SX127x.LoRa import *
-from SX127x.board_config import BOARD
 from database import Database
+from acoustic_bursts import BurstAssembler, BurstUploader
+from alert_notifier import AlertDispatcher, detect_alerts, signature_alerts
+from sampling_profiler import install_signal_toggle
+import radio_channels
+
+PIPELINE_QUEUE_SIZE = int(os.getenv('LORA_PIPELINE_QUEUE', 2000))  # packets waiting to be decoded
+STATS_INTERVAL = float(os.getenv('LORA_STATS_INTERVAL', 60))  # seconds between per-radio stats lines
+
+
+class PacketPipeline(threading.Thread):
+    """Shared decode and storage stage behind every radio
+
+    Radio RX loops only copy the payload and call submit(), which never
+    blocks; this thread decodes packets in arrival order, checks alerts,
+    reassembles bursts and stores readings, so the database connection and
+    burst assembler are only used from one thread.
+    """
 
-# LoRa Configuration
-LORA_FREQUENCY = 915  # MHz (must match transmitter)
-LORA_SPREADING_FACTOR = 7
-LORA_BANDWIDTH = BW.BW125
-LORA_CODING_RATE = CODING_RATE.CR4_5
-LORA_SYNC_WORD = 0x12
-
-class LoRaReceiver(LoRa):
-    """LoRa receiver class for handling incoming packets"""
-    
-    def __init__(self, db, verbose=False):
-        super(LoRaReceiver, self).__init__(verbose)
+    def __init__(self, db, radios, verbose=True, queue_size=PIPELINE_QUEUE_SIZE):
+        super(PacketPipeline, self).__init__(name='packet-pipeline', daemon=True)
         self.db = db
+        self.radios = {radio.name: radio for radio in radios}
+        self.configs = [radio.config for radio in radios]
+        self.verbose = verbose
+        self.packets = queue.Queue(queue_size)
         self.packet_count = 0
-        self.set_mode(MODE.SLEEP)
-        self.set_dio_mapping([0] * 6)
-        
-    def start(self):
-        """Initialize and start receiving"""
-        print("=" * 60)
-        print("LeakSense LoRa Receiver Starting...")
-        print("=" * 60)
-        
-        # Configure LoRa parameters
-        self.set_freq(LORA_FREQUENCY)
-        self.set_spreading_factor(LORA_SPREADING_FACTOR)
-        self.set_bw(LORA_BANDWIDTH)
-        self.set_coding_rate(LORA_CODING_RATE)
-        self.set_sync_word(LORA_SYNC_WORD)
-        self.set_rx_crc(True)
-        
-        print(f"Frequency: {LORA_FREQUENCY} MHz")
-        print(f"Spreading Factor: {LORA_SPREADING_FACTOR}")
-        print(f"Bandwidth: 125 kHz")
-        print(f"Coding Rate: 4/5")
-        print("=" * 60)
-        print("Listening for packets...\n")
-        
-        # Start receiving
-        self.set_mode(MODE.RXCONT)
-        
+        self.report_modes = {}  # device_id -> report-by-exception flag recorded in device_modes
+        self.bursts = BurstAssembler()
+        self.notifier = AlertDispatcher()
+        self.notifier.start()
+        self.uploader = BurstUploader(on_features=self._on_burst_features)
+        self.uploader.start()
+
+    def submit(self, radio_name, payload, rssi, snr, received_at):
+        """Called from a radio's RX thread."""
         try:
-            while True:
-                time.sleep(0.1)
-        except KeyboardInterrupt:
-            print("\n\nShutting down receiver...")
-            self.set_mode(MODE.SLEEP)
-            BOARD.teardown()
-            sys.exit(0)
-    
-    def on_rx_done(self):
-        """Callback when packet is received"""
-        print("\n" + "=" * 60)
-        print(f"📡 Packet #{self.packet_count} Received")
-        print("=" * 60)
-        
-        # Get payload
-        payload = self.read_payload(nocheck=True)
-        
+            self.packets.put_nowait((radio_name, payload, rssi, snr, received_at))
+        except queue.Full:
+            self.radios[radio_name].stats.count('dropped')
+
+    def run(self):
+        while True:
+            packet = self.packets.get()
+            try:
+                self.handle(*packet)
+            finally:
+                self.packets.task_done()
+
+    def log(self, message=''):
+        if self.verbose:
+            print(message)
+
+    def handle(self, radio_name, payload, rssi, snr, timestamp):
+        """Decode one packet and store or forward it"""
+        radio = self.radios[radio_name]
+        self.log("\n" + "=" * 60)
+        self.log(f"📡 Packet #{self.packet_count} Received on {radio_channels.describe(radio.config)}")
+        self.log("=" * 60)
+
         # Convert bytes to string
         try:
             message = bytes(payload).decode('utf-8', errors='ignore')
-            print(f"Raw Payload: {message}")
-            
+            self.log(f"Raw Payload: {message}")
+
             # Parse JSON data
             data = json.loads(message)
-            
-            # Extract sensor values
-            packet_id = data.get('id', 0)
-            pressure = data.get('pressure', 0.0)
-            moisture = data.get('moisture', 0.0)
-            acoustic = data.get('acoustic', 0.0)
-            timestamp = datetime.now()
-            
-            # Get RSSI and SNR
-            rssi = self.get_pkt_rssi_value()
-            snr = self.get_pkt_snr_value()
-            
-            print(f"\n📊 Sensor Data:")
-            print(f"  Packet ID: {packet_id}")
-            print(f"  Pressure:  {pressure:.2f} PSI")
-            print(f"  Moisture:  {moisture:.2f} %")
-            print(f"  Acoustic:  {acoustic:.2f} dB")
-            print(f"  RSSI:      {rssi} dBm")
-            print(f"  SNR:       {snr:.2f} dB")
-            print(f"  Timestamp: {timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
-            
-            # Check for alerts
-            alerts = []
-            if moisture > 70.0:
-                alerts.append("⚠️  High moisture level!")
-            if acoustic > 75.0:
-                alerts.append("⚠️  High acoustic level!")
-            if pressure < 20.0 or pressure > 80.0:
-                alerts.append("⚠️  Abnormal pressure!")
-            
-            if alerts:
-                print(f"\n🚨 ALERTS:")
-                for alert in alerts:
-                    print(f"  {alert}")
-            
-            # Store in database
-            try:
-                self.db.insert_sensor_data(
-                    pressure=pressure,
-                    moisture=moisture,
-                    acoustic=acoustic,
-                    rssi=rssi,
-                    snr=snr,
-                    timestamp=timestamp
-                )
-                print(f"\n✅ Data stored in database successfully")
-            except Exception as e:
-                print(f"\n❌ Database error: {e}")
-            
-            self.packet_count += 1
-            
+            device_id = str(data.get('device', 'default'))
+            radio.stats.node(device_id)
+            if radio_channels.channel_for(device_id, self.configs) != radio_name:
+                radio.stats.count('misassigned')
+
+            # Acoustic burst fragment: reassemble and queue for spectral analysis
+            if 'burst' in data:
+                burst = self.bursts.add(data)
+                if burst:
+                    self.log(f"🎙️  Burst complete: {burst['device_id']} "
+                             f"({len(burst['samples'])} samples @ {burst['sample_rate']} Hz)")
+                    self.uploader.submit(burst)
+                else:
+                    self.log(f"🎙️  Burst fragment {data.get('frag')}/{data.get('of')} from {data.get('device')}")
+                self.packet_count += 1
+            else:
+                # Extract sensor values
+                packet_id = data.get('id', 0)
+                pressure = data.get('pressure', 0.0)
+                moisture = data.get('moisture', 0.0)
+                acoustic = data.get('acoustic', 0.0)
+
+                self.log(f"\n📊 Sensor Data:")
+                self.log(f"  Device:    {device_id}")
+                self.log(f"  Packet ID: {packet_id}")
+                if data.get('rbe'):
+                    self.log(f"  Mode:      report-by-exception ({'heartbeat' if data.get('hb') else 'change'})")
+                self.log(f"  Pressure:  {pressure:.2f} PSI")
+                self.log(f"  Moisture:  {moisture:.2f} %")
+                self.log(f"  Acoustic:  {acoustic:.2f} dB")
+                self.log(f"  RSSI:      {rssi} dBm")
+                self.log(f"  SNR:       {snr:.2f} dB")
+                self.log(f"  Timestamp: {timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
+
+                # Check for alerts; notifications are debounced and sent off this thread
+                alerts = detect_alerts(device_id, pressure, moisture, acoustic, timestamp)
+
+                if alerts:
+                    print(f"\n🚨 ALERTS ({device_id}):")
+                    for alert in alerts:
+                        print(f"  ⚠️  {alert['message']}")
+                        self.notifier.submit(alert)
+
+                # Store in database
+                if self.db is not None:
+                    try:
+                        rbe = bool(data.get('rbe'))
+                        if self.report_modes.get(device_id) != rbe:
+                            self.db.set_report_mode(device_id, rbe)
+                            self.report_modes[device_id] = rbe
+                        self.db.insert_sensor_data(
+                            pressure=pressure,
+                            moisture=moisture,
+                            acoustic=acoustic,
+                            rssi=rssi,
+                            snr=snr,
+                            timestamp=timestamp,
+                            device_id=device_id
+                        )
+                        radio.stats.count('stored')
+                        self.log(f"\n✅ Data stored in database successfully")
+                    except Exception as e:
+                        print(f"\n❌ Database error: {e}")
+
+                self.packet_count += 1
+
         except json.JSONDecodeError as e:
-            print(f"❌ JSON decode error: {e}")
+            radio.stats.count('decode_errors')
+            print(f"❌ JSON decode error on {radio_name}: {e}")
             print(f"Raw data: {payload}")
         except Exception as e:
-            print(f"❌ Error processing packet: {e}")
-        
-        print("=" * 60)
-        
-        # Reset to receive mode
-        self.set_mode(MODE.SLEEP)
-        self.reset_ptr_rx()
-        self.set_mode(MODE.RXCONT)
+            radio.stats.count('decode_errors')
+            print(f"❌ Error processing packet on {radio_name}: {e}")
+
+        self.log("=" * 60)
+
+    def drain(self, timeout=5):
+        """Wait (bounded) until every queued packet has been handled."""
+        deadline = time.monotonic() + timeout
+        while self.packets.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _on_burst_features(self, features):
+        """Uploader thread: queue notifications for bursts flagged as leak signatures"""
+        for alert in signature_alerts(features):
+            self.notifier.submit(alert)
+
+
+def print_radio_stats(radios):
+    """One line per radio plus a gateway total"""
+    totals = {}
+    for radio in radios:
+        s = radio.stats.snapshot()
+        for key in ('received', 'collisions', 'crc_errors', 'dropped', 'stored'):
+            totals[key] = totals.get(key, 0) + s[key]
+        print(f"📶 {radio_channels.describe(radio.config)}: {s['received']} packets "
+              f"({s['packets_per_minute']}/min) from {s['nodes']} nodes, {s['stored']} stored, "
+              f"{s['collisions']} collisions, {s['crc_errors']} CRC errors, {s['dropped']} dropped, "
+              f"{s['misassigned']} off-channel, RSSI {s['avg_rssi']} dBm, SNR {s['avg_snr']} dB")
+    if len(radios) > 1:
+        nodes = set().union(*(radio.stats.node_ids() for radio in radios))
+        print(f"📶 Gateway: {totals['received']} packets from {len(nodes)} nodes on {len(radios)} radios, "
+              f"{totals['stored']} stored, {totals['collisions']} collisions, {totals['dropped']} dropped")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='LeakSense LoRa receiver')
+    parser.add_argument('--assign', nargs='+', metavar='DEVICE_ID',
+                        help='print the channel each node should transmit on and exit')
+    parser.add_argument('--simulate', action='store_true',
+                        help='simulated radios and nodes instead of SX127x hardware')
+    parser.add_argument('--radios', type=int, default=0,
+                        help='simulate this many SF7 channels 0.2 MHz apart instead of LORA_RADIOS')
+    parser.add_argument('--nodes', type=int, default=40, help='simulated nodes')
+    parser.add_argument('--interval', type=float, default=5.0, help='simulated transmission interval (s)')
+    parser.add_argument('--seconds', type=float, default=60, help='simulated time to run (0 = until Ctrl+C)')
+    parser.add_argument('--speed', type=float, default=10, help='simulated seconds per wall-clock second')
+    parser.add_argument('--no-db', action='store_true', help='decode without storing readings')
+    return parser.parse_args()
 
 
 def main():
     """Main entry point"""
+    args = parse_args()
+
+    if args.simulate and args.radios:
+        configs = radio_channels.load_radio_configs([
+            {'name': f'ch{i}', 'frequency': radio_channels.LORA_FREQUENCY + 0.2 * i} for i in range(args.radios)
+        ])
+    else:
+        configs = radio_channels.load_radio_configs()
+
+    if args.assign:
+        for device_id in args.assign:
+            name = radio_channels.channel_for(device_id, configs)
+            config = next(c for c in configs if c['name'] == name)
+            print(f"{device_id}: {radio_channels.describe(config)}")
+        return
+
     print("\n🚀 Initializing LeakSense Receiver...\n")
-    
-    # Initialize board
-    BOARD.setup()
-    
+
+    # kill -USR1 <pid> starts/stops the stack sampler without restarting
+    install_signal_toggle()
+
+    BOARD = None
+    if not args.simulate:
+        from SX127x.board_config import BOARD
+        BOARD.setup()
+
     # Initialize database
+    db = None
+    if not args.no_db:
+        try:
+            db = Database()
+            db.connect()
+            db.create_tables()
+            print("✅ Database connected and initialized\n")
+        except Exception as e:
+            print(f"❌ Database initialization failed: {e}")
+            print("Please ensure PostgreSQL is running and configured correctly.")
+            sys.exit(1)
+
+    # Initialize the radios
     try:
-        db = Database()
-        db.connect()
-        db.create_tables()
-        print("✅ Database connected and initialized\n")
-    except Exception as e:
-        print(f"❌ Database initialization failed: {e}")
-        print("Please ensure PostgreSQL is running and configured correctly.")
-        sys.exit(1)
-    
-    # Initialize and start LoRa receiver
-    try:
-        lora = LoRaReceiver(db, verbose=False)
-        lora.start()
+        if args.simulate:
+            nodes = radio_channels.simulated_nodes(args.nodes, configs, interval=args.interval)
+            radios = [radio_channels.SimulatedRadio(config, nodes, speed=args.speed) for config in configs]
+        else:
+            radios = [radio_channels.SX127xRadio(config) for config in configs]
     except Exception as e:
         print(f"❌ LoRa initialization failed: {e}")
         print("Please check LoRa module connections.")
-        BOARD.teardown()
+        if BOARD:
+            BOARD.teardown()
         sys.exit(1)
 
+    pipeline = PacketPipeline(db, radios, verbose=not args.simulate)
+    pipeline.start()
+
+    print("=" * 60)
+    print("LeakSense LoRa Receiver Starting...")
+    print("=" * 60)
+    for radio in radios:
+        nodes = f", {len(radio.nodes)} simulated nodes" if args.simulate else ''
+        print(f"Radio: {radio_channels.describe(radio.config)}, coding rate 4/{radio.config['coding_rate']}{nodes}")
+    print("=" * 60)
+    print("Listening for packets...\n")
+    for radio in radios:
+        radio.start(pipeline.submit)
+
+    stats_interval = STATS_INTERVAL / args.speed if args.simulate else STATS_INTERVAL
+    run_until = time.monotonic() + args.seconds / args.speed if args.simulate and args.seconds else None
+    next_stats = time.monotonic() + stats_interval
+    try:
+        while run_until is None or time.monotonic() < run_until:
+            time.sleep(0.1)
+            if time.monotonic() >= next_stats:
+                print_radio_stats(radios)
+                next_stats += stats_interval
+    except KeyboardInterrupt:
+        pass
+
+    print("\n\nShutting down receiver...")
+    for radio in radios:
+        radio.stop()
+    pipeline.drain()
+    pipeline.notifier.close()
+    print_radio_stats(radios)
+    bursts, uploader = pipeline.bursts, pipeline.uploader
+    if bursts.dropped or bursts.rejected or uploader.uploaded or uploader.failed or uploader.dropped:
+        print(f"🎙️  Bursts: {uploader.uploaded} uploaded, {uploader.failed} failed, {uploader.dropped} dropped "
+              f"(queue full), {bursts.dropped} incomplete, {bursts.rejected} corrupt")
+    if BOARD:
+        BOARD.teardown()
+    sys.exit(0)
+
 
 if __name__ == "__main__":
     main()
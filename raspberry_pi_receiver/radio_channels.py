@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Radio front ends for the LeakSense receiver
+Channel plan for one or more SX127x radios, node-to-channel assignment, one RX
+loop per radio, and a simulated radio (LoRa airtime and same-channel
+collisions) so a multi-channel gateway can be exercised without hardware
+
+Every radio hands received packets to on_packet(radio_name, payload, rssi,
+snr, received_at) from its own thread; decoding and storage happen elsewhere.
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+# Single-radio defaults (must match the transmitter)
+LORA_FREQUENCY = float(os.getenv('LORA_FREQUENCY', 915))  # MHz
+LORA_SPREADING_FACTOR = int(os.getenv('LORA_SPREADING_FACTOR', 7))
+LORA_BANDWIDTH = float(os.getenv('LORA_BANDWIDTH', 125))  # kHz
+LORA_CODING_RATE = int(os.getenv('LORA_CODING_RATE', 5))  # 4/5
+LORA_SYNC_WORD = 0x12
+
+# Several radios as a JSON list; each entry overrides the defaults above, e.g.
+# [{"name": "ch0", "frequency": 902.3, "sf": 7, "spi_cs": 0, "reset_pin": 25},
+#  {"name": "ch1", "frequency": 902.5, "sf": 7, "spi_cs": 1, "reset_pin": 17}]
+LORA_RADIOS = json.loads(os.getenv('LORA_RADIOS') or '[]')
+# Pinned channels: device id -> radio name (other nodes are hashed onto radios)
+LORA_NODE_CHANNELS = json.loads(os.getenv('LORA_NODE_CHANNELS') or '{}')
+LORA_POLL_INTERVAL = float(os.getenv('LORA_POLL_INTERVAL', 0.005))  # seconds between IRQ flag reads
+
+# Payload size used to weight channels by capacity (typical sensor packet)
+TYPICAL_PAYLOAD_BYTES = 80
+
+
+def load_radio_configs(radios=None):
+    """Normalized radio configs; one default radio when LORA_RADIOS is empty."""
+    radios = LORA_RADIOS if radios is None else radios
+    configs = []
+    for i, radio in enumerate(radios or [{}]):
+        config = {
+            'name': str(radio.get('name', f'radio{i}')),
+            'frequency': float(radio.get('frequency', LORA_FREQUENCY)),
+            'sf': int(radio.get('sf', LORA_SPREADING_FACTOR)),
+            'bandwidth': float(radio.get('bandwidth', LORA_BANDWIDTH)),
+            'coding_rate': int(radio.get('coding_rate', LORA_CODING_RATE)),
+            'spi_bus': int(radio.get('spi_bus', 0)),
+            'spi_cs': int(radio.get('spi_cs', i)),
+            'reset_pin': radio.get('reset_pin')
+        }
+        if not 6 <= config['sf'] <= 12:
+            raise ValueError(f"{config['name']}: spreading factor must be 6-12")
+        configs.append(config)
+    names = [c['name'] for c in configs]
+    if len(set(names)) != len(names):
+        raise ValueError('Radio names must be unique')
+    return configs
+
+
+def describe(config):
+    return f"{config['name']} ({config['frequency']:.1f} MHz SF{config['sf']} {config['bandwidth']:g} kHz)"
+
+
+def time_on_air(payload_bytes, sf, bandwidth=125.0, coding_rate=5, preamble=8, crc=True, explicit_header=True):
+    """Seconds a LoRa packet occupies the channel (Semtech SX127x datasheet formula)."""
+    symbol = (2 ** sf) / (bandwidth * 1000.0)
+    low_data_rate = 1 if symbol > 0.016 else 0
+    numerator = 8 * payload_bytes - 4 * sf + 28 + 16 * int(crc) - 20 * (0 if explicit_header else 1)
+    payload_symbols = 8 + max(math.ceil(numerator / (4 * (sf - 2 * low_data_rate))) * coding_rate, 0)
+    return (preamble + 4.25 + payload_symbols) * symbol
+
+
+def channel_for(device_id, configs, assignments=None):
+    """Radio name a node should transmit on.
+
+    Pinned nodes (LORA_NODE_CHANNELS) keep their radio; the rest are spread by
+    weighted rendezvous hashing, weighted by each channel's packet capacity,
+    so adding a radio only moves the nodes that land on it.
+    """
+    assignments = LORA_NODE_CHANNELS if assignments is None else assignments
+    names = {c['name'] for c in configs}
+    pinned = assignments.get(device_id)
+    if pinned in names:
+        return pinned
+
+    def score(config):
+        digest = hashlib.md5(f"{config['name']}:{device_id}".encode('utf-8')).digest()
+        u = (int.from_bytes(digest[:8], 'big') + 1) / 2.0 ** 64  # (0, 1]
+        weight = 1.0 / time_on_air(TYPICAL_PAYLOAD_BYTES, config['sf'], config['bandwidth'], config['coding_rate'])
+        return -weight / math.log(u) if u < 1 else math.inf
+
+    return max(configs, key=score)['name']
+
+
+class RadioStats:
+    """Per-radio counters, updated from the RX loop and the decode thread
+
+    speed scales elapsed time for rates (simulated radios run faster than
+    wall-clock time).
+    """
+
+    COUNTERS = ('received', 'bytes', 'crc_errors', 'collisions', 'dropped', 'decode_errors', 'stored',
+                'misassigned')
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.counts = {key: 0 for key in self.COUNTERS}
+        self.nodes = set()
+        self.rssi_sum = 0.0
+        self.snr_sum = 0.0
+        self.last_packet = None
+        self.started = time.time()
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def packet(self, payload_bytes, rssi, snr):
+        with self.lock:
+            self.counts['received'] += 1
+            self.counts['bytes'] += payload_bytes
+            self.rssi_sum += rssi or 0
+            self.snr_sum += snr or 0
+            self.last_packet = time.time()
+
+    def node(self, device_id):
+        with self.lock:
+            self.nodes.add(device_id)
+
+    def node_ids(self):
+        with self.lock:
+            return set(self.nodes)
+
+    def snapshot(self):
+        with self.lock:
+            received = self.counts['received']
+            elapsed = max((time.time() - self.started) * self.speed, 1e-9)
+            return dict(
+                self.counts,
+                nodes=len(self.nodes),
+                packets_per_minute=round(received * 60.0 / elapsed, 1),
+                avg_rssi=round(self.rssi_sum / received, 1) if received else None,
+                avg_snr=round(self.snr_sum / received, 1) if received else None,
+                last_packet=datetime.fromtimestamp(self.last_packet).isoformat() if self.last_packet else None
+            )
+
+
+class SX127xRadio:
+    """One SX127x on its own SPI chip select, with an RX loop on its own thread
+
+    pySX127x wires DIO interrupts through a single BOARD, so each radio polls
+    its IRQ flags register instead and LoRa.__init__ (which registers BOARD's
+    callbacks) is skipped. BOARD.setup() must have been called.
+    """
+
+    def __init__(self, config, poll_interval=LORA_POLL_INTERVAL):
+        from SX127x.LoRa import LoRa, MODE, BW, CODING_RATE
+        from SX127x.board_config import BOARD
+
+        self.name = config['name']
+        self.config = config
+        self.poll_interval = poll_interval
+        self.stats = RadioStats()
+        self.mode = MODE
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        if config['reset_pin'] is not None:
+            import RPi.GPIO as GPIO
+            GPIO.setup(int(config['reset_pin']), GPIO.OUT)
+            GPIO.output(int(config['reset_pin']), 0)
+            time.sleep(0.01)
+            GPIO.output(int(config['reset_pin']), 1)
+            time.sleep(0.01)
+
+        self.lora = LoRa.__new__(LoRa)
+        self.lora.verbose = False
+        self.lora.spi = BOARD.SpiDev(spi_bus=config['spi_bus'], spi_cs=config['spi_cs'])
+        self.lora.set_mode(MODE.SLEEP)
+        self.lora.set_dio_mapping([0] * 6)
+        self.lora.set_freq(config['frequency'])
+        self.lora.set_spreading_factor(config['sf'])
+        self.lora.set_bw({62.5: BW.BW62_5, 125.0: BW.BW125, 250.0: BW.BW250, 500.0: BW.BW500}[config['bandwidth']])
+        self.lora.set_coding_rate({5: CODING_RATE.CR4_5, 6: CODING_RATE.CR4_6, 7: CODING_RATE.CR4_7,
+                                   8: CODING_RATE.CR4_8}[config['coding_rate']])
+        self.lora.set_sync_word(LORA_SYNC_WORD)
+        self.lora.set_rx_crc(True)
+
+    def start(self, on_packet):
+        self.thread = threading.Thread(target=self._run, args=(on_packet,), name=f'rx-{self.name}', daemon=True)
+        self.thread.start()
+
+    def _run(self, on_packet):
+        lora, MODE = self.lora, self.mode
+        lora.reset_ptr_rx()
+        lora.set_mode(MODE.RXCONT)
+        while not self.stop_event.is_set():
+            flags = lora.get_irq_flags()
+            if not flags.get('rx_done'):
+                self.stop_event.wait(self.poll_interval)
+                continue
+            received_at = datetime.now()
+            lora.clear_irq_flags(RxDone=1, PayloadCrcError=1, ValidHeader=1)
+            if flags.get('crc_error'):
+                self.stats.count('crc_errors')
+            else:
+                payload = bytes(lora.read_payload(nocheck=True))
+                rssi = lora.get_pkt_rssi_value()
+                snr = lora.get_pkt_snr_value()
+                self.stats.packet(len(payload), rssi, snr)
+                on_packet(self.name, payload, rssi, snr, received_at)
+            # Reset the FIFO pointer for the next packet
+            lora.set_mode(MODE.SLEEP)
+            lora.reset_ptr_rx()
+            lora.set_mode(MODE.RXCONT)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=1)
+        self.lora.set_mode(self.mode.SLEEP)
+        self.lora.spi.close()
+
+
+def simulated_nodes(count, configs, assignments=None, interval=5.0, prefix='sim-node-'):
+    """Node descriptions for SimulatedRadio, each on the channel channel_for() picks."""
+    return [
+        {'device_id': f'{prefix}{i:03d}', 'channel': channel_for(f'{prefix}{i:03d}', configs, assignments),
+         'interval': interval}
+        for i in range(count)
+    ]
+
+
+def simulated_payload(node, packet_id, rng):
+    """A sensor packet in the transmitter's JSON format."""
+    return json.dumps({
+        'id': packet_id,
+        'device': node['device_id'],
+        'pressure': round(rng.uniform(40, 60), 2),
+        'moisture': round(rng.uniform(20, 40), 2),
+        'acoustic': round(rng.uniform(45, 65), 2)
+    }).encode('utf-8')
+
+
+class SimulatedRadio:
+    """Hardware-free stand-in for SX127xRadio
+
+    The nodes assigned to this radio's channel transmit every interval seconds
+    (with random phase and jitter). Packets whose airtime overlaps on the
+    channel are lost as collisions, like an unslotted ALOHA LoRa channel.
+    Simulated time runs `speed` times faster than wall-clock time.
+    """
+
+    def __init__(self, config, nodes, speed=1.0, seed=None):
+        self.name = config['name']
+        self.config = config
+        self.nodes = [n for n in nodes if n['channel'] == self.name]
+        self.speed = float(speed)
+        self.rng = random.Random(seed if seed is not None else self.name)
+        self.stats = RadioStats(self.speed)
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self, on_packet):
+        self.thread = threading.Thread(target=self._run, args=(on_packet,), name=f'rx-{self.name}', daemon=True)
+        self.thread.start()
+
+    def _airtime(self, payload):
+        c = self.config
+        return time_on_air(len(payload), c['sf'], c['bandwidth'], c['coding_rate'])
+
+    def _run(self, on_packet):
+        rng = self.rng
+        started = time.monotonic()
+        packet_ids = {n['device_id']: 0 for n in self.nodes}
+        upcoming = [(rng.uniform(0, n['interval']), i) for i, n in enumerate(self.nodes)]
+        heapq.heapify(upcoming)
+        on_air = []  # [end, node, payload, collided]
+
+        def deliver_until(t):
+            for tx in [tx for tx in on_air if tx[0] <= t]:
+                on_air.remove(tx)
+                if tx[3]:
+                    self.stats.count('collisions')
+                    continue
+                rssi = rng.randint(-115, -70)
+                snr = round(rng.uniform(-5, 10), 2)
+                self.stats.packet(len(tx[2]), rssi, snr)
+                on_packet(self.name, tx[2], rssi, snr, datetime.now())
+
+        while upcoming and not self.stop_event.is_set():
+            start, i = heapq.heappop(upcoming)
+            node = self.nodes[i]
+            # Sleep until this transmission starts, in simulated time
+            delay = started + start / self.speed - time.monotonic()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+            deliver_until(start)
+
+            payload = simulated_payload(node, packet_ids[node['device_id']], rng)
+            packet_ids[node['device_id']] += 1
+            tx = [start + self._airtime(payload), node, payload, bool(on_air)]
+            for other in on_air:
+                other[3] = True
+            on_air.append(tx)
+            heapq.heappush(upcoming, (start + node['interval'] * rng.uniform(0.95, 1.05), i))
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=1)
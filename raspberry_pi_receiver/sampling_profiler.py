@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Runtime stack sampler for the LeakSense receiver
+Toggled with SIGUSR1 while the receiver is running; on stop the sampled stacks
+are written as folded lines for flamegraph.pl / speedscope
+
+StackSampler is a copy of flask_backend/profiling.py's and must be kept in
+sync with it. The receiver is deployed on its own to the Raspberry Pi with only
+raspberry_pi_receiver/ and its requirements, and profiling.py imports Flask at
+module level, so the class cannot be imported from there.
+"""
+
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+PROFILE_DIR = os.getenv('RECEIVER_PROFILE_DIR', '/tmp')
+SAMPLE_INTERVAL = float(os.getenv('RECEIVER_SAMPLE_INTERVAL', 0.01))  # seconds
+
+
+class StackSampler:
+    """Samples every thread's Python stack at a fixed interval
+
+    Same class as flask_backend/profiling.StackSampler, plus write_folded() and
+    top() for the signal toggle.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.samples = 0
+        self.interval = None
+        self.started = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()         # start/stop
+        self.counts_lock = threading.Lock()  # counts/samples, shared with the sampling thread
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval=SAMPLE_INTERVAL):
+        with self.lock:
+            if self.running:
+                return False
+            with self.counts_lock:
+                self.counts = Counter()
+                self.samples = 0
+            self.interval = interval
+            self.started = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        with self.lock:
+            if not self.running:
+                return False
+            self.stop_event.set()
+            self.thread.join()
+            return True
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(stack)))
+            with self.counts_lock:
+                self.counts.update(stacks)
+                self.samples += 1
+
+    def snapshot(self):
+        """(copy of counts, samples), consistent with each other."""
+        with self.counts_lock:
+            return Counter(self.counts), self.samples
+
+    def write_folded(self, directory=PROFILE_DIR):
+        path = os.path.join(directory, f"leaksense_receiver_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded")
+        with open(path, 'w') as f:
+            counts, _ = self.snapshot()
+            for stack, count in counts.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
+
+    def top(self, limit=10):
+        leaves = Counter()
+        counts, _ = self.snapshot()
+        for stack, count in counts.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(limit)
+
+
+def install_signal_toggle(sampler=None):
+    """Start/stop sampling on each SIGUSR1 (e.g. `kill -USR1 <pid>`)."""
+    sampler = sampler or StackSampler()
+
+    def toggle(signum, frame):
+        if sampler.start():
+            print(f"🔬 Stack sampler started ({sampler.interval * 1000:.0f} ms interval)")
+            return
+        sampler.stop()
+        path = sampler.write_folded()
+        counts, samples = sampler.snapshot()
+        print(f"🔬 Stack sampler stopped: {samples} samples written to {path}")
+        total = sum(counts.values()) or 1
+        for name, count in sampler.top():
+            print(f"   {100.0 * count / total:5.1f}%  {name}")
+
+    signal.signal(signal.SIGUSR1, toggle)
+    return sampler
@@ -23,7 +23,6 @@ document.addEventListener('DOMContentLoaded', () => {
     initializeGauges();
     initializeChart();
     startDataUpdates();
-    checkHealth();
 });
 
 // Check API health
@@ -57,12 +56,44 @@ function updateStatus(status, text) {
 
 // Start periodic data updates
 function startDataUpdates() {
-    fetchLatestData();
-    fetchStatistics();
-    fetchChartData();
+    // One composite request replaces health + latest + statistics; the chart
+    // is then fetched as a binary payload by the chart worker
+    fetchDashboard();
     
     updateTimer = setInterval(fetchLatestData, UPDATE_INTERVAL);
-    chartUpdateTimer = setInterval(fetchChartData, CHART_UPDATE_INTERVAL);
+    chartUpdateTimer = setInterval(fetchDashboard, CHART_UPDATE_INTERVAL);
+}
+
+// Fetch latest reading, statistics, chart series and alerts in one round-trip
+async function fetchDashboard() {
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/dashboard?hours=24&chart=0`);
+        
+        if (!response.ok) {
+            throw new Error('Failed to fetch dashboard');
+        }
+        
+        const data = await response.json();
+        
+        if (data.status === 'healthy') {
+            updateStatus('connected', 'Connected');
+        } else {
+            updateStatus('disconnected', 'Disconnected');
+        }
+        
+        if (data.latest) {
+            updateSensorValues(data.latest);
+            updateLastUpdate(data.latest.timestamp);
+            checkAlerts(data.latest);
+        }
+        updateStatistics(data.statistics);
+        // The chart worker syncs its cached window with a since= delta
+        requestMainChart(currentTimeRange);
+        
+    } catch (error) {
+        console.error('Error fetching dashboard:', error);
+        updateStatus('disconnected', 'Connection Error');
+    }
 }
 
 // Fetch latest sensor reading
@@ -121,31 +152,35 @@ async function fetchStatistics() {
     try {
         const response = await fetch(`${API_BASE_URL}/api/sensors/statistics?hours=24`);
         const stats = await response.json();
-        
-        if (stats.total_readings) {
-            // Update pressure stats
-            document.getElementById('pressureMin').textContent = stats.min_pressure?.toFixed(1) || '--';
-            document.getElementById('pressureAvg').textContent = stats.avg_pressure?.toFixed(1) || '--';
-            document.getElementById('pressureMax').textContent = stats.max_pressure?.toFixed(1) || '--';
-            
-            // Update moisture stats
-            document.getElementById('moistureMin').textContent = stats.min_moisture?.toFixed(1) || '--';
-            document.getElementById('moistureAvg').textContent = stats.avg_moisture?.toFixed(1) || '--';
-            document.getElementById('moistureMax').textContent = stats.max_moisture?.toFixed(1) || '--';
-            
-            // Update acoustic stats
-            document.getElementById('acousticMin').textContent = stats.min_acoustic?.toFixed(1) || '--';
-            document.getElementById('acousticAvg').textContent = stats.avg_acoustic?.toFixed(1) || '--';
-            document.getElementById('acousticMax').textContent = stats.max_acoustic?.toFixed(1) || '--';
-            
-            // Update total readings
-            document.getElementById('totalReadings').textContent = stats.total_readings.toLocaleString();
-        }
+        updateStatistics(stats);
     } catch (error) {
         console.error('Error fetching statistics:', error);
     }
 }
 
+// Update statistics panel
+function updateStatistics(stats) {
+    if (stats && stats.total_readings) {
+        // Update pressure stats
+        document.getElementById('pressureMin').textContent = stats.min_pressure?.toFixed(1) || '--';
+        document.getElementById('pressureAvg').textContent = stats.avg_pressure?.toFixed(1) || '--';
+        document.getElementById('pressureMax').textContent = stats.max_pressure?.toFixed(1) || '--';
+        
+        // Update moisture stats
+        document.getElementById('moistureMin').textContent = stats.min_moisture?.toFixed(1) || '--';
+        document.getElementById('moistureAvg').textContent = stats.avg_moisture?.toFixed(1) || '--';
+        document.getElementById('moistureMax').textContent = stats.max_moisture?.toFixed(1) || '--';
+        
+        // Update acoustic stats
+        document.getElementById('acousticMin').textContent = stats.min_acoustic?.toFixed(1) || '--';
+        document.getElementById('acousticAvg').textContent = stats.avg_acoustic?.toFixed(1) || '--';
+        document.getElementById('acousticMax').textContent = stats.max_acoustic?.toFixed(1) || '--';
+        
+        // Update total readings
+        document.getElementById('totalReadings').textContent = stats.total_readings.toLocaleString();
+    }
+}
+
 // Check for alerts
 function checkAlerts(data) {
     const alerts = [];
@@ -214,19 +249,7 @@ function updateLastUpdate(timestamp) {
 function updateTimeRange() {
     const select = document.getElementById('timeRange');
     currentTimeRange = parseInt(select.value);
-    fetchChartData();
-}
-
-// Fetch chart data
-async function fetchChartData() {
-    try {
-        const response = await fetch(`${API_BASE_URL}/api/sensors/chart-data?hours=${currentTimeRange}`);
-        const data = await response.json();
-        
-        updateMainChart(data);
-    } catch (error) {
-        console.error('Error fetching chart data:', error);
-    }
+    requestMainChart(currentTimeRange);
 }
 
 // Format number with animation
@@ -0,0 +1,318 @@
+// LeakSense Chart Worker
+// Keeps the chart readings in an IndexedDB-backed cache, syncs it with
+// /api/sensors/chart-data?format=binary&since=<cursor> deltas, and decimates
+// the requested window off the main thread. The page only receives the
+// points it will draw, and a reload does not refetch the history.
+
+const MAGIC = 'LSC1';
+const LITTLE_ENDIAN = new Uint8Array(new Uint16Array([1]).buffer)[0] === 1;
+const FIELDS = ['pressure', 'moisture', 'acoustic'];
+
+const CACHE_DB = 'leaksense-chart';
+const CACHE_VERSION = 2;              // 2: deltas overlap the cursor; older caches may have gaps
+const CHUNK_MS = 10 * 60 * 1000;        // one IndexedDB record per 10 minutes of readings
+const MAX_CACHE_MS = 24 * 3600 * 1000;  // longest chart window
+
+// In-memory copy of the cache, oldest first. coveredFrom: the cache holds
+// every reading from this time up to cursor.
+let cache = null;
+let cacheDb = null;
+let queue = Promise.resolve();
+
+self.onmessage = (event) => {
+    // One request at a time, so deltas are merged in order
+    queue = queue.then(() => handleRequest(event.data));
+};
+
+async function handleRequest({ id, baseUrl, hours, buckets }) {
+    try {
+        const windowStart = await syncCache(baseUrl, hours);
+        const start = lowerBound(cache.timestamps, windowStart);
+        const timestamps = cache.timestamps.subarray(start);
+
+        const series = {};
+        const transfer = [];
+        for (const name of FIELDS) {
+            series[name] = decimate(timestamps, cache.columns[name].subarray(start), buckets);
+            transfer.push(series[name].x.buffer, series[name].y.buffer);
+        }
+        self.postMessage({ id, points: timestamps.length, series }, transfer);
+    } catch (error) {
+        self.postMessage({ id, error: error.message });
+    }
+}
+
+// Bring the cache up to date and return the server's window start
+async function syncCache(baseUrl, hours) {
+    if (!cache || cache.baseUrl !== baseUrl) {
+        cache = await loadCache(baseUrl);
+    }
+    const url = `${baseUrl}/api/sensors/chart-data?hours=${hours}&format=binary`;
+
+    if (cache.cursor !== null) {
+        const delta = await fetchPayload(`${url}&since=${cache.cursor}`);
+        merge(delta);
+        if (delta.windowStart >= cache.coveredFrom) {
+            await persist(delta.deltaFrom);
+            return delta.windowStart;
+        }
+        // A longer window than the cache covers: fall through to a full load
+    }
+
+    const full = await fetchPayload(url);
+    cache = emptyCache(baseUrl);
+    merge(full);
+    cache.coveredFrom = full.windowStart;
+    await persist(-Infinity, true);
+    return full.windowStart;
+}
+
+async function fetchPayload(url) {
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`Chart request failed (${response.status})`);
+    }
+    const chart = decodePayload(await response.arrayBuffer());
+    chart.windowStart = Number(response.headers.get('X-Window-Start'));
+    chart.deltaFrom = Number(response.headers.get('X-Delta-From'));
+    chart.cursor = Number(response.headers.get('X-Cursor'));
+    return chart;
+}
+
+function emptyCache(baseUrl) {
+    const columns = {};
+    FIELDS.forEach(name => { columns[name] = new Float32Array(0); });
+    return { baseUrl, timestamps: new Float64Array(0), columns, cursor: null, coveredFrom: Infinity };
+}
+
+// Replace cached points from deltaFrom on with the delta, then drop points
+// older than the longest window. deltaFrom lies before the cursor, so
+// readings that committed late replace the overlap instead of leaving a gap.
+function merge(delta) {
+    const keep = lowerBound(cache.timestamps, delta.deltaFrom);
+    cache.timestamps = concat(Float64Array, cache.timestamps.subarray(0, keep), delta.timestamps);
+    for (const name of FIELDS) {
+        cache.columns[name] = concat(Float32Array, cache.columns[name].subarray(0, keep), delta.columns[name]);
+    }
+    cache.cursor = delta.cursor;
+
+    const boundary = cache.cursor - MAX_CACHE_MS;
+    const drop = lowerBound(cache.timestamps, boundary);
+    if (drop > 0) {
+        cache.timestamps = cache.timestamps.slice(drop);
+        for (const name of FIELDS) cache.columns[name] = cache.columns[name].slice(drop);
+    }
+    cache.coveredFrom = Math.max(cache.coveredFrom, boundary);
+}
+
+function concat(Type, head, tail) {
+    const out = new Type(head.length + tail.length);
+    out.set(head);
+    out.set(tail, head.length);
+    return out;
+}
+
+// First index with timestamps[i] >= value
+function lowerBound(timestamps, value) {
+    let lo = 0;
+    let hi = timestamps.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >>> 1;
+        if (timestamps[mid] < value) lo = mid + 1;
+        else hi = mid;
+    }
+    return lo;
+}
+
+// IndexedDB persistence. Without IndexedDB (e.g. private browsing) the cache
+// lives in memory only.
+
+function openCacheDb() {
+    return new Promise((resolve) => {
+        if (!self.indexedDB) return resolve(null);
+        const request = indexedDB.open(CACHE_DB, CACHE_VERSION);
+        request.onupgradeneeded = () => {
+            const db = request.result;
+            for (const name of ['chunks', 'meta']) {
+                if (db.objectStoreNames.contains(name)) db.deleteObjectStore(name);
+                db.createObjectStore(name);
+            }
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => resolve(null);
+    });
+}
+
+function done(transaction) {
+    return new Promise((resolve, reject) => {
+        transaction.oncomplete = () => resolve();
+        transaction.onerror = () => reject(transaction.error);
+        transaction.onabort = () => reject(transaction.error);
+    });
+}
+
+function requestResult(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function loadCache(baseUrl) {
+    const loaded = emptyCache(baseUrl);
+    if (cacheDb === null) cacheDb = await openCacheDb();
+    if (!cacheDb) return loaded;
+
+    try {
+        const transaction = cacheDb.transaction(['chunks', 'meta'], 'readonly');
+        const [meta, chunks] = await Promise.all([
+            requestResult(transaction.objectStore('meta').get('sync')),
+            requestResult(transaction.objectStore('chunks').getAll())
+        ]);
+        if (!meta || meta.baseUrl !== baseUrl) return loaded;
+
+        // Chunks are keyed by start time, so getAll() returns them in order
+        const total = chunks.reduce((sum, chunk) => sum + chunk.timestamps.length, 0);
+        loaded.timestamps = new Float64Array(total);
+        FIELDS.forEach(name => { loaded.columns[name] = new Float32Array(total); });
+        let offset = 0;
+        for (const chunk of chunks) {
+            loaded.timestamps.set(chunk.timestamps, offset);
+            FIELDS.forEach(name => loaded.columns[name].set(chunk[name], offset));
+            offset += chunk.timestamps.length;
+        }
+        loaded.cursor = meta.cursor;
+        loaded.coveredFrom = meta.coveredFrom;
+    } catch (error) {
+        console.warn('Chart cache unreadable, starting empty:', error);
+    }
+    return loaded;
+}
+
+// Rewrite the chunks holding points at or after `from` (all chunks when
+// replacing) and delete chunks that fell out of the cache
+async function persist(from, replace = false) {
+    if (!cacheDb) return;
+
+    const transaction = cacheDb.transaction(['chunks', 'meta'], 'readwrite');
+    const chunks = transaction.objectStore('chunks');
+    const timestamps = cache.timestamps;
+    if (replace || !timestamps.length) {
+        chunks.clear();
+    } else {
+        chunks.delete(IDBKeyRange.upperBound(chunkStart(timestamps[0]), true));
+        chunks.delete(IDBKeyRange.lowerBound(chunkStart(timestamps[timestamps.length - 1]), true));
+    }
+
+    if (timestamps.length) {
+        const first = chunkStart(Math.max(from, timestamps[0]));
+        const last = chunkStart(timestamps[timestamps.length - 1]);
+        for (let start = first; start <= last; start += CHUNK_MS) {
+            const lo = lowerBound(timestamps, start);
+            const hi = lowerBound(timestamps, start + CHUNK_MS);
+            if (lo === hi) {
+                chunks.delete(start);
+                continue;
+            }
+            // slice() copies: storing a subarray would store the whole buffer
+            const chunk = { timestamps: timestamps.slice(lo, hi) };
+            FIELDS.forEach(name => { chunk[name] = cache.columns[name].slice(lo, hi); });
+            chunks.put(chunk, start);
+        }
+    }
+    transaction.objectStore('meta').put({
+        baseUrl: cache.baseUrl,
+        cursor: cache.cursor,
+        coveredFrom: cache.coveredFrom
+    }, 'sync');
+    try {
+        await done(transaction);
+    } catch (error) {
+        // e.g. quota exceeded: keep working from memory
+        console.warn('Chart cache not saved:', error);
+    }
+}
+
+function chunkStart(ms) {
+    return Math.floor(ms / CHUNK_MS) * CHUNK_MS;
+}
+
+// Decode the columnar payload (layout documented in flask_backend/chart_payload.py)
+function decodePayload(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== MAGIC) {
+        throw new Error('Not a LeakSense chart payload');
+    }
+    const count = view.getUint32(4, true);
+    const columnCount = view.getUint16(8, true);
+    const headerLength = view.getUint32(12, true);
+    const names = new TextDecoder()
+        .decode(new Uint8Array(buffer, 16, headerLength - 16))
+        .replace(/\0+$/, '')
+        .split(',')
+        .slice(0, columnCount);
+
+    // Epoch-ms int64 values are read as two uint32 words (exact below 2^53,
+    // and no BigInt64Array, which Safari 14 lacks)
+    const timestamps = new Float64Array(count);
+    const columns = {};
+    if (LITTLE_ENDIAN) {
+        // Typed arrays use the platform byte order, so they can view the payload directly
+        const words = new Uint32Array(buffer, headerLength, 2 * count);
+        for (let i = 0; i < count; i++) timestamps[i] = words[2 * i + 1] * 4294967296 + words[2 * i];
+        names.forEach((name, c) => {
+            columns[name] = new Float32Array(buffer, headerLength + 8 * count + 4 * count * c, count);
+        });
+    } else {
+        for (let i = 0; i < count; i++) {
+            const offset = headerLength + 8 * i;
+            timestamps[i] = view.getUint32(offset + 4, true) * 4294967296 + view.getUint32(offset, true);
+        }
+        names.forEach((name, c) => {
+            const offset = headerLength + 8 * count + 4 * count * c;
+            const values = new Float32Array(count);
+            for (let i = 0; i < count; i++) values[i] = view.getFloat32(offset + 4 * i, true);
+            columns[name] = values;
+        });
+    }
+    return { count, names, timestamps, columns };
+}
+
+// Min/max decimation: for each of `buckets` equal time slices keep the lowest
+// and highest value in time order, so short spikes survive. Slices with no
+// readings are left out; missing values (NaN) are skipped.
+function decimate(timestamps, values, buckets) {
+    const count = timestamps.length;
+    if (count <= 2 * buckets) {
+        return { x: Float64Array.from(timestamps), y: Float64Array.from(values) };
+    }
+
+    const start = timestamps[0];
+    const span = (timestamps[count - 1] - start) || 1;
+    const x = new Float64Array(2 * buckets);
+    const y = new Float64Array(2 * buckets);
+    let out = 0;
+    let i = 0;
+    for (let b = 0; b < buckets && i < count; b++) {
+        const end = start + (span * (b + 1)) / buckets;
+        let minIndex = -1;
+        let maxIndex = -1;
+        for (; i < count && (timestamps[i] < end || b === buckets - 1); i++) {
+            const value = values[i];
+            if (Number.isNaN(value)) continue;
+            if (minIndex < 0 || value < values[minIndex]) minIndex = i;
+            if (maxIndex < 0 || value > values[maxIndex]) maxIndex = i;
+        }
+        if (minIndex < 0) continue;
+        const first = Math.min(minIndex, maxIndex);
+        const second = Math.max(minIndex, maxIndex);
+        x[out] = timestamps[first];
+        y[out++] = values[first];
+        if (second !== first) {
+            x[out] = timestamps[second];
+            y[out++] = values[second];
+        }
+    }
+    return { x: x.slice(0, out), y: y.slice(0, out) };
+}
@@ -9,6 +9,10 @@ Chart.defaults.font.family = 'Inter, sans-serif';
 let pressureGauge, moistureGauge, acousticGauge;
 let mainChart;
 
+// Main chart data is cached, synced, decoded and decimated in a Web Worker
+const chartWorker = new Worker('js/chart-worker.js');
+let chartRequestId = 0;
+
 // Initialize gauge charts
 function initializeGauges() {
     // Pressure Gauge
@@ -135,7 +139,6 @@ function initializeChart() {
     mainChart = new Chart(ctx, {
         type: 'line',
         data: {
-            labels: [],
             datasets: [
                 {
                     label: 'Pressure (PSI)',
@@ -178,8 +181,12 @@ function initializeChart() {
         options: {
             responsive: true,
             maintainAspectRatio: false,
+            // Points arrive as decimated {x: epoch ms, y} objects from the worker
+            parsing: false,
+            normalized: true,
             interaction: {
-                mode: 'index',
+                mode: 'nearest',
+                axis: 'x',
                 intersect: false
             },
             plugins: {
@@ -209,6 +216,9 @@ function initializeChart() {
                     borderWidth: 1,
                     displayColors: true,
                     callbacks: {
+                        title: function(items) {
+                            return items.length ? formatChartTime(items[0].parsed.x, true) : '';
+                        },
                         label: function(context) {
                             let label = context.dataset.label || '';
                             if (label) {
@@ -222,11 +232,13 @@ function initializeChart() {
             },
             scales: {
                 x: {
+                    type: 'linear',
                     grid: {
                         display: false
                     },
                     ticks: {
                         maxTicksLimit: 10,
+                        callback: value => formatChartTime(value, false),
                         font: {
                             size: 11
                         }
@@ -291,27 +303,54 @@ function initializeChart() {
     });
 }
 
-// Update main chart with new data
-function updateMainChart(data) {
+function formatChartTime(ms, withSeconds) {
+    const options = withSeconds
+        ? { hour: '2-digit', minute: '2-digit', second: '2-digit' }
+        : { hour: '2-digit', minute: '2-digit' };
+    return new Date(ms).toLocaleTimeString([], options);
+}
+
+// Ask the worker for the last `hours` of readings, decimated to about two
+// points per pixel column of the chart. The worker only downloads readings
+// newer than its cache.
+function requestMainChart(hours) {
     if (!mainChart) return;
     
-    // Limit data points for performance
-    const maxDataPoints = 100;
-    
-    if (data.labels.length > maxDataPoints) {
-        const step = Math.ceil(data.labels.length / maxDataPoints);
-        data.labels = data.labels.filter((_, i) => i % step === 0);
-        data.pressure = data.pressure.filter((_, i) => i % step === 0);
-        data.moisture = data.moisture.filter((_, i) => i % step === 0);
-        data.acoustic = data.acoustic.filter((_, i) => i % step === 0);
+    const buckets = Math.max(100, Math.round(mainChart.chartArea?.width || mainChart.width || 500));
+    chartWorker.postMessage({
+        id: ++chartRequestId,
+        baseUrl: API_BASE_URL,
+        hours: hours,
+        buckets: buckets
+    });
+}
+
+chartWorker.onmessage = (event) => {
+    const { id, error, series } = event.data;
+    // Ignore answers to requests that a newer one has replaced
+    if (id !== chartRequestId) return;
+    if (error) {
+        console.error('Error fetching chart data:', error);
+        return;
     }
+    updateMainChart(series);
+};
+
+// Update main chart with render-ready series from the worker
+function updateMainChart(series) {
+    if (!mainChart) return;
     
-    mainChart.data.labels = data.labels;
-    mainChart.data.datasets[0].data = data.pressure;
-    mainChart.data.datasets[1].data = data.moisture;
-    mainChart.data.datasets[2].data = data.acoustic;
+    ['pressure', 'moisture', 'acoustic'].forEach((name, index) => {
+        const { x, y } = series[name];
+        const points = new Array(x.length);
+        for (let i = 0; i < x.length; i++) {
+            points[i] = { x: x[i], y: y[i] };
+        }
+        mainChart.data.datasets[index].data = points;
+    });
     
-    mainChart.update('active');
+    // No animation: interpolating thousands of points blocks the page
+    mainChart.update('none');
 }
 
 // Add animation to chart updates
@@ -335,4 +374,5 @@ window.initializeGauges = initializeGauges;
 window.updateGauge = updateGauge;
 window.initializeChart = initializeChart;
 window.updateMainChart = updateMainChart;
+window.requestMainChart = requestMainChart;
 window.destroyCharts = destroyCharts;